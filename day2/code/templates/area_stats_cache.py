@@ -0,0 +1,157 @@
+"""
+Area Statistics Cache for Google Earth Engine
+Memoize reduceRegion results shared across change detection functions
+
+A result is keyed by the serialized Earth Engine expression that produced
+it. The serialization covers the image graph, the geometry, the scale and
+the reducer, so the same reduction requested by two functions costs only
+one round trip. Results are kept in an in-memory LRU and, optionally, in
+a SQLite file that survives notebook restarts.
+
+Usage:
+    cache = AreaStatsCache(path='area_stats.sqlite')
+    create_transition_table(change_matrix, class_names, aoi, cache=cache)
+    create_change_report(t1, t2, aoi, 2020, 2024, class_names, cache=cache)
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class AreaStatsCache:
+    """
+    LRU cache of getInfo() results keyed by serialized expressions
+    
+    Parameters:
+    -----------
+    max_entries : int
+        Maximum number of results kept in memory
+    path : str
+        Optional SQLite file for a persistent on-disk store
+    """
+    
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+        
+        # Guards the LRU, counters and SQLite handle for concurrent callers
+        self._lock = threading.RLock()
+        
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)'
+            )
+            self._db.commit()
+    
+    @staticmethod
+    def key(computed_object):
+        """Hash of the serialized expression (image, geometry, scale, reducer)"""
+        
+        return hashlib.sha256(computed_object.serialize().encode('utf-8')).hexdigest()
+    
+    def get_info(self, computed_object):
+        """
+        Return computed_object.getInfo(), fetching only on a cache miss
+        
+        Parameters:
+        -----------
+        computed_object : ee.ComputedObject
+            Any Earth Engine object (e.g., an ee.Number from reduceRegion)
+        
+        Returns:
+        --------
+        Result of getInfo()
+        """
+        
+        key = self.key(computed_object)
+        
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            self.misses += 1
+        
+        # Fetch outside the lock so concurrent misses do not serialize
+        value = computed_object.getInfo()
+        
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                                 (key, json.dumps(value)))
+                self._db.commit()
+        
+        return value
+    
+    def _lookup(self, key):
+        """Cached value from memory or disk (None on a miss)"""
+        
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        
+        if self._db is not None:
+            row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                value = json.loads(row[0])
+                self._remember(key, value)
+                return value
+        
+        return None
+    
+    def _remember(self, key, value):
+        """Add to the in-memory LRU, evicting the least recently used"""
+        
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def stats(self):
+        """
+        Hit/miss counters
+        
+        Returns:
+        --------
+        dict : hits, disk_hits, misses, hit_rate and in-memory entries
+        """
+        
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'entries': len(self._entries)
+        }
+    
+    def clear(self):
+        """Drop all cached results (memory and disk) and reset counters"""
+        
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+
+
+def get_info(computed_object, cache=None):
+    """getInfo() through the cache when one is given"""
+    
+    if cache is None:
+        return computed_object.getInfo()
+    return cache.get_info(computed_object)
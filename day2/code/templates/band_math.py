@@ -0,0 +1,320 @@
+"""
+Fused Band Math (NumPy)
+Compile index formulas into one chunked pass over the input bands
+
+Computing NDVI_dry, NDVI_wet, then NDVI_diff and NDVI_mean step by step
+allocates a full-size float array per step. Here formulas are written
+declaratively, parsed into one expression graph in which identical
+subexpressions are shared (NDVI_dry is computed once and reused by the
+diff and the mean), and evaluated block by block: only block-sized
+temporaries exist and each is freed after its last use.
+
+Formulas use input band names, earlier output names, numbers, + - * /,
+and the functions nd(a, b) (normalized difference, as
+ee.Image.normalizedDifference), sqrt, abs, min and max.
+
+Usage:
+    program = compile_formulas(seasonal_feature_formulas())
+    features = program.evaluate({'B8_dry': ..., 'B4_dry': ..., ...})
+    # or, from two composites:
+    features = seasonal_features('dry_2024.tif', 'wet_2024.tif', output_path='features_2024.tif')
+"""
+
+import ast
+from contextlib import ExitStack
+
+import numpy as np
+
+# Spectral bands of the seasonal composites (temporal_composite_template.py)
+COMPOSITE_BANDS = ['B2', 'B3', 'B4', 'B8', 'B11', 'B12']
+
+# Indices of add_seasonal_features, in its band order
+SEASONAL_INDICES = [
+    ('NDVI_dry', 'nd(B8_dry, B4_dry)'),
+    ('NDWI_dry', 'nd(B3_dry, B8_dry)'),
+    ('NDVI_wet', 'nd(B8_wet, B4_wet)'),
+    ('NDWI_wet', 'nd(B3_wet, B8_wet)'),
+    ('NDVI_diff', 'NDVI_wet - NDVI_dry'),
+    ('NDVI_mean', '(NDVI_dry + NDVI_wet) / 2')
+]
+
+_BINARY = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div'}
+_FUNCTIONS = {'nd': 2, 'sqrt': 1, 'abs': 1, 'min': 2, 'max': 2}
+_COMMUTATIVE = {'add', 'mul', 'min', 'max'}
+_OPERATIONS = {
+    'add': np.add,
+    'sub': np.subtract,
+    'mul': np.multiply,
+    'div': np.divide,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'min': np.minimum,
+    'max': np.maximum,
+    'neg': np.negative
+}
+
+
+def seasonal_feature_formulas(bands=COMPOSITE_BANDS):
+    """
+    Formulas for the add_seasonal_features output: dry season bands, then indices
+    
+    Returns:
+    --------
+    list : (band name, formula) pairs
+    """
+    
+    return [(band, f'{band}_dry') for band in bands] + SEASONAL_INDICES
+
+
+class Program:
+    """
+    Compiled band math: a shared expression graph and its output nodes
+    
+    Attributes:
+    -----------
+    nodes : list
+        Graph nodes in evaluation order: ('input', name), ('const', value)
+        or (operation, argument node ids...)
+    outputs : dict
+        {output name: node id}
+    inputs : list
+        Input band names the formulas read
+    """
+    
+    def __init__(self):
+        self.nodes = []
+        self.outputs = {}
+        self.inputs = []
+        self._ids = {}
+    
+    def _node(self, key):
+        """Id of a node, adding it unless an identical node exists (CSE)"""
+        
+        if key[0] in _COMMUTATIVE:
+            key = (key[0],) + tuple(sorted(key[1:]))
+        if key not in self._ids:
+            self._ids[key] = len(self.nodes)
+            self.nodes.append(key)
+            if key[0] == 'input':
+                self.inputs.append(key[1])
+        return self._ids[key]
+    
+    def _compile(self, node, formula):
+        if isinstance(node, ast.Expression):
+            return self._compile(node.body, formula)
+        if isinstance(node, ast.Name):
+            if node.id in self.outputs:
+                return self.outputs[node.id]
+            return self._node(('input', node.id))
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return self._node(('const', float(node.value)))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return self._node(('neg', self._compile(node.operand, formula)))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return self._node((_BINARY[type(node.op)], self._compile(node.left, formula),
+                               self._compile(node.right, formula)))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and _FUNCTIONS.get(node.func.id) == len(node.args):
+            args = [self._compile(arg, formula) for arg in node.args]
+            if node.func.id == 'nd':
+                # (a - b) / (a + b), so a + b and a - b can be shared too
+                return self._node(('div', self._node(('sub',) + tuple(args)),
+                                   self._node(('add',) + tuple(args))))
+            return self._node((node.func.id,) + tuple(args))
+        
+        raise ValueError(f'Unsupported syntax in formula: {formula}')
+    
+    def add(self, name, formula):
+        """Compile one formula; later formulas can use name"""
+        
+        self.outputs[name] = self._compile(ast.parse(formula, mode='eval'), formula)
+    
+    def evaluate_block(self, read):
+        """
+        Evaluate all outputs for one block
+        
+        Parameters:
+        -----------
+        read : callable
+            read(input name) -> float32 block, NaN where missing
+        
+        Returns:
+        --------
+        dict : {output name: float32 block}
+        """
+        
+        # Last node that needs each value, so temporaries are freed early
+        last_use = {}
+        for node_id, key in enumerate(self.nodes):
+            if key[0] not in ['input', 'const']:
+                for arg in key[1:]:
+                    last_use[arg] = node_id
+        keep = set(self.outputs.values())
+        
+        values = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for node_id, key in enumerate(self.nodes):
+                if key[0] == 'input':
+                    values[node_id] = read(key[1])
+                elif key[0] == 'const':
+                    values[node_id] = np.float32(key[1])
+                else:
+                    values[node_id] = _OPERATIONS[key[0]](*[values[arg] for arg in key[1:]])
+                    for arg in set(key[1:]):
+                        if last_use[arg] == node_id and arg not in keep:
+                            del values[arg]
+        
+        results = {}
+        for name, node_id in self.outputs.items():
+            block = np.asarray(values[node_id], dtype=np.float32)
+            results[name] = np.where(np.isfinite(block), block, np.nan).astype(np.float32)
+        return results
+    
+    def evaluate(self, inputs, block_size=512, nodata=None, output_path=None):
+        """
+        Evaluate all outputs in one chunked pass
+        
+        Parameters:
+        -----------
+        inputs : dict
+            {band name: (rows, cols) array} or {band name: (GeoTIFF path,
+            1-based band index)}; masked values (and nodata) become NaN
+        block_size : int
+            Window size in pixels (square blocks)
+        nodata : number
+            Optional input value treated as missing (e.g., 0 for composites)
+        output_path : str
+            Optional float32 GeoTIFF, one band per output (GeoTIFF inputs
+            only, for the grid)
+        
+        Returns:
+        --------
+        dict : {output name: numpy.ma.MaskedArray (rows, cols)}, masked
+        where undefined, or output_path when given
+        """
+        
+        from change_detection_tiled import iter_windows
+        from composite_local import _open_output
+        
+        missing = [name for name in self.inputs if name not in inputs]
+        if missing:
+            raise ValueError(f'Missing input bands: {missing}')
+        
+        with ExitStack() as stack:
+            readers, datasets, template, shape = {}, {}, None, None
+            for name in self.inputs:
+                source = inputs[name]
+                if isinstance(source, tuple) and isinstance(source[0], str):
+                    import rasterio
+                    
+                    path, band = source
+                    if path not in datasets:
+                        datasets[path] = stack.enter_context(rasterio.open(path))
+                    src = datasets[path]
+                    template = template or src
+                    readers[name] = (src, band)
+                    grid = (src.height, src.width)
+                else:
+                    readers[name] = np.ma.asarray(source)
+                    grid = readers[name].shape
+                if shape is not None and grid != shape:
+                    raise ValueError('Input bands must share the same dimensions')
+                shape = grid
+            
+            height, width = shape
+            names = list(self.outputs)
+            
+            dst = None
+            if output_path:
+                dst = stack.enter_context(_open_output(template, output_path, len(names),
+                                                       'float32', np.nan))
+                dst.descriptions = tuple(names)
+            else:
+                results = {name: np.empty(shape, dtype=np.float32) for name in names}
+            
+            for window in iter_windows(height, width, block_size):
+                def read(name):
+                    source = readers[name]
+                    if isinstance(source, tuple):
+                        src, band = source
+                        block = src.read(band, window=window, masked=True)
+                    else:
+                        block = source[window.toslices()]
+                    block = np.ma.asarray(block).astype(np.float32)
+                    if nodata is not None:
+                        block = np.ma.masked_equal(block, nodata)
+                    return block.filled(np.nan)
+                
+                values = self.evaluate_block(read)
+                
+                if dst is not None:
+                    dst.write(np.stack([values[name] for name in names]), window=window)
+                else:
+                    rows, cols = window.toslices()
+                    for name in names:
+                        results[name][rows, cols] = values[name]
+        
+        if output_path:
+            return output_path
+        return {name: np.ma.masked_invalid(values, copy=False)
+                for name, values in results.items()}
+
+
+def compile_formulas(formulas):
+    """
+    Compile (name, formula) pairs into one shared expression graph
+    
+    Parameters:
+    -----------
+    formulas : list
+        (output name, formula) pairs in order; a formula can use the names
+        of earlier outputs
+    
+    Returns:
+    --------
+    Program
+    """
+    
+    program = Program()
+    for name, formula in formulas:
+        program.add(name, formula)
+    
+    return program
+
+
+def seasonal_features(dry_composite, wet_composite, bands=COMPOSITE_BANDS, nodata=0,
+                      block_size=512, output_path=None):
+    """
+    Local counterpart of add_seasonal_features, computed in one pass
+    
+    Parameters:
+    -----------
+    dry_composite, wet_composite : str or numpy.ndarray
+        Seasonal composites as GeoTIFF paths or (bands, rows, cols) arrays,
+        with bands in the order of bands
+    bands : list
+        Band names of the composites
+    nodata : number
+        Value marking pixels without a composite value
+    block_size : int
+        Window size in pixels (square blocks)
+    output_path : str
+        Optional float32 GeoTIFF (GeoTIFF composites only)
+    
+    Returns:
+    --------
+    dict : {band: numpy.ma.MaskedArray} with B2 ... B12 (dry season),
+    NDVI_dry, NDWI_dry, NDVI_wet, NDWI_wet, NDVI_diff and NDVI_mean, or
+    output_path when given
+    """
+    
+    inputs = {}
+    for season, composite in [('dry', dry_composite), ('wet', wet_composite)]:
+        for index, band in enumerate(bands):
+            if isinstance(composite, str):
+                inputs[f'{band}_{season}'] = (composite, index + 1)
+            else:
+                inputs[f'{band}_{season}'] = composite[index]
+    
+    program = compile_formulas(seasonal_feature_formulas(bands))
+    return program.evaluate(inputs, block_size, nodata, output_path)
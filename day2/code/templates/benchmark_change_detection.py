@@ -0,0 +1,438 @@
+"""
+Change Detection Benchmark Suite
+Time the local backend and count Earth Engine round trips on synthetic data
+
+Synthetic classification pairs of configurable size and class count are
+generated from AOI scale up to province scale. Every change function in
+change_detection_local.py is timed, GeoTIFF inputs are run through the
+tiled engine, and the Earth Engine functions in change_detection_template.py
+are run against a simulated client (ee_stub.py) to count getInfo() round
+trips. Results are written as JSON so runs can be compared over time.
+
+Usage:
+    results = run_benchmarks(sizes=['aoi', 'municipality'], output_path='bench.json')
+    compare_benchmark_results('bench_before.json', 'bench.json')
+    
+    python benchmark_change_detection.py --sizes aoi municipality --output bench.json
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import ee_stub
+
+try:
+    import ee  # noqa: F401
+except ImportError:
+    # Only the simulated client is needed to benchmark
+    sys.modules['ee'] = ee_stub
+
+import change_detection_local as local
+import change_detection_template as ee_backend
+import ee_concurrency
+from area_stats_cache import AreaStatsCache
+
+# Raster sizes in 10 m pixels (rows, cols)
+BENCHMARK_SIZES = {
+    'aoi': (1000, 1000),                # 10 x 10 km study area
+    'municipality': (5000, 5000),       # 50 x 50 km
+    'province': (46000, 30000)          # Palawan bounding box
+}
+
+# Above this many pixels only the streamed (GeoTIFF) functions are run
+MAX_IN_MEMORY_PIXELS = 25_000_000
+
+
+def make_synthetic_pair(shape, n_classes=8, change_rate=0.1, patch_size=32, seed=0):
+    """
+    Synthetic classifications with patchy land cover and patchy change
+    
+    Parameters:
+    -----------
+    shape : tuple
+        (rows, cols) in pixels
+    n_classes : int
+        Number of classes (IDs 1..n_classes; at least 4 so forest = 1, 2
+        and agriculture = 4 exist)
+    change_rate : float
+        Fraction of patches whose class changes between the two dates
+    patch_size : int
+        Side of the homogeneous land cover patches in pixels
+    seed : int
+        Random seed
+    
+    Returns:
+    --------
+    tuple : (classification_t1, classification_t2) as numpy arrays
+    """
+    
+    if n_classes < 4:
+        raise ValueError('n_classes must be at least 4 (forest 1-2, agriculture 4)')
+    
+    rng = np.random.default_rng(seed)
+    dtype = np.uint8 if n_classes < 255 else np.uint16
+    coarse_shape = (math.ceil(shape[0] / patch_size), math.ceil(shape[1] / patch_size))
+    
+    coarse_t1 = rng.integers(1, n_classes + 1, coarse_shape).astype(dtype)
+    changed = rng.random(coarse_shape) < change_rate
+    coarse_t2 = np.where(changed, rng.integers(1, n_classes + 1, coarse_shape), coarse_t1)
+    
+    def expand(coarse):
+        full = np.repeat(np.repeat(coarse, patch_size, axis=0), patch_size, axis=1)
+        return full[:shape[0], :shape[1]].astype(dtype)
+    
+    return expand(coarse_t1), expand(coarse_t2)
+
+
+def write_synthetic_pair(directory, shape, n_classes=8, change_rate=0.1, patch_size=32, seed=0,
+                         block_size=2048):
+    """
+    Write a synthetic classification pair as tiled GeoTIFFs, block by block
+    
+    The patch grid is small (one value per patch), so even province-scale
+    rasters are written without holding a full-size array in memory.
+    
+    Returns:
+    --------
+    tuple : (path_t1, path_t2)
+    """
+    
+    import rasterio
+    from rasterio.transform import from_origin
+    
+    from change_detection_tiled import iter_windows
+    
+    coarse = make_synthetic_pair(
+        (math.ceil(shape[0] / patch_size), math.ceil(shape[1] / patch_size)),
+        n_classes, change_rate, 1, seed
+    )
+    
+    profile = {
+        'driver': 'GTiff', 'height': shape[0], 'width': shape[1], 'count': 1,
+        'dtype': str(coarse[0].dtype), 'crs': 'EPSG:32650',
+        'transform': from_origin(600000, 1400000, 10, 10),
+        'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'DEFLATE'
+    }
+    
+    paths = []
+    for name, grid in zip(['t1', 't2'], coarse):
+        path = os.path.join(directory, f'synthetic_{name}_{shape[0]}x{shape[1]}.tif')
+        with rasterio.open(path, 'w', **profile) as dst:
+            for window in iter_windows(shape[0], shape[1], block_size):
+                rows = np.arange(window.row_off, window.row_off + window.height) // patch_size
+                cols = np.arange(window.col_off, window.col_off + window.width) // patch_size
+                dst.write(grid[np.ix_(rows, cols)], 1, window=window)
+        paths.append(path)
+    
+    return tuple(paths)
+
+
+def _time(function, repeats):
+    """Best and mean wall time of several runs (seconds)"""
+    
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    
+    return min(times), sum(times) / len(times)
+
+
+def benchmark_local(t1, t2, class_names, repeats=3):
+    """
+    Time every change function of the local (NumPy) backend on arrays
+    
+    Returns:
+    --------
+    list of dict : One record per function with best/mean seconds and
+    pixels per second
+    """
+    
+    class_ids = sorted(class_names)
+    change_matrix = local.create_change_matrix(t1, t2, class_ids)
+    forest_loss = local.detect_forest_loss(t1, t2)
+    
+    functions = {
+        'create_change_matrix': lambda: local.create_change_matrix(t1, t2, class_ids),
+        'detect_forest_loss': lambda: local.detect_forest_loss(t1, t2),
+        'calculate_class_transitions': lambda: local.calculate_class_transitions(
+            change_matrix, 1, class_ids[1:], class_ids=class_ids),
+        'analyze_agricultural_expansion': lambda: local.analyze_agricultural_expansion(
+            change_matrix, class_ids=class_ids),
+        'create_transition_table': lambda: local.create_transition_table(
+            change_matrix, class_names, class_ids=class_ids),
+        'create_change_report': lambda: local.create_change_report(
+            t1, t2, None, 2020, 2024, class_names),
+        'detect_deforestation_hotspots': lambda: local.detect_deforestation_hotspots(forest_loss)
+    }
+    
+    records = []
+    for name, function in functions.items():
+        best, mean = _time(function, repeats)
+        records.append({
+            'function': name,
+            'backend': 'local',
+            'best_seconds': round(best, 4),
+            'mean_seconds': round(mean, 4),
+            'pixels_per_second': round(t1.size / best) if best > 0 else None
+        })
+    
+    return records
+
+
+def benchmark_tiled(paths, class_names, repeats=1, block_size=1024, workers=None):
+    """
+    Time the streamed (GeoTIFF) change report through the tiled engine
+    
+    Returns:
+    --------
+    list of dict : One record with best/mean seconds and pixels per second
+    """
+    
+    import rasterio
+    
+    with rasterio.open(paths[0]) as src:
+        n_pixels = src.width * src.height
+    
+    best, mean = _time(lambda: local.create_change_report(
+        paths[0], paths[1], None, 2020, 2024, class_names,
+        block_size=block_size, workers=workers), repeats)
+    
+    return [{
+        'function': 'create_change_report',
+        'backend': 'tiled',
+        'best_seconds': round(best, 4),
+        'mean_seconds': round(mean, 4),
+        'pixels_per_second': round(n_pixels / best) if best > 0 else None
+    }]
+
+
+def count_round_trips(t1, t2, class_names, latency=0.0, max_workers=8):
+    """
+    Count getInfo() round trips of the Earth Engine functions
+    
+    The functions in change_detection_template.py run against ee_stub, a
+    NumPy stand-in that counts each getInfo() and sleeps for the given
+    latency, so the effect of batching, concurrency and caching on a real
+    connection can be estimated without an Earth Engine account.
+    
+    Parameters:
+    -----------
+    t1, t2 : numpy.ndarray
+        Classifications (round trip counts do not depend on their size)
+    class_names : dict
+        Mapping of class IDs to names
+    latency : float
+        Simulated seconds per round trip
+    max_workers : int
+        Concurrency for the max_workers variants
+    
+    Returns:
+    --------
+    list of dict : One record per scenario with round_trips and seconds
+    """
+    
+    class_ids = sorted(class_names)
+    shared_cache = AreaStatsCache()
+    
+    with mock.patch.object(ee_backend, 'ee', ee_stub), \
+            mock.patch.object(ee_concurrency, 'ee', ee_stub):
+        ee_stub.reset(latency)
+        image_t1 = ee_stub.image_from_array(t1)
+        image_t2 = ee_stub.image_from_array(t2)
+        aoi = ee_stub.Geometry(t1.shape)
+        change_matrix = ee_backend.create_change_matrix(image_t1, image_t2, class_ids)
+        
+        scenarios = {
+            'create_change_report (per-area requests)': lambda: ee_backend.create_change_report(
+                image_t1, image_t2, aoi, 2020, 2024, class_names, batched=False),
+            f'create_change_report (per-area, {max_workers} workers)':
+                lambda: ee_backend.create_change_report(
+                    image_t1, image_t2, aoi, 2020, 2024, class_names, batched=False,
+                    max_workers=max_workers),
+            'create_change_report (batched)': lambda: ee_backend.create_change_report(
+                image_t1, image_t2, aoi, 2020, 2024, class_names),
+            'create_transition_table': lambda: ee_backend.create_transition_table(
+                change_matrix, class_names, aoi, class_ids=class_ids),
+            'calculate_class_transitions': lambda: ee_backend.calculate_class_transitions(
+                change_matrix, 1, class_ids[1:], aoi, class_ids=class_ids),
+            'analyze_agricultural_expansion': lambda: ee_backend.analyze_agricultural_expansion(
+                change_matrix, aoi=aoi, class_ids=class_ids),
+            # Same requests twice through one cache: the repeat costs nothing
+            'report + transitions, shared cache (x2)': lambda: [
+                (ee_backend.create_change_report(image_t1, image_t2, aoi, 2020, 2024,
+                                                 class_names, cache=shared_cache),
+                 ee_backend.calculate_class_transitions(change_matrix, 1, class_ids[1:], aoi,
+                                                        class_ids=class_ids,
+                                                        cache=shared_cache))
+                for _ in range(2)
+            ]
+        }
+        
+        records = []
+        for name, function in scenarios.items():
+            ee_stub.reset(latency)
+            start = time.perf_counter()
+            function()
+            records.append({
+                'scenario': name,
+                'round_trips': ee_stub.ROUND_TRIPS['count'],
+                'simulated_latency': latency,
+                'seconds': round(time.perf_counter() - start, 4)
+            })
+    
+    return records
+
+
+def _environment():
+    """Machine and code version details stored with every result file"""
+    
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def run_benchmarks(sizes=['aoi', 'municipality'], n_classes=8, change_rate=0.1, repeats=3,
+                   tiled=True, latency=0.0, workers=None, output_path='benchmark_results.json',
+                   seed=0):
+    """
+    Run the benchmark suite and write the results as JSON
+    
+    Parameters:
+    -----------
+    sizes : list
+        Names from BENCHMARK_SIZES or (rows, cols) tuples
+    n_classes : int
+        Number of land cover classes in the synthetic rasters
+    change_rate : float
+        Fraction of land cover patches that change
+    repeats : int
+        Runs per in-memory function (best and mean are reported)
+    tiled : bool
+        Also write GeoTIFFs and time the streamed report (tiled engine)
+    latency : float
+        Simulated seconds per Earth Engine round trip
+    workers : int
+        Worker processes for the tiled engine (default: os.cpu_count())
+    output_path : str
+        JSON file for the results (None = do not write)
+    seed : int
+        Random seed for the synthetic rasters
+    
+    Returns:
+    --------
+    dict : {'environment', 'parameters', 'results', 'round_trips'}
+    """
+    
+    class_names = {class_id: f'Class {class_id}' for class_id in range(1, n_classes + 1)}
+    results = []
+    
+    for size in sizes:
+        shape = tuple(BENCHMARK_SIZES.get(size, size)) if isinstance(size, str) else tuple(size)
+        label = size if isinstance(size, str) else f'{shape[0]}x{shape[1]}'
+        n_pixels = shape[0] * shape[1]
+        
+        records = []
+        if n_pixels <= MAX_IN_MEMORY_PIXELS:
+            t1, t2 = make_synthetic_pair(shape, n_classes, change_rate, seed=seed)
+            records += benchmark_local(t1, t2, class_names, repeats)
+            del t1, t2
+        
+        if tiled:
+            with tempfile.TemporaryDirectory() as directory:
+                paths = write_synthetic_pair(directory, shape, n_classes, change_rate, seed=seed)
+                records += benchmark_tiled(paths, class_names, workers=workers)
+        
+        for record in records:
+            results.append({'size': label, 'rows': shape[0], 'cols': shape[1],
+                            'pixels': n_pixels, **record})
+            print(f"{label:>14} {record['backend']:>6} {record['function']:<32} "
+                  f"{record['best_seconds']:>9.3f} s")
+    
+    # Round trips do not depend on raster size, so a small pair is enough
+    t1, t2 = make_synthetic_pair((256, 256), n_classes, change_rate, seed=seed)
+    round_trips = count_round_trips(t1, t2, class_names, latency)
+    for record in round_trips:
+        print(f"{record['scenario']:<48} {record['round_trips']:>3} round trips")
+    
+    output = {
+        'environment': _environment(),
+        'parameters': {'sizes': [str(size) for size in sizes], 'n_classes': n_classes,
+                       'change_rate': change_rate, 'repeats': repeats, 'tiled': tiled,
+                       'latency': latency, 'seed': seed},
+        'results': results,
+        'round_trips': round_trips
+    }
+    
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f'Results written to {output_path}')
+    
+    return output
+
+
+def compare_benchmark_results(baseline_path, current_path):
+    """
+    Compare two benchmark JSON files
+    
+    Returns:
+    --------
+    pandas.DataFrame : Best seconds per (size, backend, function) in both
+    runs, with speedup = baseline / current (> 1 means faster now)
+    """
+    
+    frames = []
+    for path in [baseline_path, current_path]:
+        with open(path) as f:
+            frames.append(pd.DataFrame(json.load(f)['results']))
+    
+    keys = ['size', 'backend', 'function']
+    comparison = frames[0][keys + ['best_seconds']].merge(
+        frames[1][keys + ['best_seconds']], on=keys, suffixes=('_baseline', '_current')
+    )
+    comparison['speedup'] = (comparison['best_seconds_baseline']
+                             / comparison['best_seconds_current']).round(2)
+    
+    return comparison
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Benchmark the change detection templates')
+    parser.add_argument('--sizes', nargs='+', default=['aoi', 'municipality'],
+                        help=f'Sizes from {list(BENCHMARK_SIZES)}')
+    parser.add_argument('--classes', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated seconds per Earth Engine round trip')
+    parser.add_argument('--no-tiled', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+    
+    run_benchmarks(args.sizes, args.classes, repeats=args.repeats, tiled=not args.no_tiled,
+                   latency=args.latency, output_path=args.output)
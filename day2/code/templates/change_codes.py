@@ -0,0 +1,132 @@
+"""
+Shared Change Detection Helpers
+Class scheme, change-code table and report assembly without Earth Engine
+
+Used by change_detection_template.py (Earth Engine) and the local backends
+(change_detection_local.py, trajectory_local.py), which must import
+without the earthengine-api package.
+"""
+
+# Palawan 8-class land cover scheme (day2/data/class_definitions.md)
+PALAWAN_CLASS_IDS = [1, 2, 3, 4, 5, 6, 7, 8]
+
+
+def create_change_code_table(class_ids=PALAWAN_CLASS_IDS):
+    """
+    Build the lookup table between dense change codes and class pairs
+    
+    Each (from, to) pair gets code from_index * n + to_index, where the
+    index is the position in class_ids. Codes stay below n * n, so any
+    number of classes encodes without collisions, and up to 15 classes
+    fit in uint8. The largest value of the dtype is kept free as nodata
+    for exported change maps.
+    
+    Parameters:
+    -----------
+    class_ids : list
+        Class IDs in the classification scheme
+    
+    Returns:
+    --------
+    dict : {'class_ids': list, 'codes': {(from, to): code},
+            'pairs': [(from, to) for each code], 'dtype': 'uint8' or 'uint16',
+            'nodata': 255 or 65535}
+    
+    Example: With PALAWAN_CLASS_IDS, Forest (1) to Agriculture (4) = 3
+    """
+    
+    n_classes = len(class_ids)
+    if n_classes * n_classes < 256:
+        dtype, nodata = 'uint8', 255
+    elif n_classes * n_classes < 65536:
+        dtype, nodata = 'uint16', 65535
+    else:
+        raise ValueError('Too many classes for a uint16 change code')
+    
+    pairs = [(from_id, to_id) for from_id in class_ids for to_id in class_ids]
+    codes = {pair: code for code, pair in enumerate(pairs)}
+    
+    return {'class_ids': list(class_ids), 'codes': codes, 'pairs': pairs,
+            'dtype': dtype, 'nodata': nodata}
+
+
+def _ag_expansion_codes(forest_classes, ag_class, class_ids):
+    """Change codes for each forest class -> agriculture transition"""
+    
+    codes = create_change_code_table(class_ids)['codes']
+    return [codes[(forest_class, ag_class)] for forest_class in forest_classes]
+
+
+def _summarize_ag_expansion(forest_classes, areas_ha):
+    """Agricultural expansion results from per-forest-class areas (ha)"""
+    
+    results = {}
+    
+    for forest_class, area_ha in zip(forest_classes, areas_ha):
+        class_name = 'Primary Forest' if forest_class == 1 else 'Secondary Forest'
+        results[f'{class_name}_to_Agriculture_ha'] = area_ha
+    
+    results['Total_Forest_to_Ag_ha'] = sum(results.values())
+    
+    return results
+
+
+def _report_class_ids(class_names, forest_classes=[1, 2], ag_class=4):
+    """Class IDs for the report's change matrix (always incl. forest and agriculture)"""
+    
+    return sorted(set(class_names) | set(forest_classes) | {ag_class})
+
+
+def _build_change_report(year1, year2, class_names, areas_t1, areas_t2,
+                         forest_loss_ha, ag_expansion, total_area):
+    """
+    Assemble the change report from client-side areas (hectares)
+    """
+    
+    report = {
+        'period': f'{year1}-{year2}',
+        'area_changes': {},
+        'key_transitions': {},
+        'summary': {}
+    }
+    
+    # Area changes for each class
+    for class_id, class_name in class_names.items():
+        area_t1 = areas_t1[class_id]
+        area_t2 = areas_t2[class_id]
+        change = area_t2 - area_t1
+        percent_change = (change / area_t1 * 100) if area_t1 > 0 else 0
+        
+        report['area_changes'][class_name] = {
+            f'{year1}_ha': round(area_t1, 2),
+            f'{year2}_ha': round(area_t2, 2),
+            'change_ha': round(change, 2),
+            'percent_change': round(percent_change, 2)
+        }
+    
+    report['key_transitions']['forest_loss_ha'] = forest_loss_ha
+    report['key_transitions']['agricultural_expansion'] = ag_expansion
+    
+    # Summary statistics
+    report['summary'] = {
+        'total_study_area_ha': round(total_area, 2),
+        'forest_loss_percent': round(forest_loss_ha / total_area * 100, 2),
+        'period_years': year2 - year1
+    }
+    
+    return report
+
+
+def _transition_class_ids(class_names, class_ids=PALAWAN_CLASS_IDS):
+    """
+    Class IDs of a change matrix for a table labeled with class_names
+    
+    Defaults to PALAWAN_CLASS_IDS, like create_change_matrix; class_ids
+    must include every labeled class.
+    """
+    
+    missing = [class_id for class_id in class_names if class_id not in class_ids]
+    if missing:
+        raise ValueError(f'class_names has classes {missing} that are not in class_ids '
+                         f'{list(class_ids)}; pass the class_ids used by create_change_matrix')
+    return list(class_ids)
@@ -0,0 +1,507 @@
+"""
+Local Change Detection Template (NumPy / rasterio)
+Offline counterpart of change_detection_template.py for exported classifications
+
+Every function mirrors the Earth Engine version of the same name but accepts
+NumPy arrays (or masked arrays) and classified GeoTIFF paths, and returns the
+same outputs. Class areas come from one np.bincount over combined from/to
+codes instead of one mask per class, so reports finish in seconds and run
+without a network connection.
+
+Usage: Pass exported classifications instead of ee.Image objects
+"""
+
+import numpy as np
+import pandas as pd
+
+from change_codes import (
+    PALAWAN_CLASS_IDS,
+    _ag_expansion_codes,
+    _build_change_report,
+    _summarize_ag_expansion,
+    _transition_class_ids,
+    create_change_code_table,
+)
+
+# Mean Earth radius used by Earth Engine for pixel areas (meters)
+EARTH_RADIUS = 6371008.8
+
+
+def load_classification(source, nodata=None):
+    """
+    Load a classification as a masked integer array
+    
+    Parameters:
+    -----------
+    source : str, numpy.ndarray or numpy.ma.MaskedArray
+        Path to a classified GeoTIFF, or an in-memory classification
+    nodata : int
+        Value to treat as masked (default: the GeoTIFF nodata value, if any)
+    
+    Returns:
+    --------
+    numpy.ma.MaskedArray : Classification with invalid pixels masked
+    """
+    
+    if isinstance(source, str):
+        import rasterio
+        
+        with rasterio.open(source) as src:
+            data = src.read(1, masked=nodata is None)
+        if nodata is not None:
+            data = np.ma.masked_equal(data, nodata)
+        return np.ma.asarray(data)
+    
+    data = np.ma.asarray(source)
+    if nodata is not None:
+        data = np.ma.masked_where(data == nodata, data)
+    return data
+
+
+def pixel_area_from_raster(path):
+    """
+    Pixel area in square meters for a GeoTIFF, like ee.Image.pixelArea()
+    
+    Returns:
+    --------
+    float or numpy.ndarray : Constant area for projected rasters, or a
+    (rows, 1) column of per-row areas for geographic (lat/lon) rasters
+    """
+    
+    import rasterio
+    
+    with rasterio.open(path) as src:
+        return pixel_area_for_rows(src.transform, src.crs, 0, src.height)
+
+
+def pixel_area_for_rows(transform, crs, row_off, height):
+    """
+    Pixel area in square meters for a block of raster rows
+    
+    Returns:
+    --------
+    float or numpy.ndarray : Constant area for projected rasters, or a
+    (height, 1) column of per-row areas for geographic (lat/lon) rasters
+    """
+    
+    if crs is None or not crs.is_geographic:
+        return abs(transform.a * transform.e)
+    
+    # Spherical area of each row of cells between its bounding latitudes
+    rows = row_off + np.arange(height + 1)
+    lat_edges = np.radians(transform.f + transform.e * rows)
+    band = np.abs(np.diff(np.sin(lat_edges)))
+    return (EARTH_RADIUS ** 2 * np.radians(abs(transform.a)) * band)[:, np.newaxis]
+
+
+def _resolve_pixel_area(source, pixel_area, scale):
+    """Pixel area from an explicit value, the GeoTIFF itself, or scale**2"""
+    
+    if pixel_area is not None:
+        return pixel_area
+    if isinstance(source, str):
+        return pixel_area_from_raster(source)
+    return float(scale) ** 2
+
+
+def _weights(pixel_area, shape, selection):
+    """Per-pixel area weights for the selected pixels (None if constant)"""
+    
+    if np.ndim(pixel_area) == 0:
+        return None
+    return np.broadcast_to(pixel_area, shape)[selection]
+
+
+def _area_by_value(values, selection, n_values, pixel_area):
+    """Area (m2) of every integer value among the selected pixels"""
+    
+    weights = _weights(pixel_area, values.shape, selection)
+    areas = np.bincount(values[selection].ravel(), weights=weights, minlength=n_values)
+    if weights is None:
+        areas = areas * pixel_area
+    return areas
+
+
+def _aoi_selection(shape, aoi):
+    """Boolean selection for the AOI (whole raster when aoi is None)"""
+    
+    if aoi is None:
+        return np.ones(shape, dtype=bool)
+    return np.asarray(aoi, dtype=bool)
+
+
+def calculate_change_code_areas(change_matrix, aoi=None, scale=10, pixel_area=None,
+                                block_size=1024, workers=None, n_values=None):
+    """
+    Area in hectares of every change code in one bincount
+    
+    A change code GeoTIFF path is streamed through the tiled engine
+    (change_detection_tiled.py) instead of being loaded whole; n_values
+    (largest code + 1) is found from the raster when not given.
+    
+    Returns:
+    --------
+    numpy.ndarray : Areas indexed by change code
+    """
+    
+    if isinstance(change_matrix, str):
+        from change_detection_tiled import calculate_tiled_histogram, print_throughput
+        
+        areas, stats = calculate_tiled_histogram(
+            [change_matrix], n_values, aoi=aoi, block_size=block_size, workers=workers
+        )
+        print_throughput(stats)
+        
+        # Drop the masked (nodata) bin
+        return areas[:-1] / 10000
+    
+    change_matrix = np.ma.asarray(change_matrix)
+    pixel_area = _resolve_pixel_area(None, pixel_area, scale)
+    
+    selection = _aoi_selection(change_matrix.shape, aoi) & ~np.ma.getmaskarray(change_matrix)
+    codes = change_matrix.filled(0)
+    
+    return _area_by_value(codes, selection, int(codes.max(initial=0)) + 1, pixel_area) / 10000
+
+
+def _code_area(areas, change_code):
+    """Area for one change code (0 when the code never occurs)"""
+    
+    return float(areas[change_code]) if change_code < len(areas) else 0.0
+
+
+def detect_forest_loss(classification_t1, classification_t2, forest_classes=[1, 2]):
+    """
+    Detect forest loss between two time periods
+    
+    Parameters:
+    -----------
+    classification_t1 : str or numpy.ndarray
+        Earlier classification (e.g., 2020)
+    classification_t2 : str or numpy.ndarray
+        Later classification (e.g., 2024)
+    forest_classes : list
+        Class IDs representing forest (default: [1, 2] for primary/secondary)
+    
+    Returns:
+    --------
+    numpy.ma.MaskedArray : Forest loss map (1 = loss, 0 = no change),
+    masked where either classification is masked
+    """
+    
+    t1 = load_classification(classification_t1)
+    t2 = load_classification(classification_t2)
+    
+    forest_t1 = np.isin(t1.filled(0), forest_classes)
+    forest_t2 = np.isin(t2.filled(0), forest_classes)
+    
+    forest_loss = (forest_t1 & ~forest_t2).astype(np.uint8)
+    
+    return np.ma.array(forest_loss, mask=np.ma.getmaskarray(t1) | np.ma.getmaskarray(t2))
+
+
+def create_change_matrix(classification_t1, classification_t2, class_ids=PALAWAN_CLASS_IDS):
+    """
+    Create from-to change matrix
+    
+    Parameters:
+    -----------
+    classification_t1, classification_t2 : str or numpy.ndarray
+        Earlier and later classifications
+    class_ids : list
+        Class IDs in the classification scheme (pixels with other values
+        are masked)
+    
+    Returns:
+    --------
+    numpy.ma.MaskedArray : Dense change code (uint8 for up to 15 classes),
+    filled with the table's nodata value where masked; see
+    create_change_code_table for the code -> (from, to) lookup
+    
+    Example: With PALAWAN_CLASS_IDS, Forest (1) to Agriculture (4) = 3
+    """
+    
+    table = create_change_code_table(class_ids)
+    n_classes = len(class_ids)
+    t1 = load_classification(classification_t1)
+    t2 = load_classification(classification_t2)
+    
+    # Lookup table from class ID to dense index (-1 = not in the scheme)
+    lut_size = int(max(max(class_ids), t1.filled(0).max(), t2.filled(0).max())) + 1
+    class_index = np.full(lut_size, -1, dtype=np.int32)
+    class_index[class_ids] = np.arange(n_classes)
+    
+    from_index = class_index[t1.filled(0)]
+    to_index = class_index[t2.filled(0)]
+    mask = (np.ma.getmaskarray(t1) | np.ma.getmaskarray(t2)
+            | (from_index < 0) | (to_index < 0))
+    
+    change_code = np.where(mask, table['nodata'], from_index * n_classes + to_index)
+    
+    return np.ma.array(change_code.astype(table['dtype']), mask=mask,
+                       fill_value=table['nodata'])
+
+
+def calculate_class_transitions(change_matrix, from_class, to_classes, aoi=None, scale=10,
+                                pixel_area=None, class_ids=PALAWAN_CLASS_IDS):
+    """
+    Calculate area of transitions from one class to others
+    
+    Parameters:
+    -----------
+    change_matrix : numpy.ndarray
+        Change code array (from create_change_matrix)
+    from_class : int
+        Source class ID
+    to_classes : list
+        Destination class IDs
+    aoi : numpy.ndarray
+        Boolean AOI mask (default: whole raster)
+    scale : int
+        Pixel size in meters (used when pixel_area is not given)
+    pixel_area : float or numpy.ndarray
+        Pixel area in square meters (see pixel_area_from_raster)
+    class_ids : list
+        Class IDs used to build the change matrix
+    
+    Returns:
+    --------
+    dict : Area in hectares for each transition
+    """
+    
+    codes = create_change_code_table(class_ids)['codes']
+    areas = calculate_change_code_areas(change_matrix, aoi, scale, pixel_area)
+    transitions = {}
+    
+    for to_class in to_classes:
+        change_code = codes[(from_class, to_class)]
+        transitions[f'{from_class}_to_{to_class}'] = _code_area(areas, change_code)
+    
+    return transitions
+
+
+def detect_deforestation_hotspots(forest_loss, aoi=None, kernel_radius=500, scale=10,
+                                  method='auto', tile_size=2048):
+    """
+    Identify deforestation hotspots using focal statistics
+    
+    Parameters:
+    -----------
+    forest_loss : str or numpy.ndarray
+        Binary forest loss raster
+    aoi : numpy.ndarray
+        Boolean AOI mask (default: whole raster)
+    kernel_radius : int
+        Radius in meters for hotspot detection
+    scale : int
+        Pixel size in meters
+    method : str
+        Focal algorithm ('auto', 'sat', 'spans', 'fft'; see focal_local.py)
+    tile_size : int
+        Tile size in pixels (tiles are read with a kernel-radius halo)
+    
+    Returns:
+    --------
+    numpy.ma.MaskedArray : Hotspot intensity (0-1)
+    """
+    
+    from focal_local import focal_mean
+    
+    forest_loss = load_classification(forest_loss)
+    radius = int(kernel_radius // scale)
+    
+    hotspots = focal_mean(forest_loss, radius, 'circle', method, tile_size)
+    
+    if aoi is not None:
+        hotspots = np.ma.masked_where(~np.asarray(aoi, dtype=bool), hotspots)
+    
+    return hotspots
+
+
+def analyze_agricultural_expansion(change_matrix, forest_classes=[1, 2], ag_class=4, aoi=None,
+                                   scale=10, pixel_area=None, class_ids=PALAWAN_CLASS_IDS):
+    """
+    Analyze forest to agriculture conversion
+    
+    Returns:
+    --------
+    dict : Statistics on agricultural expansion
+    """
+    
+    areas = calculate_change_code_areas(change_matrix, aoi, scale, pixel_area)
+    ag_codes = _ag_expansion_codes(forest_classes, ag_class, class_ids)
+    
+    return _summarize_ag_expansion(forest_classes, [_code_area(areas, code) for code in ag_codes])
+
+
+def calculate_joint_areas(classification_t1, classification_t2, n_values, aoi=None, scale=10,
+                          pixel_area=None):
+    """
+    Area of every (from, to) class pair in one bincount
+    
+    Masked pixels are counted under an extra class index n_values, so the
+    last row and column hold areas that are valid in only one period.
+    
+    Parameters:
+    -----------
+    classification_t1, classification_t2 : str or numpy.ndarray
+        Earlier and later classifications
+    n_values : int
+        Number of class values (largest class ID + 1)
+    aoi : numpy.ndarray
+        Boolean AOI mask (default: whole raster)
+    scale : int
+        Pixel size in meters (used when pixel_area is not given)
+    pixel_area : float or numpy.ndarray
+        Pixel area in square meters
+    
+    Returns:
+    --------
+    numpy.ndarray : (n_values + 1, n_values + 1) areas in square meters
+    """
+    
+    pixel_area = _resolve_pixel_area(classification_t1, pixel_area, scale)
+    t1 = load_classification(classification_t1)
+    t2 = load_classification(classification_t2)
+    
+    size = n_values + 1
+    from_idx = np.where(np.ma.getmaskarray(t1), n_values, t1.filled(0)).astype(np.int64)
+    to_idx = np.where(np.ma.getmaskarray(t2), n_values, t2.filled(0)).astype(np.int64)
+    
+    selection = _aoi_selection(t1.shape, aoi)
+    combined = from_idx * size + to_idx
+    areas = _area_by_value(combined, selection, size * size, pixel_area)
+    
+    return areas.reshape(size, size)
+
+
+def create_change_report(classification_t1, classification_t2, aoi, year1, year2, class_names,
+                         scale=10, pixel_area=None, block_size=1024, workers=None,
+                         n_values=None):
+    """
+    Generate comprehensive change detection report
+    
+    Parameters:
+    -----------
+    classification_t1 : str or numpy.ndarray
+        Earlier classification
+    classification_t2 : str or numpy.ndarray
+        Later classification
+    aoi : numpy.ndarray or str
+        Boolean AOI mask, or an aligned mask GeoTIFF for GeoTIFF inputs
+        (None = whole raster)
+    year1, year2 : int
+        Years of classifications
+    class_names : dict
+        Mapping of class IDs to names (e.g., {1: 'Primary Forest', 2: 'Secondary Forest', ...})
+    scale : int
+        Pixel size in meters (used for arrays when pixel_area is not given)
+    pixel_area : float or numpy.ndarray
+        Pixel area in square meters (default: from the GeoTIFF or scale**2)
+    block_size, workers : int
+        Window size and worker processes for GeoTIFF inputs, which are
+        streamed through the tiled engine (change_detection_tiled.py)
+    n_values : int
+        Largest class value + 1 for GeoTIFF inputs (default: 256 for uint8,
+        otherwise read from the rasters)
+    
+    Returns:
+    --------
+    dict : Comprehensive change statistics (same structure as the Earth
+    Engine version)
+    """
+    
+    if isinstance(classification_t1, str) and isinstance(classification_t2, str):
+        from change_detection_tiled import calculate_tiled_histogram, print_throughput
+        
+        joint, stats = calculate_tiled_histogram(
+            [classification_t1, classification_t2], n_values, aoi=aoi,
+            block_size=block_size, workers=workers
+        )
+        print_throughput(stats)
+        
+        return _report_from_joint_areas(joint / 10000, year1, year2, class_names,
+                                        stats['aoi_area_m2'] / 10000)
+    
+    pixel_area = _resolve_pixel_area(classification_t1, pixel_area, scale)
+    t1 = load_classification(classification_t1)
+    t2 = load_classification(classification_t2)
+    
+    n_values = int(max(max(class_names), t1.filled(0).max(), t2.filled(0).max())) + 1
+    joint = calculate_joint_areas(t1, t2, n_values, aoi, pixel_area=pixel_area) / 10000
+    
+    return _report_from_joint_areas(joint, year1, year2, class_names,
+                                    _total_area(t1.shape, aoi, pixel_area))
+
+
+def _total_area(shape, aoi, pixel_area):
+    """AOI area in hectares (masked pixels included, like aoi.area())"""
+    
+    selection = _aoi_selection(shape, aoi)
+    weights = _weights(pixel_area, shape, selection)
+    if weights is None:
+        return float(selection.sum() * pixel_area / 10000)
+    return float(weights.sum() / 10000)
+
+
+def _report_from_joint_areas(joint, year1, year2, class_names, total_area,
+                             forest_classes=[1, 2], ag_class=4):
+    """
+    Build the change report from a joint area matrix in hectares
+    
+    The last row/column of the matrix holds pixels masked in one period.
+    """
+    
+    n_values = joint.shape[0] - 1
+    
+    # Class area per period includes pixels masked in the other period
+    areas_t1 = {class_id: float(joint[class_id, :].sum()) for class_id in class_names}
+    areas_t2 = {class_id: float(joint[:, class_id].sum()) for class_id in class_names}
+    
+    # Forest loss needs both periods valid
+    forest = np.zeros(n_values, dtype=bool)
+    forest[[c for c in forest_classes if c < n_values]] = True
+    forest_loss_ha = float(joint[:n_values, :n_values][np.ix_(forest, ~forest)].sum())
+    
+    ag_expansion = _summarize_ag_expansion(forest_classes, [
+        float(joint[forest_class, ag_class]) if max(forest_class, ag_class) < n_values else 0.0
+        for forest_class in forest_classes
+    ])
+    
+    return _build_change_report(year1, year2, class_names, areas_t1, areas_t2,
+                                forest_loss_ha, ag_expansion, total_area)
+
+
+def create_transition_table(change_matrix, class_names, aoi=None, scale=10, pixel_area=None,
+                            block_size=1024, workers=None, class_ids=PALAWAN_CLASS_IDS,
+                            n_values=None):
+    """
+    Create a Pandas DataFrame showing all class transitions
+    Useful for detailed change analysis
+    
+    class_ids are the IDs change_matrix was built with (default:
+    PALAWAN_CLASS_IDS, as in create_change_matrix). n_values is passed to
+    calculate_change_code_areas.
+    
+    Returns:
+    --------
+    pandas.DataFrame : Transition matrix with areas
+    """
+    
+    codes = create_change_code_table(_transition_class_ids(class_names, class_ids))['codes']
+    areas = calculate_change_code_areas(change_matrix, aoi, scale, pixel_area,
+                                        block_size, workers, n_values)
+    transitions = {}
+    
+    for from_id, from_name in class_names.items():
+        transitions[from_name] = {}
+        
+        for to_id, to_name in class_names.items():
+            change_code = codes[(from_id, to_id)]
+            transitions[from_name][to_name] = round(_code_area(areas, change_code), 2)
+    
+    # Convert to DataFrame
+    df = pd.DataFrame(transitions).T
+    df.index.name = 'From \\ To'
+    
+    return df
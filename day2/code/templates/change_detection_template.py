@@ -8,6 +8,19 @@ Usage: Copy and adapt for Session 2 NRM applications
 import ee
 import pandas as pd
 
+from area_stats_cache import get_info
+from change_codes import (
+    PALAWAN_CLASS_IDS,
+    _ag_expansion_codes,
+    _build_change_report,
+    _report_class_ids,
+    _summarize_ag_expansion,
+    _transition_class_ids,
+    create_change_code_table,
+)
+from ee_concurrency import get_info_many
+
+
 def detect_forest_loss(classification_t1, classification_t2, forest_classes=[1, 2]):
     """
     Detect forest loss between two time periods
@@ -41,24 +54,69 @@ def detect_forest_loss(classification_t1, classification_t2, forest_classes=[1,
     return forest_loss
 
 
-def create_change_matrix(classification_t1, classification_t2):
+def create_change_matrix(classification_t1, classification_t2, class_ids=PALAWAN_CLASS_IDS):
     """
     Create from-to change matrix
     
+    Parameters:
+    -----------
+    classification_t1, classification_t2 : ee.Image
+        Earlier and later classifications
+    class_ids : list
+        Class IDs in the classification scheme (pixels with other values
+        are masked)
+    
     Returns:
     --------
-    ee.Image : Change code (from_class * 10 + to_class)
+    ee.Image : Dense change code (uint8 for up to 15 classes); see
+    create_change_code_table for the code -> (from, to) lookup. class_ids
+    are stored in the image's 'class_ids' property, which
+    calculate_transition_areas reads back to decode the codes.
     
-    Example: Forest (1) to Agriculture (4) = 14
+    Example: With PALAWAN_CLASS_IDS, Forest (1) to Agriculture (4) = 3
     """
     
-    # Multiply t1 by 10 and add t2
-    change_code = classification_t1.multiply(10).add(classification_t2).rename('change_code')
+    table = create_change_code_table(class_ids)
+    n_classes = len(class_ids)
+    class_index = list(range(n_classes))
+    
+    # Class IDs -> 0..n-1, then from_index * n + to_index
+    from_index = classification_t1.remap(class_ids, class_index)
+    to_index = classification_t2.remap(class_ids, class_index)
+    change_code = from_index.multiply(n_classes).add(to_index)
     
-    return change_code
+    if table['dtype'] == 'uint8':
+        change_code = change_code.toUint8()
+    else:
+        change_code = change_code.toUint16()
+    
+    return change_code.rename('change_code').set('class_ids', list(class_ids))
 
 
-def calculate_class_transitions(change_matrix, from_class, to_classes, aoi, scale=10):
+def calculate_mask_area(mask, band_name, aoi, scale=10):
+    """
+    Server-side area of a 0/1 mask in hectares
+    
+    Every per-mask reduction goes through here so that identical masks
+    serialize identically and can be shared through an AreaStatsCache.
+    
+    Returns:
+    --------
+    ee.Number : Area in hectares (not yet fetched)
+    """
+    
+    area = mask.multiply(ee.Image.pixelArea()).reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=aoi,
+        scale=scale,
+        maxPixels=1e13
+    )
+    
+    return ee.Number(area.get(band_name)).divide(10000)
+
+
+def calculate_class_transitions(change_matrix, from_class, to_classes, aoi, scale=10,
+                                class_ids=PALAWAN_CLASS_IDS, cache=None, max_workers=1):
     """
     Calculate area of transitions from one class to others
     
@@ -74,35 +132,36 @@ def calculate_class_transitions(change_matrix, from_class, to_classes, aoi, scal
         Area of interest
     scale : int
         Pixel size in meters
+    class_ids : list
+        Class IDs used to build the change matrix
+    cache : AreaStatsCache
+        Optional cache shared with other functions (see area_stats_cache.py)
+    max_workers : int
+        Concurrent getInfo() requests (see ee_concurrency.py; 1 = one at a time)
     
     Returns:
     --------
     dict : Area in hectares for each transition
     """
     
-    transitions = {}
+    codes = create_change_code_table(class_ids)['codes']
+    areas = []
     
     for to_class in to_classes:
-        # Calculate change code
-        change_code = from_class * 10 + to_class
+        # Look up change code
+        change_code = codes[(from_class, to_class)]
         
         # Create mask for this transition
         transition_mask = change_matrix.eq(change_code)
         
-        # Calculate area
-        area = transition_mask.multiply(ee.Image.pixelArea()).reduceRegion(
-            reducer=ee.Reducer.sum(),
-            geometry=aoi,
-            scale=scale,
-            maxPixels=1e13
-        )
-        
-        # Convert to hectares
-        area_ha = ee.Number(area.get('change_code')).divide(10000)
-        
-        transitions[f'{from_class}_to_{to_class}'] = area_ha.getInfo()
+        # Calculate area in hectares
+        areas.append(calculate_mask_area(transition_mask, 'change_code', aoi, scale))
+    
+    # Independent requests, fetched concurrently and returned in order
+    areas_ha = get_info_many(areas, max_workers=max_workers, cache=cache)
     
-    return transitions
+    return {f'{from_class}_to_{to_class}': area_ha
+            for to_class, area_ha in zip(to_classes, areas_ha)}
 
 
 def detect_deforestation_hotspots(forest_loss, aoi, kernel_radius=500):
@@ -132,7 +191,8 @@ def detect_deforestation_hotspots(forest_loss, aoi, kernel_radius=500):
     return hotspots.clip(aoi)
 
 
-def analyze_agricultural_expansion(change_matrix, forest_classes=[1, 2], ag_class=4, aoi=None):
+def analyze_agricultural_expansion(change_matrix, forest_classes=[1, 2], ag_class=4, aoi=None,
+                                   class_ids=PALAWAN_CLASS_IDS, cache=None, max_workers=1):
     """
     Analyze forest to agriculture conversion
     
@@ -141,36 +201,21 @@ def analyze_agricultural_expansion(change_matrix, forest_classes=[1, 2], ag_clas
     dict : Statistics on agricultural expansion
     """
     
-    results = {}
+    if not aoi:
+        return _summarize_ag_expansion(forest_classes, [0] * len(forest_classes))
     
-    for forest_class in forest_classes:
-        # Forest to agriculture change code
-        change_code = forest_class * 10 + ag_class
-        
-        # Create mask
-        conversion_mask = change_matrix.eq(change_code)
-        
-        # Calculate area
-        if aoi:
-            area = conversion_mask.multiply(ee.Image.pixelArea()).reduceRegion(
-                reducer=ee.Reducer.sum(),
-                geometry=aoi,
-                scale=10,
-                maxPixels=1e13
-            )
-            area_ha = ee.Number(area.get('change_code')).divide(10000).getInfo()
-        else:
-            area_ha = 0
-        
-        class_name = 'Primary Forest' if forest_class == 1 else 'Secondary Forest'
-        results[f'{class_name}_to_Agriculture_ha'] = area_ha
+    areas = [
+        calculate_mask_area(change_matrix.eq(code), 'change_code', aoi)
+        for code in _ag_expansion_codes(forest_classes, ag_class, class_ids)
+    ]
     
-    results['Total_Forest_to_Ag_ha'] = sum(results.values())
-    
-    return results
+    return _summarize_ag_expansion(
+        forest_classes, get_info_many(areas, max_workers=max_workers, cache=cache)
+    )
 
 
-def create_change_report(classification_t1, classification_t2, aoi, year1, year2, class_names):
+def create_change_report(classification_t1, classification_t2, aoi, year1, year2, class_names,
+                         batched=True, cache=None, max_workers=1):
     """
     Generate comprehensive change detection report
     
@@ -186,73 +231,109 @@ def create_change_report(classification_t1, classification_t2, aoi, year1, year2
         Years of classifications
     class_names : dict
         Mapping of class IDs to names (e.g., {1: 'Primary Forest', 2: 'Secondary Forest', ...})
+    batched : bool
+        If True (default), build every area into one server-side dictionary
+        and fetch it with a single getInfo(). If False, fetch each area
+        separately (about 20 round trips for 8 classes).
+    cache : AreaStatsCache
+        Optional cache shared with other functions (see area_stats_cache.py)
+    max_workers : int
+        With batched=False, number of getInfo() requests run concurrently
+        (see ee_concurrency.py; 1 = one at a time)
     
     Returns:
     --------
     dict : Comprehensive change statistics
     """
     
-    report = {
-        'period': f'{year1}-{year2}',
-        'area_changes': {},
-        'key_transitions': {},
-        'summary': {}
-    }
+    if batched:
+        return _create_change_report_batched(
+            classification_t1, classification_t2, aoi, year1, year2, class_names, cache=cache
+        )
     
     # Calculate area for each class in both periods
-    def calculate_class_area(classification, class_id):
-        mask = classification.eq(class_id)
-        area = mask.multiply(ee.Image.pixelArea()).reduceRegion(
-            reducer=ee.Reducer.sum(),
-            geometry=aoi,
-            scale=10,
-            maxPixels=1e13
-        )
-        return ee.Number(area.get('classification')).divide(10000).getInfo()
-    
-    # Area changes for each class
-    for class_id, class_name in class_names.items():
-        area_t1 = calculate_class_area(classification_t1, class_id)
-        area_t2 = calculate_class_area(classification_t2, class_id)
-        change = area_t2 - area_t1
-        percent_change = (change / area_t1 * 100) if area_t1 > 0 else 0
-        
-        report['area_changes'][class_name] = {
-            f'{year1}_ha': round(area_t1, 2),
-            f'{year2}_ha': round(area_t2, 2),
-            'change_ha': round(change, 2),
-            'percent_change': round(percent_change, 2)
-        }
+    requests = []
+    for class_id in class_names:
+        requests.append(calculate_mask_area(classification_t1.eq(class_id), 'classification', aoi))
+        requests.append(calculate_mask_area(classification_t2.eq(class_id), 'classification', aoi))
     
     # Key transitions (simplified)
-    change_matrix = create_change_matrix(classification_t1, classification_t2)
+    class_ids = _report_class_ids(class_names)
+    change_matrix = create_change_matrix(classification_t1, classification_t2, class_ids)
     
     # Forest loss
     forest_loss_img = detect_forest_loss(classification_t1, classification_t2, [1, 2])
-    forest_loss_area = forest_loss_img.multiply(ee.Image.pixelArea()).reduceRegion(
+    requests.append(calculate_mask_area(forest_loss_img, 'forest_loss', aoi))
+    
+    # Agricultural expansion
+    for change_code in _ag_expansion_codes([1, 2], 4, class_ids):
+        requests.append(calculate_mask_area(change_matrix.eq(change_code), 'change_code', aoi))
+    
+    requests.append(aoi.area().divide(10000))
+    
+    # Independent requests, fetched concurrently and returned in order
+    results = get_info_many(requests, max_workers=max_workers, cache=cache)
+    
+    n_classes = len(class_names)
+    areas_t1 = dict(zip(class_names, results[0:2 * n_classes:2]))
+    areas_t2 = dict(zip(class_names, results[1:2 * n_classes:2]))
+    forest_loss_ha = results[2 * n_classes]
+    ag_expansion = _summarize_ag_expansion([1, 2], results[2 * n_classes + 1:-1])
+    total_area = results[-1]
+    
+    return _build_change_report(year1, year2, class_names, areas_t1, areas_t2,
+                                forest_loss_ha, ag_expansion, total_area)
+
+
+def _create_change_report_batched(classification_t1, classification_t2, aoi, year1, year2,
+                                  class_names, forest_classes=[1, 2], ag_class=4, cache=None):
+    """
+    Compute all report areas in one reduceRegion and fetch them once
+    
+    Every quantity becomes one band of a single area image, so masks are
+    built once and the server sums all bands in the same pass.
+    """
+    
+    area_bands = []
+    
+    for class_id in class_names:
+        area_bands.append(classification_t1.eq(class_id).rename(f't1_{class_id}'))
+        area_bands.append(classification_t2.eq(class_id).rename(f't2_{class_id}'))
+    
+    area_bands.append(detect_forest_loss(classification_t1, classification_t2, forest_classes))
+    
+    class_ids = _report_class_ids(class_names, forest_classes, ag_class)
+    change_matrix = create_change_matrix(classification_t1, classification_t2, class_ids)
+    ag_codes = _ag_expansion_codes(forest_classes, ag_class, class_ids)
+    for forest_class, change_code in zip(forest_classes, ag_codes):
+        area_bands.append(change_matrix.eq(change_code).rename(f'ag_{forest_class}'))
+    
+    areas = ee.Image.cat(area_bands).multiply(ee.Image.pixelArea()).reduceRegion(
         reducer=ee.Reducer.sum(),
         geometry=aoi,
         scale=10,
         maxPixels=1e13
-    ).get('forest_loss')
-    report['key_transitions']['forest_loss_ha'] = ee.Number(forest_loss_area).divide(10000).getInfo()
+    )
     
-    # Agricultural expansion
-    ag_expansion = analyze_agricultural_expansion(change_matrix, [1, 2], 4, aoi)
-    report['key_transitions']['agricultural_expansion'] = ag_expansion
-    
-    # Summary statistics
-    total_area = aoi.area().divide(10000).getInfo()
-    report['summary'] = {
-        'total_study_area_ha': round(total_area, 2),
-        'forest_loss_percent': round(report['key_transitions']['forest_loss_ha'] / total_area * 100, 2),
-        'period_years': year2 - year1
-    }
-    
-    return report
+    # Single round trip for every quantity in the report
+    stats = get_info(ee.Dictionary({'areas': areas, 'total_area': aoi.area()}), cache)
+    
+    # Client-side: convert to hectares and assemble the report
+    areas_ha = {name: value / 10000 for name, value in stats['areas'].items()}
+    areas_t1 = {class_id: areas_ha[f't1_{class_id}'] for class_id in class_names}
+    areas_t2 = {class_id: areas_ha[f't2_{class_id}'] for class_id in class_names}
+    
+    ag_expansion = _summarize_ag_expansion(
+        forest_classes, [areas_ha[f'ag_{forest_class}'] for forest_class in forest_classes]
+    )
+    
+    return _build_change_report(year1, year2, class_names, areas_t1, areas_t2,
+                                areas_ha['forest_loss'], ag_expansion,
+                                stats['total_area'] / 10000)
 
 
-def export_change_map(change_image, aoi, description, folder='EO_Training'):
+def export_change_map(change_image, aoi, description, folder='EO_Training', nodata=None,
+                      tile_size_deg=None, download_dir='.', max_concurrent=4):
     """
     Export change detection results to Google Drive
     
@@ -266,8 +347,33 @@ def export_change_map(change_image, aoi, description, folder='EO_Training'):
         Export file name
     folder : str
         Google Drive folder
+    nodata : int
+        Value written for masked pixels. Use the change code table's
+        'nodata' for change maps, where 0 is a valid code.
+    tile_size_deg : float
+        If set, split the AOI into tiles of about this size and export them
+        as separate tasks through export_manager.py (at most max_concurrent
+        at a time, failed tiles retried). Once the Drive folder is synced
+        to download_dir, manager.tile_paths() lists the tiles for
+        stitch_tiles_to_cog (and raises if any tile failed).
+    
+    Returns:
+    --------
+    ExportManager : Only for tiled exports (see export_manager.py)
     """
     
+    if tile_size_deg is not None:
+        from export_manager import export_tiled
+        
+        return export_tiled(change_image, aoi, description, folder, download_dir,
+                            tile_size_deg=tile_size_deg, max_concurrent=max_concurrent,
+                            nodata=nodata)
+    
+    export_options = {}
+    if nodata is not None:
+        change_image = change_image.unmask(nodata)
+        export_options['formatOptions'] = {'noData': nodata}
+    
     task = ee.batch.Export.image.toDrive(
         image=change_image,
         description=description,
@@ -275,7 +381,8 @@ def export_change_map(change_image, aoi, description, folder='EO_Training'):
         scale=10,
         region=aoi,
         maxPixels=1e13,
-        crs='EPSG:4326'
+        crs='EPSG:4326',
+        **export_options
     )
     
     task.start()
@@ -284,35 +391,90 @@ def export_change_map(change_image, aoi, description, folder='EO_Training'):
 
 
 # Utility: Transition matrix table
-def create_transition_table(change_matrix, class_names, aoi):
+def calculate_transition_areas(change_matrix, aoi, scale=10, class_ids=None, cache=None):
+    """
+    Calculate the area of every change code in a single grouped reduction
+    
+    Parameters:
+    -----------
+    change_matrix : ee.Image
+        Change code image (from create_change_matrix)
+    aoi : ee.Geometry
+        Area of interest
+    scale : int
+        Pixel size in meters
+    class_ids : list
+        Class IDs used to build the change matrix (default: its 'class_ids'
+        property, or PALAWAN_CLASS_IDS for images without one)
+    cache : AreaStatsCache
+        Optional cache shared with other functions (see area_stats_cache.py)
+    
+    Returns:
+    --------
+    dict : Area in hectares keyed by (from_class, to_class) (one getInfo() call)
+    """
+    
+    areas, _ = _transition_areas(change_matrix, aoi, scale, class_ids, cache)
+    
+    return areas
+
+
+def _transition_areas(change_matrix, aoi, scale, class_ids, cache):
+    """Transition areas and the class IDs they were decoded with"""
+    
+    # Pixel area in band 0, change code in band 1 -> sum of area per code
+    stats = ee.Image.pixelArea().addBands(change_matrix).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName='change_code'),
+        geometry=aoi,
+        scale=scale,
+        maxPixels=1e13
+    )
+    
+    # The stored class IDs come back in the same request as the areas
+    info = get_info(ee.Dictionary({'groups': stats.get('groups'),
+                                   'class_ids': change_matrix.get('class_ids')}), cache)
+    groups = info['groups']
+    stored = None if info['class_ids'] is None else [int(c) for c in info['class_ids']]
+    if class_ids is None:
+        class_ids = PALAWAN_CLASS_IDS if stored is None else stored
+    elif stored is not None and stored != list(class_ids):
+        raise ValueError(f'class_ids {list(class_ids)} differ from the class_ids {stored} '
+                         'the change matrix was built with')
+    pairs = create_change_code_table(class_ids)['pairs']
+    
+    codes = [int(group['change_code']) for group in groups]
+    if codes and max(codes) >= len(pairs):
+        raise ValueError(f'Change code {max(codes)} is outside the table for class_ids '
+                         f'{list(class_ids)}; pass the class_ids used by create_change_matrix')
+    
+    return {pairs[code]: group['sum'] / 10000 for code, group in zip(codes, groups)}, class_ids
+
+
+def create_transition_table(change_matrix, class_names, aoi, scale=10,
+                            class_ids=None, cache=None):
     """
     Create a Pandas DataFrame showing all class transitions
     Useful for detailed change analysis
     
+    All from-to areas come from one grouped reduction, so the table
+    costs a single round trip regardless of the number of classes.
+    class_ids are the IDs change_matrix was built with (default: read
+    from the change matrix, see calculate_transition_areas).
+    
     Returns:
     --------
     pandas.DataFrame : Transition matrix with areas
     """
     
-    n_classes = len(class_names)
+    areas, class_ids = _transition_areas(change_matrix, aoi, scale, class_ids, cache)
+    _transition_class_ids(class_names, class_ids)
     transitions = {}
     
     for from_id, from_name in class_names.items():
         transitions[from_name] = {}
         
         for to_id, to_name in class_names.items():
-            change_code = from_id * 10 + to_id
-            mask = change_matrix.eq(change_code)
-            
-            area = mask.multiply(ee.Image.pixelArea()).reduceRegion(
-                reducer=ee.Reducer.sum(),
-                geometry=aoi,
-                scale=10,
-                maxPixels=1e13
-            )
-            
-            area_ha = ee.Number(area.get('change_code')).divide(10000).getInfo()
-            transitions[from_name][to_name] = round(area_ha, 2)
+            transitions[from_name][to_name] = round(areas.get((from_id, to_id), 0), 2)
     
     # Convert to DataFrame
     df = pd.DataFrame(transitions).T
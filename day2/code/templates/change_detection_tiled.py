@@ -0,0 +1,201 @@
+"""
+Tiled Change Detection Engine (rasterio windows + process pool)
+Out-of-core transition histograms for province-scale classifications
+
+Classification rasters are streamed block by block with rasterio windows.
+Each worker reads one window from every input, bins it into a small
+histogram and returns only that histogram, so memory stays bounded to a
+few tiles no matter how large the rasters are.
+
+Usage: Called by change_detection_local.py when inputs are GeoTIFF paths
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from change_detection_local import pixel_area_for_rows
+
+
+def iter_windows(height, width, block_size=1024):
+    """
+    Split a raster into square processing windows
+
+    Parameters:
+    -----------
+    height, width : int
+        Raster dimensions in pixels
+    block_size : int
+        Window size in pixels (edge windows are smaller)
+
+    Returns:
+    --------
+    generator of rasterio.windows.Window
+    """
+
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(col_off, row_off,
+                         min(block_size, width - col_off),
+                         min(block_size, height - row_off))
+
+
+def _default_n_values(paths, block_size=1024):
+    """
+    Number of class values (largest value + 1) shared by integer rasters
+
+    8-bit rasters count as 256 without reading them. Wider integer types
+    (e.g., int16/int32 Earth Engine exports or uint16 change maps) take one
+    windowed pass over their valid pixels to find the largest value.
+    """
+
+    largest = 0
+    for path in paths:
+        with rasterio.open(path) as src:
+            dtype = np.dtype(src.dtypes[0])
+            if dtype == np.uint8:
+                largest = max(largest, 255)
+                continue
+            if dtype.kind not in 'iu':
+                raise ValueError(f'{path} is {dtype}; class rasters must have an integer type')
+
+            for window in iter_windows(src.height, src.width, block_size):
+                block = src.read(1, window=window, masked=True)
+                if block.count() == 0:
+                    continue
+                if block.min() < 0:
+                    raise ValueError(f'{path} has negative values; set its nodata value '
+                                     'or pass n_values explicitly')
+                largest = max(largest, int(block.max()))
+
+    return largest + 1
+
+
+def _check_aligned(paths):
+    """Inputs must share the same grid to be combined window by window"""
+
+    grids = set()
+    for path in paths:
+        with rasterio.open(path) as src:
+            grids.add((src.height, src.width, tuple(src.transform)))
+    if len(grids) > 1:
+        raise ValueError('Rasters must share the same dimensions and transform')
+
+
+def _tile_histogram(task):
+    """
+    Worker: area histogram of combined codes for one window
+
+    Masked (nodata) pixels are binned under index n_values in each input.
+    Returns (areas, pixel count, AOI area).
+    """
+
+    paths, aoi_path, window, n_values = task
+    size = n_values + 1
+
+    combined = None
+    for path in paths:
+        with rasterio.open(path) as src:
+            block = src.read(1, window=window, masked=True)
+            transform, crs = src.transform, src.crs
+
+        values = block.filled(0).astype(np.int64)
+        if values.size and values.max() >= n_values:
+            raise ValueError(f'{path} has values >= n_values ({n_values})')
+        values[np.ma.getmaskarray(block)] = n_values
+        combined = values if combined is None else combined * size + values
+
+    if aoi_path is None:
+        selection = np.ones(combined.shape, dtype=bool)
+    else:
+        with rasterio.open(aoi_path) as src:
+            selection = src.read(1, window=window, masked=True).filled(0) != 0
+
+    pixel_area = pixel_area_for_rows(transform, crs, window.row_off, window.height)
+    weights = None
+    if np.ndim(pixel_area) > 0:
+        weights = np.broadcast_to(pixel_area, combined.shape)[selection]
+
+    areas = np.bincount(combined[selection], weights=weights, minlength=size ** len(paths))
+    if weights is None:
+        aoi_area = selection.sum() * pixel_area
+        areas = areas * pixel_area
+    else:
+        aoi_area = weights.sum()
+
+    return areas, combined.size, aoi_area
+
+
+def calculate_tiled_histogram(paths, n_values=None, aoi=None, block_size=1024, workers=None):
+    """
+    Area histogram of combined raster values, streamed window by window
+
+    With one raster this is the area of each value (e.g., change codes);
+    with two it is the joint (from, to) area matrix.
+
+    Parameters:
+    -----------
+    paths : list
+        One or more aligned single-band GeoTIFF paths
+    n_values : int
+        Number of values per raster (largest value + 1). Default: 256 for
+        uint8, otherwise found in one extra pass over the rasters
+    aoi : str
+        Optional aligned mask GeoTIFF (non-zero = inside the AOI)
+    block_size : int
+        Window size in pixels
+    workers : int
+        Worker processes (default: os.cpu_count())
+
+    Returns:
+    --------
+    tuple : (areas, stats)
+        areas : numpy.ndarray of shape (n_values + 1,) * len(paths) in
+        square meters; index n_values holds masked pixels
+        stats : dict with 'pixels', 'tiles', 'seconds', 'pixels_per_second'
+        and 'aoi_area_m2'
+    """
+
+    if n_values is None:
+        n_values = _default_n_values(paths, block_size)
+    _check_aligned(list(paths) + ([aoi] if aoi else []))
+
+    with rasterio.open(paths[0]) as src:
+        height, width = src.height, src.width
+
+    tasks = [(list(paths), aoi, window, n_values)
+             for window in iter_windows(height, width, block_size)]
+
+    size = n_values + 1
+    areas = np.zeros(size ** len(paths))
+    n_pixels = 0
+    aoi_area = 0.0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for tile_areas, tile_pixels, tile_aoi_area in executor.map(_tile_histogram, tasks):
+            areas += tile_areas
+            n_pixels += tile_pixels
+            aoi_area += tile_aoi_area
+    seconds = time.perf_counter() - start
+
+    stats = {
+        'pixels': n_pixels,
+        'tiles': len(tasks),
+        'seconds': seconds,
+        'pixels_per_second': n_pixels / seconds if seconds > 0 else float('inf'),
+        'aoi_area_m2': aoi_area
+    }
+
+    return areas.reshape((size,) * len(paths)), stats
+
+
+def print_throughput(stats):
+    """Print a one-line throughput summary for a tiled run"""
+
+    print(f"Processed {stats['pixels']:,} pixels in {stats['tiles']} tiles "
+          f"({stats['seconds']:.1f} s, {stats['pixels_per_second']:,.0f} pixels/s)")
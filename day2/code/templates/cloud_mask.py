@@ -0,0 +1,184 @@
+"""
+Sentinel-2 Cloud Masking with Lookup Tables
+One masking kernel for QA60 bits and SCL classes, locally and in Earth Engine
+
+Every QA60 or SCL value maps to clear / not clear, so the whole test can
+be precomputed: a 65,536-entry table for the uint16 QA60 band and a
+256-entry table for the uint8 SCL band. Locally the mask is one gather
+(table[qa]) instead of a chain of comparisons. In Earth Engine the same
+tables become one bitwiseAnd (QA60) or one remap (SCL).
+
+Usage:
+    clear = clear_mask(qa60_array)                       # NumPy, bool
+    masked = apply_mask(bands, scl_array, method='SCL')  # nodata where cloudy
+    image = mask_image(image, method='SCL')              # Earth Engine
+"""
+
+import numpy as np
+
+# Sentinel-2 L2A digital numbers to surface reflectance: DN * scale + offset
+REFLECTANCE_SCALE = 0.0001
+REFLECTANCE_OFFSET = 0
+
+# QA60 bits: 10 = opaque clouds, 11 = cirrus
+QA60_CLOUD_BITS = [10, 11]
+
+# Scene Classification Layer classes
+SCL_CLASSES = {
+    0: 'No data',
+    1: 'Saturated or defective',
+    2: 'Dark area pixels',
+    3: 'Cloud shadows',
+    4: 'Vegetation',
+    5: 'Not vegetated',
+    6: 'Water',
+    7: 'Unclassified',
+    8: 'Cloud medium probability',
+    9: 'Cloud high probability',
+    10: 'Thin cirrus',
+    11: 'Snow'
+}
+
+# SCL classes masked by default (as in the Day 4 drought lab)
+SCL_MASKED_CLASSES = [0, 1, 3, 7, 8, 9, 10, 11]
+
+
+def qa60_lut(bits=QA60_CLOUD_BITS):
+    """
+    Clear-sky table for every uint16 QA60 value
+    
+    Returns:
+    --------
+    numpy.ndarray : bool (65536,), True where none of the bits is set
+    """
+    
+    mask_value = sum(1 << bit for bit in bits)
+    return (np.arange(2 ** 16, dtype=np.uint32) & mask_value) == 0
+
+
+def scl_lut(masked_classes=SCL_MASKED_CLASSES):
+    """
+    Clear-sky table for every uint8 SCL value
+    
+    Returns:
+    --------
+    numpy.ndarray : bool (256,), False for the masked classes
+    """
+    
+    lut = np.ones(256, dtype=bool)
+    lut[list(masked_classes)] = False
+    return lut
+
+
+# Default tables, built once
+LUTS = {
+    'QA60': qa60_lut(),
+    'SCL': scl_lut()
+}
+
+
+def clear_mask(qa, method='QA60', lut=None):
+    """
+    Clear-sky mask of a QA60 or SCL array in one gather
+    
+    Parameters:
+    -----------
+    qa : numpy.ndarray
+        QA60 (uint16) or SCL (uint8) values
+    method : str
+        'QA60' or 'SCL' (selects the default table)
+    lut : numpy.ndarray
+        Optional table from qa60_lut() / scl_lut() with other bits or classes
+    
+    Returns:
+    --------
+    numpy.ndarray : bool, True where clear
+    """
+    
+    lut = LUTS[method] if lut is None else lut
+    qa = np.asarray(qa)
+    if qa.dtype.kind not in 'ui' or np.iinfo(qa.dtype).max >= len(lut):
+        qa = np.clip(qa, 0, len(lut) - 1).astype(np.intp)
+    
+    return lut[qa]
+
+
+def apply_mask(values, qa, method='QA60', nodata=0, lut=None):
+    """
+    Set cloudy pixels of a (bands, rows, cols) or (rows, cols) array to nodata
+    
+    Returns:
+    --------
+    numpy.ndarray : Same shape and type as values
+    """
+    
+    return np.where(clear_mask(qa, method, lut), values, nodata).astype(np.asarray(values).dtype)
+
+
+def ee_clear_mask(image, method='QA60', bits=QA60_CLOUD_BITS,
+                  masked_classes=SCL_MASKED_CLASSES):
+    """
+    Earth Engine clear-sky mask in one operation
+    
+    QA60: a single bitwiseAnd against all cloud bits.
+    SCL: a single remap of every class to 1 (clear) or 0 (masked).
+    
+    Returns:
+    --------
+    ee.Image : 1 where clear, 0 where cloudy
+    """
+    
+    if method == 'QA60':
+        mask_value = sum(1 << bit for bit in bits)
+        return image.select('QA60').bitwiseAnd(mask_value).eq(0)
+    
+    if method == 'SCL':
+        classes = sorted(SCL_CLASSES)
+        clear = [0 if value in masked_classes else 1 for value in classes]
+        return image.select('SCL').remap(classes, clear, 0)
+    
+    raise ValueError(f'Unknown mask method: {method}')
+
+
+def mask_image(image, method='QA60', reflectance=True):
+    """
+    Cloud-mask a Sentinel-2 ee.Image, optionally scaling to reflectance (0-1)
+    
+    Image properties (system:time_start, ...) are kept through the scaling.
+    With reflectance=False the bands stay uint16 DN (see to_reflectance).
+    
+    Returns:
+    --------
+    ee.Image
+    """
+    
+    masked = image.updateMask(ee_clear_mask(image, method))
+    if not reflectance:
+        return masked
+    return to_reflectance(masked, image)
+
+
+def to_reflectance(image, properties_from=None):
+    """
+    Scale an ee.Image of DN to reflectance (DN * REFLECTANCE_SCALE + REFLECTANCE_OFFSET)
+    
+    Properties of properties_from (default: image) are kept.
+    
+    Returns:
+    --------
+    ee.Image
+    """
+    
+    import ee
+    
+    source = image if properties_from is None else properties_from
+    scaled = image.multiply(REFLECTANCE_SCALE)
+    if REFLECTANCE_OFFSET:
+        scaled = scaled.add(REFLECTANCE_OFFSET)
+    return ee.Image(scaled.copyProperties(source, source.propertyNames()))
+
+
+def set_scale_metadata(image):
+    """Record the DN to reflectance scale and offset as image properties"""
+    
+    return image.set({'scale_factor': REFLECTANCE_SCALE, 'add_offset': REFLECTANCE_OFFSET})
@@ -0,0 +1,376 @@
+"""
+Incremental Composite Accumulator (NumPy / rasterio)
+Seasonal composites and temporal metrics that update as new scenes arrive
+
+Rerunning a seasonal composite every day recomputes the whole season.
+Here each pixel keeps a small running state on disk: observation count,
+Welford mean and M2 (for the standard deviation), min, max and a fixed-size
+reservoir of observed values for the median. Only newly arrived scenes are
+read on each update, so a daily rerun costs O(new scenes); the composite
+is finalized from the state on demand.
+
+The median is exact while a pixel has at most reservoir_size valid
+observations (a dry season rarely has more) and an unbiased reservoir
+sample estimate beyond that.
+
+Updates write the state in place. Before a block is changed, its old
+values (the small per-pixel arrays and only the reservoir slots about to be
+overwritten) go to an undo journal, and meta.json is replaced last. Opening
+a state after a crash rolls an uncommitted update back, so scenes are never
+half counted, and an update still costs O(new scenes) of I/O.
+
+Usage:
+    state = build_composite_state('dry_2024_state', scene_paths, reservoir_size=32)
+    # next day: only the new scenes are processed
+    state = build_composite_state('dry_2024_state', scene_paths + new_paths)
+    metrics = state.finalize()
+"""
+
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+
+from composite_local import NODATA, masked_median
+
+
+class CompositeAccumulator:
+    """
+    Persistent per-pixel accumulator for seasonal composites
+    
+    State arrays (memory-mapped, shape (bands, rows, cols)):
+    ---------------------------------------------------------
+    count : uint16 number of valid observations
+    mean, m2 : float32 Welford running mean and sum of squared deviations
+    min, max : uint16 extremes
+    reservoir : uint16 (reservoir_size, bands, rows, cols) value sample
+    """
+    
+    STATE_ARRAYS = {
+        'count': (np.uint16, 0),
+        'mean': (np.float32, 0),
+        'm2': (np.float32, 0),
+        'min': (np.uint16, np.iinfo(np.uint16).max),
+        'max': (np.uint16, 0)
+    }
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        
+        for name in list(self.STATE_ARRAYS) + ['reservoir']:
+            setattr(self, name, np.load(self._file(name), mmap_mode='r+'))
+        
+        self.nodata = self.meta['nodata']
+        self.scenes = self.meta['scenes']
+        self._recover()
+    
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+    
+    def _journal(self):
+        return os.path.join(self.path, 'journal')
+    
+    def _save_undo(self, row_off, scene_ids, block, positions):
+        """Durably record a block's old values before it is overwritten"""
+        
+        old = {name: getattr(self, name)[:, block] for name in self.STATE_ARRAYS}
+        path = os.path.join(self._journal(), f'block_{row_off:08d}.npz')
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, row_off=row_off, scenes=np.array(scene_ids), positions=positions,
+                     reservoir=self.reservoir.reshape(-1)[positions], **old)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+    
+    def _recover(self):
+        """Roll back an update that stopped before meta.json was replaced"""
+        
+        journal = self._journal()
+        if not os.path.isdir(journal):
+            return
+        
+        paths = sorted(glob.glob(os.path.join(journal, 'block_*.npz')))
+        committed = True
+        if paths:
+            with np.load(paths[0]) as undo:
+                committed = set(undo['scenes'].tolist()) <= set(self.scenes)
+        
+        # Undo the journaled blocks, latest first
+        if not committed:
+            reservoir = self.reservoir.reshape(-1)
+            for path in reversed(paths):
+                with np.load(path) as undo:
+                    row_off = int(undo['row_off'])
+                    block = slice(row_off, row_off + undo['count'].shape[1])
+                    for name in self.STATE_ARRAYS:
+                        getattr(self, name)[:, block] = undo[name]
+                    reservoir[undo['positions']] = undo['reservoir']
+            for name in list(self.STATE_ARRAYS) + ['reservoir']:
+                getattr(self, name).flush()
+        
+        shutil.rmtree(journal)
+    
+    @staticmethod
+    def _write_meta(path, meta):
+        """Replace meta.json atomically (the commit point of an update)"""
+        
+        temp = os.path.join(path, 'meta.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(temp, os.path.join(path, 'meta.json'))
+    
+    @classmethod
+    def create(cls, path, shape, n_bands, reservoir_size=32, nodata=NODATA, seed=0):
+        """
+        Create an empty accumulator on disk
+        
+        Parameters:
+        -----------
+        path : str
+            State directory (created if missing)
+        shape : tuple
+            (rows, cols) of the scenes
+        n_bands : int
+            Number of bands per scene
+        reservoir_size : int
+            Values kept per pixel and band for the median
+        nodata : int
+            Value marking masked (cloudy or missing) pixels
+        seed : int
+            Random seed for reservoir sampling
+        
+        Returns:
+        --------
+        CompositeAccumulator
+        """
+        
+        os.makedirs(path, exist_ok=True)
+        full_shape = (n_bands,) + tuple(shape)
+        
+        for name, (dtype, fill) in cls.STATE_ARRAYS.items():
+            array = np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+',
+                                              dtype=dtype, shape=full_shape)
+            array[:] = fill
+            array.flush()
+        
+        reservoir = np.lib.format.open_memmap(os.path.join(path, 'reservoir.npy'), mode='w+',
+                                              dtype=np.uint16,
+                                              shape=(reservoir_size,) + full_shape)
+        reservoir[:] = nodata
+        reservoir.flush()
+        
+        meta = {
+            'shape': list(shape),
+            'n_bands': n_bands,
+            'reservoir_size': reservoir_size,
+            'nodata': nodata,
+            'seed': seed,
+            'scenes': []
+        }
+        cls._write_meta(path, meta)
+        
+        return cls(path)
+    
+    @classmethod
+    def open(cls, path):
+        """Open an existing accumulator"""
+        
+        return cls(path)
+    
+    def _read_rows(self, scene, row_off, n_rows):
+        """(bands, rows, cols) block of one scene"""
+        
+        if isinstance(scene, str):
+            import rasterio
+            from rasterio.windows import Window
+            
+            with rasterio.open(scene) as src:
+                return src.read(window=Window(0, row_off, src.width, n_rows))
+        
+        array = np.asarray(scene)
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        return array[:, row_off:row_off + n_rows]
+    
+    def update(self, scenes, block_rows=512):
+        """
+        Add scenes to the state, skipping scenes that were already added
+        
+        Each block is computed in memory, its old values are journaled,
+        and only then is it written in place. The scenes count as added
+        once meta.json referencing them is replaced; after a crash, opening
+        the state undoes the journaled blocks, so re-adding the scenes does
+        not count them twice.
+        
+        Parameters:
+        -----------
+        scenes : list
+            GeoTIFF paths, or (scene_id, array) pairs for in-memory scenes
+        block_rows : int
+            Rows processed per block (all new scenes are applied to a block
+            before the next block is read)
+        
+        Returns:
+        --------
+        list : IDs of the scenes that were added
+        """
+        
+        new = []
+        for scene in scenes:
+            scene_id, source = (scene, scene) if isinstance(scene, str) else scene
+            if scene_id not in self.scenes and scene_id not in [s for s, _ in new]:
+                new.append((scene_id, source))
+        if not new:
+            return []
+        
+        rows = self.meta['shape'][0]
+        size = self.meta['reservoir_size']
+        rng = np.random.default_rng([self.meta['seed'], len(self.scenes)])
+        
+        added = [scene_id for scene_id, _ in new]
+        reservoir = self.reservoir.reshape(-1)
+        os.makedirs(self._journal(), exist_ok=True)
+        
+        for row_off in range(0, rows, block_rows):
+            block = slice(row_off, min(row_off + block_rows, rows))
+            count = self.count[:, block].astype(np.int64)
+            mean = self.mean[:, block].astype(np.float64)
+            m2 = self.m2[:, block].astype(np.float64)
+            minimum = np.array(self.min[:, block])
+            maximum = np.array(self.max[:, block])
+            positions, samples = [], []
+            
+            for _, source in new:
+                values = self._read_rows(source, row_off, block.stop - row_off)
+                valid = values != self.nodata
+                x = values.astype(np.float64)
+                
+                # Welford update on valid observations only
+                count += valid
+                delta = np.where(valid, x - mean, 0)
+                mean += delta / np.maximum(count, 1)
+                m2 += delta * np.where(valid, x - mean, 0)
+                np.minimum(minimum, np.where(valid, values, minimum), out=minimum)
+                np.maximum(maximum, np.where(valid, values, maximum), out=maximum)
+                
+                # Reservoir sampling: fill slots first, then replace at random
+                slot = np.where(count <= size, count - 1, rng.integers(0, np.maximum(count, 1)))
+                keep = valid & (slot < size)
+                band, row, col = np.nonzero(keep)
+                positions.append(np.ravel_multi_index((slot[keep], band, row + row_off, col),
+                                                      self.reservoir.shape))
+                samples.append(values[keep])
+            
+            # Only the last value written to a reservoir slot survives
+            positions = np.concatenate(positions)
+            samples = np.concatenate(samples)
+            last = len(positions) - 1 - np.unique(positions[::-1], return_index=True)[1]
+            positions, samples = positions[last], samples[last]
+            
+            self._save_undo(row_off, added, block, positions)
+            self.count[:, block] = count
+            self.mean[:, block] = mean
+            self.m2[:, block] = m2
+            self.min[:, block] = minimum
+            self.max[:, block] = maximum
+            reservoir[positions] = samples
+        
+        for name in list(self.STATE_ARRAYS) + ['reservoir']:
+            getattr(self, name).flush()
+        
+        # Commit: meta.json now lists the scenes, so the journal is obsolete
+        self._write_meta(self.path, dict(self.meta, scenes=self.scenes + added))
+        self.scenes.extend(added)
+        shutil.rmtree(self._journal())
+        
+        return added
+    
+    def finalize(self, statistics=['mean', 'std', 'min', 'max', 'median', 'count'],
+                 rows=slice(None)):
+        """
+        Composite and temporal metrics from the current state
+        
+        Parameters:
+        -----------
+        statistics : list
+            Any of 'mean', 'std' (population, as ee.Reducer.stdDev), 'min',
+            'max', 'median' and 'count'
+        rows : slice
+            Row range to finalize (default: all rows)
+        
+        Returns:
+        --------
+        dict : {statistic: numpy.ma.MaskedArray (bands, rows, cols)}, masked
+        where a pixel has no valid observation
+        """
+        
+        count = np.asarray(self.count[:, rows])
+        missing = count == 0
+        
+        results = {}
+        for statistic in statistics:
+            if statistic == 'mean':
+                values = self.mean[:, rows]
+            elif statistic == 'std':
+                values = np.sqrt(self.m2[:, rows] / np.maximum(count, 1))
+            elif statistic in ['min', 'max']:
+                values = getattr(self, statistic)[:, rows]
+            elif statistic == 'median':
+                values, _ = masked_median(np.asarray(self.reservoir[:, :, rows]), self.nodata)
+                values = values.astype(np.float32)
+            elif statistic == 'count':
+                values = count
+            else:
+                raise ValueError(f'Unknown statistic: {statistic}')
+            results[statistic] = np.ma.array(np.array(values), mask=missing)
+        
+        return results
+
+
+def build_composite_state(path, scenes, shape=None, n_bands=None, reservoir_size=32,
+                          nodata=NODATA, block_rows=512):
+    """
+    Create or update an accumulator with every scene not yet added
+    
+    Parameters:
+    -----------
+    path : str
+        State directory
+    scenes : list
+        GeoTIFF paths (or (scene_id, array) pairs); scenes already in the
+        state are skipped, so the full season list can be passed every day
+    shape, n_bands : tuple, int
+        Grid size (read from the first GeoTIFF when not given)
+    reservoir_size, nodata : int
+        Used only when the state is created
+    block_rows : int
+        Rows processed per block
+    
+    Returns:
+    --------
+    CompositeAccumulator
+    """
+    
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        state = CompositeAccumulator.open(path)
+    else:
+        if shape is None or n_bands is None:
+            first = scenes[0]
+            if isinstance(first, str):
+                import rasterio
+                
+                with rasterio.open(first) as src:
+                    shape, n_bands = (src.height, src.width), src.count
+            else:
+                array = np.asarray(first[1])
+                shape, n_bands = array.shape[-2:], (array.shape[0] if array.ndim == 3 else 1)
+        state = CompositeAccumulator.create(path, shape, n_bands, reservoir_size, nodata)
+    
+    added = state.update(scenes, block_rows)
+    print(f'Added {len(added)} new scenes ({len(state.scenes)} in the composite)')
+    
+    return state
@@ -0,0 +1,307 @@
+"""
+Content-Addressed Composite Cache
+Reuse seasonal composites across notebooks and days
+
+A composite is identified by what produced it: the AOI geometry (hashed),
+year, season, cloud threshold, cloud masking method and any further
+parameters, such as a digest of the input scenes (scenes_hash). The raster is
+stored once under that key as a tiled, compressed GeoTIFF, and a SQLite
+index records its size and last access so the cache can evict the least
+recently used composites when it grows beyond a size budget.
+
+Usage:
+    cache = CompositeCache('composite_cache', max_gb=20)
+    path = create_seasonal_composite(scenes, 2024, 'dry', cache=cache)  # composite_local.py
+    cache.invalidate(year=2024, season='dry')
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Cloud masking method recorded in cache keys by default
+DEFAULT_MASK_METHOD = 'QA60'
+
+
+def aoi_hash(aoi):
+    """
+    Stable hash of an AOI
+    
+    Parameters:
+    -----------
+    aoi : ee.Geometry, dict, list or None
+        Earth Engine geometry (hashed from its serialization), GeoJSON dict,
+        [min_lon, min_lat, max_lon, max_lat] bounds, or None (whole archive)
+    
+    Returns:
+    --------
+    str : Hex digest
+    """
+    
+    if aoi is None:
+        text = 'all'
+    elif hasattr(aoi, 'serialize'):
+        text = aoi.serialize()
+    elif isinstance(aoi, dict):
+        text = json.dumps(aoi, sort_keys=True)
+    else:
+        # Round bounds so float noise does not change the key
+        text = json.dumps([round(float(value), 7) for value in aoi])
+    
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def scenes_hash(paths):
+    """
+    Hash of the input scene files (path, size and modification time)
+    
+    Adding, removing or rewriting a scene changes the hash, so a composite
+    keyed on it is rebuilt instead of served stale.
+    
+    Returns:
+    --------
+    str : Hex digest
+    """
+    
+    files = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        files.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    
+    return hashlib.sha256(json.dumps(files).encode('utf-8')).hexdigest()
+
+
+class CompositeCache:
+    """
+    On-disk composite cache with LRU eviction under a size budget
+    
+    Parameters:
+    -----------
+    directory : str
+        Cache folder (rasters and index.sqlite)
+    max_gb : float
+        Total size budget; least recently used composites are evicted
+        beyond it
+    """
+    
+    def __init__(self, directory, max_gb=20):
+        self.directory = directory
+        self.max_bytes = int(max_gb * 2 ** 30)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'),
+                                   check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS composites ('
+            'key TEXT PRIMARY KEY, path TEXT, size INTEGER, created REAL, last_access REAL, '
+            'aoi_hash TEXT, year INTEGER, season TEXT, cloud_threshold REAL, mask_method TEXT, '
+            'params TEXT)'
+        )
+        self._db.commit()
+    
+    @staticmethod
+    def key(aoi, year, season, cloud_threshold, mask_method=DEFAULT_MASK_METHOD, **params):
+        """
+        Cache key and index fields for a composite
+        
+        Extra keyword parameters (e.g., bands, scale) become part of the key.
+        """
+        
+        fields = {
+            'aoi_hash': aoi_hash(aoi),
+            'year': int(year),
+            'season': season,
+            'cloud_threshold': float(cloud_threshold),
+            'mask_method': mask_method,
+            'params': json.dumps(params, sort_keys=True, default=str)
+        }
+        digest = hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
+        
+        return digest, fields
+    
+    def get(self, aoi, year, season, cloud_threshold, mask_method=DEFAULT_MASK_METHOD, **params):
+        """
+        Path of a cached composite, or None on a miss
+        
+        Returns:
+        --------
+        str or None
+        """
+        
+        key, _ = self.key(aoi, year, season, cloud_threshold, mask_method, **params)
+        
+        with self._lock:
+            row = self._db.execute('SELECT path FROM composites WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None or not os.path.exists(row[0]):
+                if row is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+            
+            self.hits += 1
+            self._db.execute('UPDATE composites SET last_access = ? WHERE key = ?',
+                             (time.time(), key))
+            self._db.commit()
+            return row[0]
+    
+    def put(self, raster_path, aoi, year, season, cloud_threshold,
+            mask_method=DEFAULT_MASK_METHOD, move=False, **params):
+        """
+        Store a composite raster under its key
+        
+        The raster is rewritten as a tiled, DEFLATE-compressed GeoTIFF
+        unless move=True, in which case an already tiled file is moved in
+        as is.
+        
+        Returns:
+        --------
+        str : Path of the cached raster
+        """
+        
+        key, fields = self.key(aoi, year, season, cloud_threshold, mask_method, **params)
+        path = os.path.join(self.directory, f'{key}.tif')
+        
+        if move:
+            shutil.move(raster_path, path)
+        else:
+            import rasterio
+            import rasterio.shutil
+            
+            with rasterio.open(raster_path) as src:
+                rasterio.shutil.copy(src, path, driver='GTiff', tiled=True, blockxsize=512,
+                                     blockysize=512, compress='DEFLATE')
+        
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO composites VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, path, os.path.getsize(path), now, now, fields['aoi_hash'], fields['year'],
+                 fields['season'], fields['cloud_threshold'], fields['mask_method'],
+                 fields['params'])
+            )
+            self._db.commit()
+            self.evict(keep=key)
+        
+        return path
+    
+    def get_or_create(self, create, aoi, year, season, cloud_threshold,
+                      mask_method=DEFAULT_MASK_METHOD, **params):
+        """
+        Cached composite path, calling create(output_path) on a miss
+        
+        create must write a tiled GeoTIFF to the output path it is given.
+        If it raises, the partial file is removed.
+        """
+        
+        path = self.get(aoi, year, season, cloud_threshold, mask_method, **params)
+        if path is not None:
+            print(f'Composite cache hit: {season} {year}')
+            return path
+        
+        key, _ = self.key(aoi, year, season, cloud_threshold, mask_method, **params)
+        partial_path = os.path.join(self.directory, f'{key}.partial.tif')
+        try:
+            output_path = create(partial_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        
+        return self.put(output_path, aoi, year, season, cloud_threshold, mask_method,
+                        move=True, **params)
+    
+    def _delete(self, key):
+        row = self._db.execute('SELECT path FROM composites WHERE key = ?', (key,)).fetchone()
+        if row is not None and os.path.exists(row[0]):
+            os.remove(row[0])
+        self._db.execute('DELETE FROM composites WHERE key = ?', (key,))
+    
+    def evict(self, keep=None):
+        """
+        Delete least recently used composites until the cache fits its budget
+        
+        Returns:
+        --------
+        int : Number of evicted composites
+        """
+        
+        evicted = 0
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT key, size FROM composites ORDER BY last_access'
+            ).fetchall()
+            total = sum(size for _, size in rows)
+            
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._delete(key)
+                total -= size
+                evicted += 1
+            
+            self._db.commit()
+        
+        return evicted
+    
+    def invalidate(self, aoi=None, year=None, season=None, cloud_threshold=None,
+                   mask_method=None):
+        """
+        Delete cached composites matching all given fields
+        
+        invalidate() without arguments empties the cache.
+        
+        Returns:
+        --------
+        int : Number of deleted composites
+        """
+        
+        conditions, values = [], []
+        for column, value in [('aoi_hash', aoi_hash(aoi) if aoi is not None else None),
+                              ('year', year), ('season', season),
+                              ('cloud_threshold', cloud_threshold),
+                              ('mask_method', mask_method)]:
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                values.append(value)
+        
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        with self._lock:
+            keys = [row[0] for row in
+                    self._db.execute(f'SELECT key FROM composites{where}', values).fetchall()]
+            for key in keys:
+                self._delete(key)
+            self._db.commit()
+        
+        return len(keys)
+    
+    def stats(self):
+        """
+        Cache usage
+        
+        Returns:
+        --------
+        dict : entries, total_gb, max_gb, hits, misses
+        """
+        
+        with self._lock:
+            entries, total = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM composites'
+            ).fetchone()
+        
+        return {
+            'entries': entries,
+            'total_gb': round(total / 2 ** 30, 3),
+            'max_gb': round(self.max_bytes / 2 ** 30, 3),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,740 @@
+"""
+Local Median Compositing Engine (NumPy / rasterio)
+Memory-bounded seasonal composites from a local Sentinel-2 archive
+
+np.nanmedian on a full (time, band, y, x) float64 stack needs tens of GB
+for a dry season over Palawan. Here scenes stay uint16 with a nodata
+sentinel and are streamed tile by tile; the tile size is chosen so that
+the stack of one tile fits under a user-set memory cap. Medians are exact:
+pixels are grouped by their number of valid observations and each group
+is reduced with np.partition instead of a full sort.
+
+Semantics follow ImageCollection.median() in Earth Engine: masked
+(nodata) observations are ignored, an even number of valid observations
+gives the mean of the two middle values, and pixels without any valid
+observation stay masked.
+
+Usage:
+    composite = median_composite(['S2_20240112.tif', 'S2_20240127.tif', ...],
+                                 memory_limit_mb=2048, output_path='dry_2024.tif')
+"""
+
+import inspect
+import math
+import os
+import shutil
+import tempfile
+import time
+from contextlib import ExitStack
+
+import numpy as np
+
+from cloud_mask import REFLECTANCE_OFFSET
+from seasons import season_date_range
+
+# Sentinel-2 L2A nodata value
+NODATA = 0
+
+
+def masked_order_statistics(stack, ranks, nodata=NODATA):
+    """
+    Exact order statistics along the time axis, ignoring nodata
+    
+    Pixels are grouped by their count of valid observations n; each group
+    is reduced with one np.partition call at the requested ranks.
+    
+    Parameters:
+    -----------
+    stack : numpy.ndarray
+        (time, ...) integer array with nodata marking masked observations
+    ranks : callable
+        Maps a valid count n to a list of (lower, upper, weight) ranks;
+        each statistic is value[lower] + weight * (value[upper] - value[lower])
+    nodata : int
+        Value marking masked observations
+    
+    Returns:
+    --------
+    tuple : (list of float64 arrays of shape stack.shape[1:], NaN where no
+    valid observation; valid counts)
+    """
+    
+    n_times = stack.shape[0]
+    flat = stack.reshape(n_times, -1)
+    valid = flat != nodata
+    counts = valid.sum(axis=0)
+    
+    # Masked observations sort to the end of every pixel's series
+    fill = np.iinfo(flat.dtype).max if flat.dtype.kind in 'ui' else np.inf
+    work = np.where(valid, flat, fill)
+    
+    results = [np.full(flat.shape[1], np.nan) for _ in ranks(1)]
+    
+    for n in np.unique(counts):
+        if n == 0:
+            continue
+        columns = np.flatnonzero(counts == n)
+        stats = ranks(int(n))
+        kth = sorted({k for lower, upper, _ in stats for k in (lower, upper)})
+        part = np.partition(work[:, columns], kth, axis=0)
+        
+        for result, (lower, upper, weight) in zip(results, stats):
+            low = part[lower].astype(np.float64)
+            result[columns] = low + weight * (part[upper] - low)
+    
+    shape = stack.shape[1:]
+    return [result.reshape(shape) for result in results], counts.reshape(shape)
+
+
+def _median_ranks(n):
+    """Middle rank(s): the mean of the two middle values for even counts"""
+    
+    return [((n - 1) // 2, n // 2, 0.5)]
+
+
+def masked_median(stack, nodata=NODATA):
+    """
+    Exact median along the time axis, ignoring nodata observations
+    
+    Parameters:
+    -----------
+    stack : numpy.ndarray
+        (time, ...) uint16 stack (e.g., time, band, rows, cols)
+    nodata : int
+        Value marking masked observations
+    
+    Returns:
+    --------
+    tuple : (median as float64 with NaN where no valid observation,
+    valid observation counts)
+    """
+    
+    (median,), counts = masked_order_statistics(stack, _median_ranks, nodata)
+    return median, counts
+
+
+def tile_size_for_memory(n_scenes, n_bands, memory_limit_mb, itemsize=2):
+    """
+    Largest square tile whose stack fits under the memory cap
+    
+    Budget per pixel: the uint16 stack, its masked working copy, one
+    partitioned group and a float64 output per band.
+    """
+    
+    bytes_per_pixel = 3 * n_scenes * n_bands * itemsize + 8 * n_bands
+    side = int(math.sqrt(memory_limit_mb * 2 ** 20 / bytes_per_pixel))
+    
+    return max(16, side // 16 * 16)
+
+
+def _scene_reader(stack, scene, bands, mask_band=None, mask_method='QA60', nodata=NODATA):
+    """
+    Window reader for one scene: (read(window), (rows, cols), n_bands, dataset)
+    
+    With mask_band (1-based index of a QA60 or SCL band), cloudy pixels are
+    set to nodata through the cloud_mask lookup table and the mask band is
+    left out of the default bands.
+    """
+    
+    if isinstance(scene, str):
+        import rasterio
+        
+        src = stack.enter_context(rasterio.open(scene))
+        indexes = bands or [band for band in range(1, src.count + 1) if band != mask_band]
+        def read_bands(window):
+            return src.read(indexes, window=window)
+        def read_qa(window):
+            return src.read(mask_band, window=window)
+        shape, n_bands = (src.height, src.width), len(indexes)
+    else:
+        src = None
+        array = np.asarray(scene)
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        indexes = bands or [band for band in range(1, array.shape[0] + 1) if band != mask_band]
+        offsets = [band - 1 for band in indexes]
+        def read_bands(window):
+            # Only the window is copied (array may be memory-mapped)
+            return array[(offsets,) + window.toslices()]
+        def read_qa(window):
+            return array[mask_band - 1][window.toslices()]
+        shape, n_bands = array.shape[1:], len(indexes)
+    
+    if mask_band is None:
+        return read_bands, shape, n_bands, src
+    
+    from cloud_mask import apply_mask
+    
+    def read(window):
+        return apply_mask(read_bands(window), read_qa(window), mask_method, nodata)
+    
+    return read, shape, n_bands, src
+
+
+def median_composite(scenes, bands=None, nodata=NODATA, memory_limit_mb=1024, output_path=None,
+                     dtype='float32', mask_band=None, mask_method='QA60', scale_factor=None,
+                     workers=1, timings=None):
+    """
+    Median composite of aligned scenes, streamed tile by tile
+    
+    Parameters:
+    -----------
+    scenes : list
+        Aligned multi-band GeoTIFF paths or (bands, rows, cols) uint16
+        arrays, with nodata marking cloud-masked or missing pixels
+    bands : list
+        1-based band indexes to composite (default: all)
+    nodata : int
+        Value marking masked pixels in the inputs (and the output)
+    memory_limit_mb : float
+        Memory cap for one tile's stack (sets the tile size)
+    output_path : str
+        Optional tiled, compressed GeoTIFF to write (GeoTIFF inputs only)
+    dtype : str
+        Output type: 'float32' (exact; even counts can give .5) or
+        'uint16' (rounded half up)
+    mask_band : int
+        Optional 1-based index of a QA60 or SCL band used to mask clouds
+        while reading (for scenes that are not masked yet)
+    mask_method : str
+        'QA60' or 'SCL' (see cloud_mask.py)
+    scale_factor : float
+        Optional DN to reflectance scale (e.g., cloud_mask.REFLECTANCE_SCALE)
+        written with REFLECTANCE_OFFSET to the output band metadata; the
+        values themselves stay DN
+    workers : int
+        Processes compositing tiles in parallel (None: all cores); the
+        memory cap is shared between them
+    timings : list
+        Optional list that receives one timing record per tile (parallel
+        runs only)
+    
+    Returns:
+    --------
+    numpy.ma.MaskedArray (bands, rows, cols), masked where no scene has a
+    valid observation, or output_path when given
+    """
+    
+    from change_detection_tiled import iter_windows
+    
+    if not scenes:
+        raise ValueError('No scenes to composite')
+    
+    if workers is None or workers > 1:
+        return _parallel_median_composite(scenes, bands, nodata, memory_limit_mb, output_path,
+                                          dtype, mask_band, mask_method, scale_factor,
+                                          workers or os.cpu_count(), timings)
+    
+    with ExitStack() as stack:
+        readers = [_scene_reader(stack, scene, bands, mask_band, mask_method, nodata)
+                   for scene in scenes]
+        grids = {(shape, n_bands) for _, shape, n_bands, _ in readers}
+        if len(grids) > 1:
+            raise ValueError('Scenes must share the same dimensions and band count')
+        (height, width), n_bands = grids.pop()
+        
+        tile = tile_size_for_memory(len(scenes), n_bands, memory_limit_mb)
+        
+        dst = None
+        if output_path:
+            dst = stack.enter_context(_open_output(readers[0][3], output_path, n_bands,
+                                                   dtype, nodata))
+            if scale_factor is not None:
+                dst.scales = [scale_factor] * n_bands
+                dst.offsets = [REFLECTANCE_OFFSET] * n_bands
+        else:
+            result = np.full((n_bands, height, width), nodata, dtype=dtype)
+            valid = np.zeros((n_bands, height, width), dtype=bool)
+        
+        for window in iter_windows(height, width, tile):
+            block = np.stack([read(window) for read, _, _, _ in readers])
+            median, counts = masked_median(block, nodata)
+            out = _to_output(median, dtype, nodata)
+            
+            if dst is not None:
+                dst.write(out, window=window)
+            else:
+                rows, cols = window.toslices()
+                result[:, rows, cols] = out
+                valid[:, rows, cols] = counts > 0
+    
+    if output_path:
+        return output_path
+    return np.ma.array(result, mask=~valid, fill_value=nodata)
+
+
+# Per-process state of parallel compositing workers (set by _init_composite_worker)
+_WORKER = {}
+
+
+def _init_composite_worker(sources, bands, mask_band, mask_method, nodata, dtype, result_path,
+                           valid_path):
+    """Open the scenes (and the shared result arrays, if any) once per worker process"""
+    
+    stack = ExitStack()
+    readers = []
+    for source in sources:
+        if isinstance(source, tuple):
+            # In-memory scene passed through the memory-mapped scene stack
+            path, index = source
+            source = np.load(path, mmap_mode='r')[index]
+        readers.append(_scene_reader(stack, source, bands, mask_band, mask_method, nodata)[0])
+    
+    _WORKER.update(
+        stack=stack,
+        readers=readers,
+        nodata=nodata,
+        dtype=dtype,
+        result=np.load(result_path, mmap_mode='r+') if result_path else None,
+        valid=np.load(valid_path, mmap_mode='r+') if valid_path else None
+    )
+
+
+def _composite_tile(task):
+    """
+    Composite one tile and time its steps
+    
+    The tile goes into the shared result array when there is one;
+    otherwise it is returned for the parent to write to the GeoTIFF.
+    """
+    
+    from rasterio.windows import Window
+    
+    tile_id, (col_off, row_off, width, height) = task
+    window = Window(col_off, row_off, width, height)
+    rows, cols = window.toslices()
+    
+    start = time.perf_counter()
+    block = np.stack([read(window) for read in _WORKER['readers']])
+    read_done = time.perf_counter()
+    median, counts = masked_median(block, _WORKER['nodata'])
+    out = _to_output(median, _WORKER['dtype'], _WORKER['nodata'])
+    compute_done = time.perf_counter()
+    if _WORKER['result'] is not None:
+        _WORKER['result'][:, rows, cols] = out
+        _WORKER['valid'][:, rows, cols] = counts > 0
+        out = None
+    
+    record = {
+        'tile': tile_id,
+        'row_off': row_off,
+        'col_off': col_off,
+        'rows': height,
+        'cols': width,
+        'read_s': read_done - start,
+        'compute_s': compute_done - read_done,
+        'write_s': time.perf_counter() - compute_done,
+        'pid': os.getpid()
+    }
+    
+    return record, out
+
+
+def _parallel_median_composite(scenes, bands, nodata, memory_limit_mb, output_path, dtype,
+                               mask_band, mask_method, scale_factor, workers, timings):
+    """
+    median_composite on a process pool
+    
+    Workers read their tiles straight from the GeoTIFFs (in-memory scenes
+    are first written to one memory-mapped stack), so no input pixels are
+    pickled. With output_path, each finished tile is sent back and the
+    parent writes it straight into the output GeoTIFF, so no full-size
+    scratch array exists. Otherwise workers write into a memory-mapped
+    result that becomes the returned array.
+    """
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    from change_detection_tiled import iter_windows
+    
+    output_dir = os.path.dirname(os.path.abspath(output_path)) if output_path else None
+    workdir = tempfile.mkdtemp(prefix='composite_', dir=output_dir)
+    
+    try:
+        with ExitStack() as stack:
+            readers = [_scene_reader(stack, scene, bands, mask_band, mask_method, nodata)
+                       for scene in scenes]
+            grids = {(shape, n_bands) for _, shape, n_bands, _ in readers}
+            if len(grids) > 1:
+                raise ValueError('Scenes must share the same dimensions and band count')
+            (height, width), n_bands = grids.pop()
+            
+            # In-memory scenes: one memory-mapped stack shared by all workers
+            sources = list(scenes)
+            in_memory = [i for i, scene in enumerate(scenes) if not isinstance(scene, str)]
+            if in_memory:
+                first = np.asarray(scenes[in_memory[0]])
+                scene_shape = first.shape if first.ndim == 3 else (1,) + first.shape
+                stack_path = os.path.join(workdir, 'scenes.npy')
+                scene_stack = np.lib.format.open_memmap(stack_path, mode='w+', dtype=first.dtype,
+                                                        shape=(len(in_memory),) + scene_shape)
+                for position, i in enumerate(in_memory):
+                    scene_stack[position] = np.asarray(scenes[i]).reshape(scene_shape)
+                    sources[i] = (stack_path, position)
+                scene_stack.flush()
+                del scene_stack
+            
+            # Shared result arrays only when an in-memory composite is returned
+            result_path = valid_path = None
+            if not output_path:
+                result_path = os.path.join(workdir, 'result.npy')
+                valid_path = os.path.join(workdir, 'valid.npy')
+                for path, array_dtype in [(result_path, dtype), (valid_path, bool)]:
+                    np.lib.format.open_memmap(path, mode='w+', dtype=array_dtype,
+                                              shape=(n_bands, height, width)).flush()
+            
+            dst = None
+            if output_path:
+                dst = stack.enter_context(_open_output(readers[0][3], output_path, n_bands,
+                                                       dtype, nodata))
+                if scale_factor is not None:
+                    dst.scales = [scale_factor] * n_bands
+                    dst.offsets = [REFLECTANCE_OFFSET] * n_bands
+            
+            # The memory cap is shared; keep at least 4 tiles per worker
+            tile = tile_size_for_memory(len(scenes), n_bands, memory_limit_mb / workers)
+            tile = min(tile, max(16, int(math.sqrt(height * width / (4 * workers))) // 16 * 16))
+            windows = list(iter_windows(height, width, tile))
+            
+            start = time.perf_counter()
+            records = []
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_composite_worker,
+                                     initargs=(sources, bands, mask_band, mask_method, nodata,
+                                               dtype, result_path, valid_path)) as executor:
+                futures = [executor.submit(_composite_tile, (i, (w.col_off, w.row_off,
+                                                                 w.width, w.height)))
+                           for i, w in enumerate(windows)]
+                for future in as_completed(futures):
+                    record, out = future.result()
+                    if dst is not None:
+                        write_start = time.perf_counter()
+                        dst.write(out, window=windows[record['tile']])
+                        record['write_s'] += time.perf_counter() - write_start
+                    records.append(record)
+            elapsed = time.perf_counter() - start
+            
+            records.sort(key=lambda record: record['tile'])
+            if timings is not None:
+                timings.extend(records)
+            busy = sum(r['read_s'] + r['compute_s'] + r['write_s'] for r in records)
+            print(f'Composited {len(windows)} tiles of {tile} px on {workers} workers: '
+                  f'{elapsed:.1f} s wall, {busy:.1f} s tile time '
+                  f'({busy / max(elapsed, 1e-9):.1f} tiles in flight on average)')
+            
+            if not output_path:
+                composite = np.ma.array(np.load(result_path), mask=~np.load(valid_path),
+                                        fill_value=nodata)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if output_path:
+        return output_path
+    return composite
+
+
+def _to_output(median, dtype, nodata):
+    """Cast medians to the output type, writing nodata where undefined"""
+    
+    missing = np.isnan(median)
+    if np.dtype(dtype).kind in 'ui':
+        median = np.floor(median + 0.5)
+    return np.where(missing, nodata, median).astype(dtype)
+
+
+def _open_output(template, output_path, n_bands, dtype, nodata):
+    """Tiled, compressed output GeoTIFF on the template scene's grid"""
+    
+    import rasterio
+    
+    if template is None:
+        raise ValueError('output_path needs GeoTIFF scenes (for the grid and CRS)')
+    
+    profile = template.profile.copy()
+    profile.update(driver='GTiff', count=n_bands, dtype=dtype, nodata=nodata, tiled=True,
+                   blockxsize=512, blockysize=512, compress='DEFLATE')
+    if np.dtype(dtype).kind == 'f':
+        profile['predictor'] = 3
+    
+    return rasterio.open(output_path, 'w', **profile)
+
+
+def _percentile_ranks(percentiles):
+    """Rank function for percentiles, interpolated linearly between ranks (as np.percentile)"""
+    
+    def ranks(n):
+        stats = []
+        for percentile in percentiles:
+            position = percentile / 100 * (n - 1)
+            lower = int(math.floor(position))
+            stats.append((lower, min(lower + 1, n - 1), position - lower))
+        return stats
+    
+    return ranks
+
+
+def temporal_metrics(scenes, band_names=None, percentiles=[25, 75], nodata=NODATA,
+                     memory_limit_mb=1024, output_path=None, mask_band=None, mask_method='QA60',
+                     scale_factor=None):
+    """
+    Temporal mean, std, min, max and percentiles in one chunked sweep
+    
+    Each tile's stack is read once; all statistics are computed from it
+    before the next tile is read.
+    
+    Parameters:
+    -----------
+    scenes : list
+        Aligned GeoTIFF paths or (bands, rows, cols) uint16 arrays
+    band_names : list
+        Names for the output bands (default: b1, b2, ...)
+    percentiles : list
+        Percentiles to compute (0-100)
+    nodata : int
+        Value marking masked observations
+    memory_limit_mb : float
+        Memory cap for one tile's stack
+    output_path : str
+        Optional float32 GeoTIFF (GeoTIFF inputs only), bands ordered as in
+        calculate_temporal_metrics: all means, all stds, min, max, percentiles
+    mask_band, mask_method :
+        Optional cloud masking while reading (as in median_composite)
+    scale_factor : float
+        Optional DN to reflectance scale for the output band metadata
+        (std bands get no offset)
+    
+    Returns:
+    --------
+    dict : {metric: numpy.ma.MaskedArray (bands, rows, cols)} with metrics
+    'mean', 'std' (population, as ee.Reducer.stdDev), 'min', 'max' and
+    'p25', 'p75', ..., or output_path when given
+    """
+    
+    from change_detection_tiled import iter_windows
+    
+    metrics = ['mean', 'std', 'min', 'max'] + [f'p{p}' for p in percentiles]
+    
+    with ExitStack() as stack:
+        readers = [_scene_reader(stack, scene, None, mask_band, mask_method, nodata)
+                   for scene in scenes]
+        grids = {(shape, n_bands) for _, shape, n_bands, _ in readers}
+        if len(grids) > 1:
+            raise ValueError('Scenes must share the same dimensions and band count')
+        (height, width), n_bands = grids.pop()
+        band_names = band_names or [f'b{i + 1}' for i in range(n_bands)]
+        
+        # Room for the float64 working sums next to the stack
+        tile = tile_size_for_memory(len(scenes) + 4, n_bands, memory_limit_mb)
+        
+        dst = None
+        if output_path:
+            dst = stack.enter_context(_open_output(readers[0][3], output_path,
+                                                   len(metrics) * n_bands, 'float32', np.nan))
+            dst.descriptions = tuple(f'{band}_{metric}' for metric in metrics
+                                     for band in band_names)
+            if scale_factor is not None:
+                dst.scales = [scale_factor] * len(metrics) * n_bands
+                dst.offsets = [0 if metric == 'std' else REFLECTANCE_OFFSET
+                               for metric in metrics for _ in band_names]
+        else:
+            results = {metric: np.full((n_bands, height, width), np.nan, dtype=np.float32)
+                       for metric in metrics}
+        
+        for window in iter_windows(height, width, tile):
+            block = np.stack([read(window) for read, _, _, _ in readers])
+            values = _tile_metrics(block, percentiles, nodata)
+            
+            if dst is not None:
+                dst.write(np.concatenate([values[metric] for metric in metrics]), window=window)
+            else:
+                rows, cols = window.toslices()
+                for metric in metrics:
+                    results[metric][:, rows, cols] = values[metric]
+    
+    if output_path:
+        return output_path
+    return {metric: np.ma.masked_invalid(values) for metric, values in results.items()}
+
+
+def _tile_metrics(block, percentiles, nodata):
+    """All temporal metrics of one (time, bands, rows, cols) tile"""
+    
+    valid = block != nodata
+    count = valid.sum(axis=0)
+    n = np.maximum(count, 1)
+    
+    # Accumulate scene by scene to avoid a float64 copy of the stack
+    total = np.zeros(block.shape[1:])
+    for scene, scene_valid in zip(block, valid):
+        total += np.where(scene_valid, scene, 0)
+    mean = total / n
+    
+    squares = np.zeros(block.shape[1:])
+    for scene, scene_valid in zip(block, valid):
+        squares += np.where(scene_valid, scene - mean, 0) ** 2
+    
+    fill = np.iinfo(block.dtype).max
+    values = {
+        'mean': mean,
+        'std': np.sqrt(squares / n),
+        'min': np.where(valid, block, fill).min(axis=0).astype(np.float64),
+        'max': np.where(valid, block, 0).max(axis=0).astype(np.float64)
+    }
+    
+    order_stats, _ = masked_order_statistics(block, _percentile_ranks(percentiles), nodata)
+    for percentile, result in zip(percentiles, order_stats):
+        values[f'p{percentile}'] = result
+    
+    missing = count == 0
+    return {metric: np.where(missing, np.nan, result).astype(np.float32)
+            for metric, result in values.items()}
+
+
+def filter_scenes(scenes, start_date, end_date, cloud_threshold=None, bounds=None):
+    """
+    Local equivalent of filterBounds().filterDate().filter(CLOUDY_PIXEL_PERCENTAGE < t)
+    
+    Parameters:
+    -----------
+    scenes : list of dict or SceneCatalog
+        Scene records with 'path', 'date' ('YYYY-MM-DD'), 'cloud'
+        (CLOUDY_PIXEL_PERCENTAGE) and optionally 'bounds'
+        ([min_lon, min_lat, max_lon, max_lat]), or a scene_catalog.py
+        catalog answering the filters from its indexes
+    start_date, end_date : str
+        Date range (end exclusive, as in filterDate)
+    cloud_threshold : float
+        Keep scenes with cloud percentage below this value
+    bounds : list
+        Keep scenes whose footprint intersects this box
+    
+    Returns:
+    --------
+    list of dict : Matching records sorted by date
+    """
+    
+    if hasattr(scenes, 'query'):
+        return scenes.query(start_date, end_date, cloud_threshold, bounds)
+    
+    def intersects(a, b):
+        return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+    
+    selected = [
+        scene for scene in scenes
+        if start_date <= scene['date'] < end_date
+        and (cloud_threshold is None or scene['cloud'] < cloud_threshold)
+        and (bounds is None or 'bounds' not in scene or intersects(scene['bounds'], bounds))
+    ]
+    
+    return sorted(selected, key=lambda scene: scene['date'])
+
+
+def create_seasonal_composite(scenes, year, season='dry', cloud_threshold=20, bounds=None,
+                              cache=None, mask_method='QA60', **kwargs):
+    """
+    Local counterpart of create_seasonal_composite in temporal_composite_template.py
+    
+    Parameters:
+    -----------
+    scenes : list of dict
+        Scene records (see filter_scenes) pointing to aligned, cloud-masked
+        GeoTIFFs
+    year : int
+        Year to process
+    season : str
+        'dry' (Jan-May) or 'wet' (Jun-Nov)
+    cloud_threshold : int
+        Maximum cloud percentage
+    bounds : list
+        Optional AOI box for the footprint filter
+    cache : CompositeCache
+        Optional on-disk cache (see composite_cache.py); a hit returns the
+        cached GeoTIFF path without reading any scene. The key covers every
+        parameter that changes the output and the selected scene files
+        (path, size, modification time), so new or rewritten scenes
+        produce a new composite
+    mask_method : str
+        How the scenes were cloud-masked (part of the cache key); also used
+        to mask them while reading when mask_band is passed
+    **kwargs
+        Passed to median_composite (bands, memory_limit_mb, output_path,
+        workers, ...)
+    
+    Returns:
+    --------
+    Result of median_composite, or the cached GeoTIFF path when a cache
+    is given
+    """
+    
+    start_date, end_date = season_date_range(year, season)
+    selected = filter_scenes(scenes, start_date, end_date, cloud_threshold, bounds)
+    if not selected:
+        raise ValueError(f'No scenes for the {season} season of {year} below '
+                         f'{cloud_threshold}% cloud')
+    paths = [scene['path'] for scene in selected]
+    
+    def composite(output_path=None):
+        print(f'Compositing {len(selected)} scenes ({season} season {year})')
+        
+        if output_path is not None:
+            kwargs['output_path'] = output_path
+        return median_composite(paths, mask_method=mask_method, **kwargs)
+    
+    if cache is None:
+        return composite()
+    
+    from composite_cache import scenes_hash
+    
+    kwargs.pop('output_path', None)
+    
+    # Every median_composite parameter that changes the output (explicit
+    # defaults and omitted ones give the same key), plus the scene files
+    params = {name: parameter.default for name, parameter
+              in inspect.signature(median_composite).parameters.items()
+              if parameter.default is not inspect.Parameter.empty}
+    params.update(kwargs)
+    for name in ['output_path', 'mask_method', 'memory_limit_mb', 'workers', 'timings']:
+        params.pop(name)
+    
+    return cache.get_or_create(composite, bounds, year, season, cloud_threshold, mask_method,
+                               scenes=scenes_hash(paths), **params)
+
+
+def calculate_temporal_metrics(scenes, year, band_names=None, percentiles=[25, 75],
+                               cloud_threshold=30, bounds=None, **kwargs):
+    """
+    Local counterpart of calculate_temporal_metrics: metrics over one year
+    
+    Returns:
+    --------
+    Result of temporal_metrics
+    """
+    
+    selected = filter_scenes(scenes, f'{year}-01-01', f'{year}-12-31', cloud_threshold, bounds)
+    if not selected:
+        raise ValueError(f'No scenes in {year} below {cloud_threshold}% cloud')
+    
+    return temporal_metrics([scene['path'] for scene in selected], band_names, percentiles,
+                            **kwargs)
+
+
+def create_multi_year_stack(scenes, years, season='dry', cloud_threshold=20, bounds=None,
+                            cache=None, **kwargs):
+    """
+    Local counterpart of create_multi_year_stack: one composite per year
+    
+    Returns:
+    --------
+    dict : {year: composite} (arrays, or GeoTIFF paths with a cache or
+    output_path)
+    """
+    
+    stack = {}
+    for year in years:
+        year_kwargs = dict(kwargs)
+        if 'output_path' in kwargs:
+            root, ext = os.path.splitext(kwargs['output_path'])
+            year_kwargs['output_path'] = f'{root}_{year}{ext}'
+        stack[year] = create_seasonal_composite(scenes, year, season, cloud_threshold, bounds,
+                                                cache=cache, **year_kwargs)
+    
+    return stack
@@ -0,0 +1,93 @@
+"""
+Concurrent getInfo() Helper for Google Earth Engine
+Run independent blocking requests in parallel with retry on quota errors
+
+getInfo() blocks until the server answers, so a loop over N reductions
+takes the sum of N latencies. Submitting them to a thread pool makes the
+loop take roughly as long as the slowest request instead. Results are
+returned in the order the objects were given.
+
+Usage:
+    areas = get_info_many([area_1, area_2, area_3], max_workers=8)
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+from area_stats_cache import get_info
+
+# Error message fragments that mean "slow down and try again"
+QUOTA_ERROR_MARKERS = ['quota', 'too many', 'rate limit', '429', 'concurrent']
+
+
+def is_quota_error(error):
+    """True for Earth Engine errors caused by quota or rate limits"""
+    
+    message = str(error).lower()
+    return isinstance(error, ee.EEException) and any(
+        marker in message for marker in QUOTA_ERROR_MARKERS
+    )
+
+
+def get_info_with_retry(computed_object, cache=None, max_retries=5, backoff=1.0):
+    """
+    getInfo() with exponential backoff on quota errors
+    
+    Parameters:
+    -----------
+    computed_object : ee.ComputedObject
+        Object to fetch
+    cache : AreaStatsCache
+        Optional shared cache (see area_stats_cache.py)
+    max_retries : int
+        Retries after the first attempt before the error is raised
+    backoff : float
+        Initial wait in seconds, doubled (with jitter) on every retry
+    
+    Returns:
+    --------
+    Result of getInfo()
+    """
+    
+    for attempt in range(max_retries + 1):
+        try:
+            return get_info(computed_object, cache)
+        except ee.EEException as error:
+            if attempt == max_retries or not is_quota_error(error):
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(1.0, 1.5))
+
+
+def get_info_many(computed_objects, max_workers=8, cache=None, max_retries=5, backoff=1.0):
+    """
+    Fetch independent Earth Engine objects concurrently
+    
+    Parameters:
+    -----------
+    computed_objects : list
+        ee.ComputedObject instances (e.g., areas from reduceRegion)
+    max_workers : int
+        Maximum requests in flight (1 = plain sequential loop)
+    cache : AreaStatsCache
+        Optional shared cache (see area_stats_cache.py)
+    max_retries : int
+        Retries per request on quota errors
+    backoff : float
+        Initial backoff in seconds
+    
+    Returns:
+    --------
+    list : getInfo() results in the same order as computed_objects
+    """
+    
+    def fetch(computed_object):
+        return get_info_with_retry(computed_object, cache, max_retries, backoff)
+    
+    if max_workers <= 1 or len(computed_objects) <= 1:
+        return [fetch(computed_object) for computed_object in computed_objects]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch, computed_objects))
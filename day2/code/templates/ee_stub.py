@@ -0,0 +1,292 @@
+"""
+Simulated Earth Engine Client (NumPy stand-in for benchmarks)
+Count the round trips a workflow makes without an Earth Engine account
+
+Implements the part of the ee API used by change_detection_template.py
+(Image band math, remap, set/get of properties, reduceRegion with sum and
+grouped sum, Number, Dictionary, List, Geometry). Expressions are evaluated eagerly on NumPy
+arrays; every getInfo() counts as one round trip and can sleep for a
+simulated network latency. Each object also records the expression that
+built it (operation name and arguments), which serialize() hashes like
+the real client serializes its expression graph, so AreaStatsCache keys
+behave as they do against Earth Engine.
+
+Usage:
+    import ee_stub
+    ee_stub.reset(latency=0.2)
+    t1 = ee_stub.image_from_array(classification_2020, 'classification')
+    ...run EE template functions with ee_stub patched in as ee...
+    print(ee_stub.ROUND_TRIPS['count'])
+"""
+
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+# Round trip counter and simulated latency per getInfo() (seconds)
+ROUND_TRIPS = {'count': 0, 'latency': 0.0}
+PIXEL_AREA = 100.0
+
+_lock = threading.Lock()
+
+
+class EEException(Exception):
+    """Stand-in for ee.EEException"""
+
+
+def reset(latency=0.0, pixel_area=100.0):
+    """Zero the round trip counter and set latency and pixel area (m²)"""
+    
+    global PIXEL_AREA
+    ROUND_TRIPS['count'] = 0
+    ROUND_TRIPS['latency'] = latency
+    PIXEL_AREA = pixel_area
+
+
+def _value(obj):
+    return obj.value if isinstance(obj, ComputedObject) else obj
+
+
+def _expression(obj):
+    """Expression tree of an argument (nested tuples of names and constants)"""
+    
+    if isinstance(obj, (ComputedObject, _SumReducer)):
+        return obj.expression
+    if isinstance(obj, dict):
+        return ('dict',) + tuple((key, _expression(obj[key])) for key in sorted(obj))
+    if isinstance(obj, (list, tuple)):
+        return ('list',) + tuple(_expression(item) for item in obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _client_value(value):
+    """Plain Python value as getInfo() would return it"""
+    
+    if isinstance(value, ComputedObject):
+        return _client_value(value.value)
+    if isinstance(value, dict):
+        return {key: _client_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_client_value(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ComputedObject:
+    def __init__(self, value=None, expression=None):
+        self.value = value
+        self.expression = expression if expression is not None else ('constant', repr(value))
+    
+    def getInfo(self):
+        with _lock:
+            ROUND_TRIPS['count'] += 1
+        if ROUND_TRIPS['latency']:
+            time.sleep(ROUND_TRIPS['latency'])
+        return _client_value(self)
+    
+    def serialize(self):
+        return hashlib.sha256(repr(self.expression).encode('utf-8')).hexdigest()
+
+
+class Number(ComputedObject):
+    def __init__(self, value):
+        expression = value.expression if isinstance(value, ComputedObject) \
+            else ('Number', _expression(value))
+        super().__init__(_value(value), expression)
+    
+    def _binary(self, other, name, result):
+        number = Number(result)
+        number.expression = (f'Number.{name}', self.expression, _expression(other))
+        return number
+    
+    def divide(self, other):
+        return self._binary(other, 'divide', self.value / _value(other))
+    
+    def multiply(self, other):
+        return self._binary(other, 'multiply', self.value * _value(other))
+    
+    def add(self, other):
+        return self._binary(other, 'add', self.value + _value(other))
+
+
+class List(ComputedObject):
+    def __init__(self, value):
+        expression = value.expression if isinstance(value, ComputedObject) \
+            else ('List', _expression(value))
+        super().__init__(list(_value(value)), expression)
+
+
+class Dictionary(ComputedObject):
+    def __init__(self, value=None, expression=None):
+        if expression is None:
+            expression = value.expression if isinstance(value, ComputedObject) \
+                else ('Dictionary', _expression(value or {}))
+        super().__init__(dict(_value(value) or {}), expression)
+    
+    def get(self, key):
+        return ComputedObject(self.value[key], ('Dictionary.get', self.expression, key))
+
+
+class Geometry(ComputedObject):
+    """AOI covering the whole simulated raster (area from the image shape)"""
+    
+    def __init__(self, shape=None):
+        super().__init__(shape, ('Geometry', _expression(shape)))
+    
+    def area(self, *args, **kwargs):
+        area = Number(float(np.prod(self.value)) * PIXEL_AREA)
+        area.expression = ('Geometry.area', self.expression, _expression(args),
+                           _expression(kwargs))
+        return area
+
+
+class Image(ComputedObject):
+    def __init__(self, bands=0, names=None, masks=None, expression=None):
+        if not isinstance(bands, list):
+            expression = ('Image.constant', _expression(bands))
+            bands, names = [np.asarray(float(_value(bands)))], ['constant']
+        self.bands = bands
+        self.names = list(names)
+        self.masks = masks or [np.asarray(True) for _ in bands]
+        # Like Earth Engine, derived images start without properties
+        self.properties = {}
+        super().__init__(None, expression)
+    
+    def _derived(self, name, bands, names, masks, *args):
+        """Image computed from this one by operation name with args"""
+        
+        return Image(bands, names, masks,
+                     (f'Image.{name}', self.expression) + tuple(_expression(arg) for arg in args))
+    
+    @staticmethod
+    def pixelArea():
+        return Image([np.asarray(PIXEL_AREA)], ['area'], expression=('Image.pixelArea',))
+    
+    @staticmethod
+    def cat(images):
+        return Image([b for image in images for b in image.bands],
+                     [n for image in images for n in image.names],
+                     [m for image in images for m in image.masks],
+                     ('Image.cat',) + tuple(image.expression for image in images))
+    
+    def _binary(self, other, name, operation):
+        if not isinstance(other, Image):
+            other = Image(other)
+        count = max(len(self.bands), len(other.bands))
+        left = self.bands * count if len(self.bands) == 1 else self.bands
+        right = other.bands * count if len(other.bands) == 1 else other.bands
+        left_masks = self.masks * count if len(self.masks) == 1 else self.masks
+        right_masks = other.masks * count if len(other.masks) == 1 else other.masks
+        names = self.names * count if len(self.names) == 1 else self.names
+        return self._derived(name, [operation(a, b) for a, b in zip(left, right)], names,
+                             [a & b for a, b in zip(left_masks, right_masks)], other)
+    
+    def eq(self, other):
+        return self._binary(other, 'eq', lambda a, b: (a == b).astype(float))
+    
+    def Or(self, other):
+        return self._binary(other, 'Or', lambda a, b: ((a != 0) | (b != 0)).astype(float))
+    
+    def And(self, other):
+        return self._binary(other, 'And', lambda a, b: ((a != 0) & (b != 0)).astype(float))
+    
+    def Not(self):
+        return self._derived('Not', [(b == 0).astype(float) for b in self.bands], self.names,
+                             self.masks)
+    
+    def multiply(self, other):
+        return self._binary(other, 'multiply', np.multiply)
+    
+    def add(self, other):
+        return self._binary(other, 'add', np.add)
+    
+    def remap(self, from_values, to_values):
+        lookup = dict(zip(from_values, to_values))
+        bands, masks = [], []
+        for band, mask in zip(self.bands, self.masks):
+            remapped = np.zeros(band.shape)
+            for old, new in lookup.items():
+                remapped[band == old] = new
+            bands.append(remapped)
+            masks.append(mask & np.isin(band, from_values))
+        return self._derived('remap', bands, ['remapped'] * len(bands), masks,
+                             from_values, to_values)
+    
+    def toUint8(self):
+        return self._derived('toUint8', self.bands, self.names, self.masks)
+    
+    def toUint16(self):
+        return self._derived('toUint16', self.bands, self.names, self.masks)
+    
+    def rename(self, *names):
+        names = names[0] if len(names) == 1 and isinstance(names[0], list) else list(names)
+        return self._derived('rename', self.bands, names, self.masks, names)
+    
+    def addBands(self, other):
+        image = Image.cat([self, other])
+        image.expression = ('Image.addBands', self.expression, other.expression)
+        return image
+    
+    def set(self, key, value):
+        image = self._derived('set', self.bands, self.names, self.masks, key, value)
+        image.properties = dict(self.properties, **{key: _value(value)})
+        return image
+    
+    def get(self, key):
+        return ComputedObject(self.properties.get(key), ('Element.get', self.expression, key))
+    
+    def clip(self, geometry):
+        return self._derived('clip', self.bands, self.names, self.masks, geometry)
+    
+    def reduceRegion(self, reducer, geometry=None, scale=None, maxPixels=None):
+        return Dictionary(reducer.apply(self), ('Image.reduceRegion', self.expression,
+                                                reducer.expression, _expression(geometry),
+                                                scale, maxPixels))
+
+
+class _SumReducer:
+    def __init__(self, group_field=None, group_name='group'):
+        self.group_field = group_field
+        self.group_name = group_name
+        self.expression = ('Reducer.sum',) if group_field is None else \
+            ('Reducer.group', ('Reducer.sum',), group_field, group_name)
+    
+    def group(self, groupField=1, groupName='group'):
+        return _SumReducer(groupField, groupName)
+    
+    def apply(self, image):
+        masks = [np.broadcast_arrays(b, m)[1] for b, m in zip(image.bands, image.masks)]
+        if self.group_field is None:
+            return {name: float(np.broadcast_arrays(band, mask)[0][mask].sum())
+                    for name, band, mask in zip(image.names, image.bands, masks)}
+        
+        values, keys = np.broadcast_arrays(image.bands[0], image.bands[self.group_field])
+        valid = masks[0] & masks[self.group_field]
+        group_keys, inverse = np.unique(keys[valid], return_inverse=True)
+        sums = np.bincount(inverse, weights=values[valid], minlength=len(group_keys))
+        return {'groups': [{self.group_name: float(key), 'sum': float(total)}
+                           for key, total in zip(group_keys, sums)]}
+
+
+class Reducer:
+    @staticmethod
+    def sum():
+        return _SumReducer()
+
+
+def image_from_array(array, band_name='classification'):
+    """Single-band stub image from a (masked) NumPy array"""
+    
+    array = np.ma.asarray(array)
+    bands, masks = array.filled(0).astype(float), ~np.ma.getmaskarray(array)
+    
+    # Stands in for the asset ID of a real image
+    digest = hashlib.sha256(bands.tobytes() + masks.tobytes()).hexdigest()
+    
+    return Image([bands], [band_name], [masks],
+                 ('Image.load', digest, list(bands.shape), band_name))
@@ -0,0 +1,392 @@
+"""
+Tiled Export Manager for Google Earth Engine
+Split large exports into a tile grid, run them with bounded concurrency,
+resume failed tiles and stitch the results into a Cloud-Optimized GeoTIFF
+
+A single 10 m export of a large AOI can time out and produces one huge
+GeoTIFF. Here the AOI's bounding box is cut into pixel-aligned tiles that
+are exported as separate tasks. At most max_concurrent tasks run at once,
+status is polled with backoff, and progress is saved to a JSON manifest so
+an interrupted run resumes where it stopped.
+
+The task service is any object with start(tile), status(task_ids) and
+local_path(tile). EarthEngineTaskService submits Export.image.toDrive
+tasks; a local fake with the same three methods can stand in for testing.
+
+Usage:
+    service = EarthEngineTaskService(change_image, 'palawan_change', download_dir='tiles')
+    manager = ExportManager(service, manifest_path='tiles/manifest.json')
+    results = manager.run(make_tile_grid(bounds, tile_size_deg=0.25))
+    stitch_tiles_to_cog(manager.tile_paths(timeout=600), 'palawan_change_cog.tif')
+
+Tasks write to Google Drive, so download_dir must be the local folder where
+that Drive folder is synced or mounted (in Colab, after
+drive.mount('/content/drive'), drive_folder_path('EO_Training')).
+"""
+
+import json
+import math
+import os
+import time
+
+import ee
+
+# Degrees per meter at the equator (for EPSG:4326 pixel sizes)
+DEGREES_PER_METER = 1 / 111320
+
+FINISHED_STATES = ['COMPLETED', 'SUCCEEDED']
+FAILED_STATES = ['FAILED', 'CANCELLED', 'CANCEL_REQUESTED']
+
+# Where drive.mount('/content/drive') puts My Drive in Colab
+DRIVE_MOUNT = '/content/drive/MyDrive'
+
+
+def drive_folder_path(folder, mount=DRIVE_MOUNT):
+    """Local path of a Google Drive export folder mounted in Colab"""
+    
+    return os.path.join(mount, folder)
+
+
+def make_tile_grid(bounds, tile_size_deg=0.25, scale=10):
+    """
+    Split a bounding box into pixel-aligned export tiles
+    
+    Parameters:
+    -----------
+    bounds : list
+        [min_lon, min_lat, max_lon, max_lat] of the AOI
+    tile_size_deg : float
+        Approximate tile size in degrees (rounded to whole pixels)
+    scale : int
+        Pixel size in meters
+    
+    Returns:
+    --------
+    list of dict : Tiles with 'tile_id', 'bbox' and 'crs_transform'
+    """
+    
+    min_lon, min_lat, max_lon, max_lat = bounds
+    pixel = scale * DEGREES_PER_METER
+    tile_pixels = max(1, int(round(tile_size_deg / pixel)))
+    
+    n_cols = math.ceil((max_lon - min_lon) / pixel)
+    n_rows = math.ceil((max_lat - min_lat) / pixel)
+    
+    tiles = []
+    for row in range(0, n_rows, tile_pixels):
+        for col in range(0, n_cols, tile_pixels):
+            west = min_lon + col * pixel
+            north = max_lat - row * pixel
+            east = min_lon + min(col + tile_pixels, n_cols) * pixel
+            south = max_lat - min(row + tile_pixels, n_rows) * pixel
+            
+            tiles.append({
+                'tile_id': f'r{row // tile_pixels:03d}_c{col // tile_pixels:03d}',
+                'bbox': [west, south, east, north],
+                # Shared pixel grid so neighboring tiles line up exactly
+                'crs_transform': [pixel, 0, min_lon, 0, -pixel, max_lat]
+            })
+    
+    return tiles
+
+
+class EarthEngineTaskService:
+    """
+    Submit and poll Export.image.toDrive tasks for export tiles
+    
+    Parameters:
+    -----------
+    image : ee.Image
+        Image to export
+    description : str
+        Export name prefix (tile IDs are appended)
+    folder : str
+        Google Drive folder
+    download_dir : str
+        Local folder where the Drive folder is synced or downloaded
+    nodata : int
+        Value written for masked pixels (None = Earth Engine default)
+    """
+    
+    def __init__(self, image, description, folder='EO_Training', download_dir='.', nodata=None):
+        self.image = image if nodata is None else image.unmask(nodata)
+        self.description = description
+        self.folder = folder
+        self.download_dir = download_dir
+        self.nodata = nodata
+    
+    def file_prefix(self, tile):
+        """Export file name (without extension) for a tile"""
+        
+        return f"{self.description}_{tile['tile_id']}"
+    
+    def start(self, tile):
+        """Start the export task for one tile and return its task ID"""
+        
+        format_options = {'cloudOptimized': True}
+        if self.nodata is not None:
+            format_options['noData'] = self.nodata
+        
+        task = ee.batch.Export.image.toDrive(
+            image=self.image,
+            description=self.file_prefix(tile),
+            folder=self.folder,
+            fileNamePrefix=self.file_prefix(tile),
+            region=ee.Geometry.Rectangle(tile['bbox'], 'EPSG:4326', False),
+            crs='EPSG:4326',
+            crsTransform=tile['crs_transform'],
+            maxPixels=1e13,
+            formatOptions=format_options
+        )
+        task.start()
+        
+        return task.id
+    
+    def status(self, task_ids):
+        """States of several tasks in one request ({task_id: state})"""
+        
+        statuses = ee.data.getTaskStatus(list(task_ids))
+        return {status['id']: status['state'] for status in statuses}
+    
+    def local_path(self, tile):
+        """Where the finished tile is expected on local disk"""
+        
+        return os.path.join(self.download_dir, self.file_prefix(tile) + '.tif')
+
+
+class ExportManager:
+    """
+    Run tile exports with bounded concurrency, backoff polling and resume
+    
+    Parameters:
+    -----------
+    service : EarthEngineTaskService
+        Task service (or a local fake with start/status/local_path)
+    max_concurrent : int
+        Maximum tasks running at the same time
+    max_attempts : int
+        Attempts per tile before it is reported as failed
+    poll_interval : float
+        Initial seconds between status polls
+    max_poll_interval : float
+        Upper bound for the poll interval as it backs off
+    manifest_path : str
+        Optional JSON file recording progress, used to resume a run
+    """
+    
+    def __init__(self, service, max_concurrent=4, max_attempts=3, poll_interval=5,
+                 max_poll_interval=120, manifest_path=None):
+        self.service = service
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.manifest_path = manifest_path
+        self.tiles = {}
+    
+    def _load_manifest(self):
+        """Previous progress ({tile_id: record}) if a manifest exists"""
+        
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {}
+    
+    def _save_manifest(self):
+        if self.manifest_path:
+            with open(self.manifest_path, 'w') as f:
+                json.dump(self.tiles, f, indent=2)
+    
+    def run(self, tiles):
+        """
+        Export all tiles and wait for them to finish
+        
+        Tiles already completed in the manifest are skipped; tasks that
+        were running when the previous run stopped are polled again.
+        
+        Parameters:
+        -----------
+        tiles : list
+            Tiles from make_tile_grid
+        
+        Returns:
+        --------
+        dict : {tile_id: 'COMPLETED' or 'FAILED'}
+        """
+        
+        previous = self._load_manifest()
+        for tile in tiles:
+            record = previous.get(tile['tile_id'])
+            if record is None or record['state'] == 'FAILED':
+                # Failed tiles from an earlier run get a fresh set of attempts
+                record = {'tile': tile, 'state': 'PENDING', 'task_id': None, 'attempts': 0}
+            self.tiles[tile['tile_id']] = record
+        self._save_manifest()
+        
+        interval = self.poll_interval
+        while True:
+            running = [r for r in self.tiles.values() if r['state'] == 'RUNNING']
+            pending = [r for r in self.tiles.values() if r['state'] == 'PENDING']
+            if not running and not pending:
+                break
+            
+            # Fill free slots
+            for record in pending[:self.max_concurrent - len(running)]:
+                record['task_id'] = self.service.start(record['tile'])
+                record['attempts'] += 1
+                record['state'] = 'RUNNING'
+                running.append(record)
+            self._save_manifest()
+            
+            time.sleep(interval)
+            
+            changed = self._poll(running)
+            self._save_manifest()
+            
+            # Back off while nothing changes, poll quickly again after progress
+            if changed:
+                interval = self.poll_interval
+            else:
+                interval = min(interval * 2, self.max_poll_interval)
+        
+        completed = sum(r['state'] == 'COMPLETED' for r in self.tiles.values())
+        print(f'Export finished: {completed}/{len(self.tiles)} tiles completed')
+        
+        return {tile_id: r['state'] for tile_id, r in self.tiles.items()}
+    
+    def _poll(self, running):
+        """Update running tiles from one status request; True if any finished"""
+        
+        if not running:
+            return False
+        
+        states = self.service.status([r['task_id'] for r in running])
+        changed = False
+        
+        for record in running:
+            state = states.get(record['task_id'])
+            if state in FINISHED_STATES:
+                record['state'] = 'COMPLETED'
+                changed = True
+            elif state in FAILED_STATES:
+                # Resume: retry the tile until it runs out of attempts
+                record['state'] = 'PENDING' if record['attempts'] < self.max_attempts else 'FAILED'
+                changed = True
+        
+        return changed
+    
+    def completed_paths(self):
+        """Local paths of completed tiles (failed tiles are left out; see tile_paths)"""
+        
+        return [self.service.local_path(r['tile'])
+                for r in self.tiles.values() if r['state'] == 'COMPLETED']
+    
+    def tile_paths(self, timeout=0):
+        """
+        Local paths of all tiles, once every tile completed and is on disk
+        
+        Finished exports are in Google Drive and appear in download_dir only
+        when the synced or mounted Drive folder catches up, so missing files
+        are waited for up to timeout seconds. A failed tile raises instead of
+        leaving a hole in the mosaic.
+        
+        Parameters:
+        -----------
+        timeout : float
+            Seconds to wait for completed tiles to appear locally
+        
+        Returns:
+        --------
+        list : Tile GeoTIFF paths, for stitch_tiles_to_cog
+        """
+        
+        unfinished = [tile_id for tile_id, r in self.tiles.items() if r['state'] != 'COMPLETED']
+        if unfinished:
+            raise RuntimeError(f'{len(unfinished)} of {len(self.tiles)} export tiles did not '
+                               f"complete: {', '.join(unfinished)}")
+        
+        paths = [self.service.local_path(r['tile']) for r in self.tiles.values()]
+        deadline = time.time() + timeout
+        while True:
+            missing = [path for path in paths if not os.path.exists(path)]
+            if not missing:
+                return paths
+            if time.time() >= deadline:
+                raise FileNotFoundError(
+                    f'{len(missing)} of {len(paths)} exported tiles are not on local disk '
+                    f'(is the Drive folder synced to {os.path.dirname(missing[0])}?): '
+                    f"{', '.join(missing[:5])}"
+                )
+            time.sleep(min(self.poll_interval, max(deadline - time.time(), 0)))
+
+
+def stitch_tiles_to_cog(paths, output_path, blocksize=512, compress='DEFLATE', scales=None,
+                        offsets=None):
+    """
+    Mosaic exported tiles into a tiled, compressed Cloud-Optimized GeoTIFF
+    
+    Parameters:
+    -----------
+    paths : list
+        Tile GeoTIFFs on a shared pixel grid
+    output_path : str
+        Output COG path
+    blocksize : int
+        Internal tile size in pixels
+    compress : str
+        Internal compression (e.g., 'DEFLATE', 'ZSTD', 'LZW')
+    scales, offsets : list
+        Optional per-band scale and offset metadata (e.g., for uint16 DN)
+    
+    Returns:
+    --------
+    str : output_path
+    """
+    
+    import rasterio
+    import rasterio.shutil
+    from rasterio.merge import merge
+    
+    # Merge window by window into a plain tiled GeoTIFF, then convert to COG
+    mosaic_path = output_path + '.mosaic.tif'
+    merge(list(paths), dst_path=mosaic_path,
+          dst_kwds={'tiled': True, 'blockxsize': blocksize, 'blockysize': blocksize,
+                    'compress': compress})
+    
+    if scales is not None or offsets is not None:
+        with rasterio.open(mosaic_path, 'r+') as dst:
+            if scales is not None:
+                dst.scales = scales
+            if offsets is not None:
+                dst.offsets = offsets
+    
+    with rasterio.open(mosaic_path) as src:
+        rasterio.shutil.copy(src, output_path, driver='COG',
+                             blocksize=blocksize, compress=compress)
+    os.remove(mosaic_path)
+    
+    return output_path
+
+
+def export_tiled(image, aoi, description, folder='EO_Training', download_dir='.',
+                 tile_size_deg=0.25, scale=10, max_concurrent=4, nodata=None):
+    """
+    Export an image over an AOI as a tile grid and wait for all tiles
+    
+    Returns:
+    --------
+    ExportManager : Finished manager (see tile_paths())
+    """
+    
+    ring = aoi.bounds().coordinates().get(0).getInfo()
+    lons = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    bounds = [min(lons), min(lats), max(lons), max(lats)]
+    
+    os.makedirs(download_dir, exist_ok=True)
+    service = EarthEngineTaskService(image, description, folder, download_dir, nodata)
+    manager = ExportManager(service, max_concurrent=max_concurrent,
+                            manifest_path=os.path.join(download_dir, f'{description}_manifest.json'))
+    manager.run(make_tile_grid(bounds, tile_size_deg, scale))
+    
+    return manager
@@ -0,0 +1,402 @@
+"""
+Chunked Feature Cube (NumPy)
+On-disk (time, band, y, x) cube for multi-year composite stacks
+
+create_multi_year_stack gives one composite per year; stacking them in
+memory (B2_2020 ... B12_2024) needs the whole cube before any analysis
+starts, and it is rebuilt every time. Here the cube is written once into
+a single container file of independently compressed chunks. The file is
+memory-mapped and an index records the offset and length of each chunk,
+so reading the time series of a pixel block or one year decompresses
+only the chunks it touches.
+
+Layout of a cube directory:
+    meta.json     shape, dtype, chunk shape, time labels, band names,
+                  nodata, compression, georeferencing
+    chunks.bin    concatenated chunks (zlib or raw)
+    index.npy     (time, band, y, x) chunk grid of (offset, length),
+                  offset -1 for chunks never written (read as nodata)
+
+Usage:
+    stack = create_multi_year_stack(scenes, range(2020, 2025), output_path='dry.tif')
+    cube = cube_from_multi_year_stack('dry_cube', stack, band_names=['B2', ...])
+    series = cube.time_series(rows=slice(0, 256), cols=slice(0, 256))
+    composite_2022 = cube.year(2022)
+"""
+
+import json
+import os
+import zlib
+
+import numpy as np
+
+# Chunk shape (time, band, y, x): one year of one band per 256 x 256 block
+DEFAULT_CHUNKS = (1, 1, 256, 256)
+
+
+class FeatureCube:
+    """
+    Chunked, compressed (time, band, y, x) cube on disk
+    
+    Chunks are appended to chunks.bin; rewriting a chunk appends the new
+    version and leaves the old bytes unused until compact().
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        
+        self.shape = tuple(self.meta['shape'])
+        self.chunks = tuple(self.meta['chunks'])
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.times = self.meta['times']
+        self.bands = self.meta['bands']
+        self.nodata = self.meta['nodata']
+        self.index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r+')
+        self._data = None
+    
+    @classmethod
+    def create(cls, path, shape, dtype='uint16', chunks=DEFAULT_CHUNKS, times=None, bands=None,
+               nodata=0, compression='zlib', level=1, profile=None):
+        """
+        Create an empty cube on disk
+        
+        Parameters:
+        -----------
+        path : str
+            Cube directory (created if missing)
+        shape : tuple
+            (time, band, y, x)
+        dtype : str
+            Data type of the values
+        chunks : tuple
+            Chunk shape; None takes the full axis
+        times : list
+            Label of each time step (e.g., years)
+        bands : list
+            Band names
+        nodata : number
+            Value returned for chunks never written
+        compression : str or None
+            'zlib' or None (raw chunks)
+        level : int
+            zlib compression level (1 is fast and already shrinks
+            masked composites a lot)
+        profile : dict
+            Optional georeferencing ('crs' as WKT, 'transform' as 6 numbers)
+        
+        Returns:
+        --------
+        FeatureCube
+        """
+        
+        os.makedirs(path, exist_ok=True)
+        chunks = tuple(size if chunk is None else min(chunk, size)
+                       for chunk, size in zip(chunks, shape))
+        grid = tuple(-(-size // chunk) for size, chunk in zip(shape, chunks))
+        
+        index = np.lib.format.open_memmap(os.path.join(path, 'index.npy'), mode='w+',
+                                          dtype=np.int64, shape=grid + (2,))
+        index[..., 0] = -1
+        index[..., 1] = 0
+        index.flush()
+        open(os.path.join(path, 'chunks.bin'), 'wb').close()
+        
+        meta = {
+            'shape': list(shape),
+            'chunks': list(chunks),
+            'dtype': np.dtype(dtype).name,
+            'times': list(times) if times is not None else list(range(shape[0])),
+            'bands': list(bands) if bands is not None else [f'b{i + 1}' for i in range(shape[1])],
+            'nodata': nodata,
+            'compression': compression,
+            'level': level,
+            'profile': profile or {}
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        
+        return cls(path)
+    
+    @classmethod
+    def open(cls, path):
+        """Open an existing cube"""
+        
+        return cls(path)
+    
+    def _chunk_slices(self, chunk_index):
+        """Array slices covered by a chunk grid position"""
+        
+        return tuple(slice(i * chunk, min((i + 1) * chunk, size))
+                     for i, chunk, size in zip(chunk_index, self.chunks, self.shape))
+    
+    def _read_chunk(self, chunk_index):
+        """Decompressed chunk (edge chunks are smaller)"""
+        
+        shape = tuple(s.stop - s.start for s in self._chunk_slices(chunk_index))
+        offset, length = self.index[chunk_index]
+        if offset < 0:
+            return np.full(shape, self.nodata, dtype=self.dtype)
+        
+        if self._data is None:
+            self._data = np.memmap(os.path.join(self.path, 'chunks.bin'), dtype=np.uint8,
+                                   mode='r')
+        raw = self._data[offset:offset + length]
+        if self.meta['compression'] == 'zlib':
+            raw = zlib.decompress(raw)
+        
+        return np.frombuffer(raw, dtype=self.dtype).reshape(shape)
+    
+    def _write_chunk(self, chunk_index, values):
+        raw = np.ascontiguousarray(values, dtype=self.dtype).tobytes()
+        if self.meta['compression'] == 'zlib':
+            raw = zlib.compress(raw, self.meta['level'])
+        
+        with open(os.path.join(self.path, 'chunks.bin'), 'ab') as f:
+            offset = f.tell()
+            f.write(raw)
+        
+        self.index[chunk_index] = (offset, len(raw))
+        self._data = None
+    
+    def _normalize(self, key):
+        """Four slices (steps of 1) from a getitem key"""
+        
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (4 - len(key))
+        
+        slices = []
+        for item, size in zip(key, self.shape):
+            if isinstance(item, slice):
+                start, stop, step = item.indices(size)
+                if step != 1:
+                    raise ValueError('FeatureCube slices must have step 1')
+                slices.append(slice(start, max(start, stop)))
+            else:
+                item = int(item) + (size if int(item) < 0 else 0)
+                slices.append(slice(item, item + 1))
+        
+        return tuple(slices)
+    
+    def _chunks_for(self, slices):
+        """Chunk grid positions overlapping the slices"""
+        
+        ranges = [range(s.start // chunk, -(-s.stop // chunk))
+                  for s, chunk in zip(slices, self.chunks)]
+        return np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 4)
+    
+    def read(self, time=slice(None), band=slice(None), rows=slice(None), cols=slice(None)):
+        """
+        Read a (time, band, y, x) block, decompressing only the chunks it touches
+        
+        Integer indices keep their axis (length 1).
+        
+        Returns:
+        --------
+        numpy.ndarray
+        """
+        
+        slices = self._normalize((time, band, rows, cols))
+        out = np.empty(tuple(s.stop - s.start for s in slices), dtype=self.dtype)
+        
+        for chunk_index in map(tuple, self._chunks_for(slices)):
+            chunk_slices = self._chunk_slices(chunk_index)
+            overlap = tuple(slice(max(s.start, c.start), min(s.stop, c.stop))
+                            for s, c in zip(slices, chunk_slices))
+            source = tuple(slice(o.start - c.start, o.stop - c.start)
+                           for o, c in zip(overlap, chunk_slices))
+            target = tuple(slice(o.start - s.start, o.stop - s.start)
+                           for o, s in zip(overlap, slices))
+            out[target] = self._read_chunk(chunk_index)[source]
+        
+        return out
+    
+    def __getitem__(self, key):
+        return self.read(*self._normalize(key))
+    
+    def write(self, values, time=0, band=0, row=0, col=0):
+        """
+        Write a (time, band, y, x) block at the given offsets
+        
+        Chunks only partly covered by the block are read, merged and
+        rewritten.
+        """
+        
+        values = np.asarray(values)
+        slices = tuple(slice(start, start + size)
+                       for start, size in zip((time, band, row, col), values.shape))
+        if any(s.stop > size for s, size in zip(slices, self.shape)):
+            raise ValueError(f'Block {values.shape} at {(time, band, row, col)} '
+                             f'exceeds cube shape {self.shape}')
+        
+        for chunk_index in map(tuple, self._chunks_for(slices)):
+            chunk_slices = self._chunk_slices(chunk_index)
+            overlap = tuple(slice(max(s.start, c.start), min(s.stop, c.stop))
+                            for s, c in zip(slices, chunk_slices))
+            source = tuple(slice(o.start - s.start, o.stop - s.start)
+                           for o, s in zip(overlap, slices))
+            
+            if overlap == chunk_slices:
+                chunk = values[source]
+            else:
+                chunk = self._read_chunk(chunk_index).copy()
+                target = tuple(slice(o.start - c.start, o.stop - c.start)
+                               for o, c in zip(overlap, chunk_slices))
+                chunk[target] = values[source]
+            self._write_chunk(chunk_index, chunk)
+        
+        self.index.flush()
+    
+    def time_series(self, rows, cols, bands=None):
+        """
+        Full time series of a pixel block
+        
+        Parameters:
+        -----------
+        rows, cols : slice
+            Pixel block
+        bands : list
+            Band names (default: all)
+        
+        Returns:
+        --------
+        numpy.ndarray : (time, band, y, x)
+        """
+        
+        if bands is None:
+            return self.read(rows=rows, cols=cols)
+        
+        return np.concatenate([self.read(band=self.bands.index(name), rows=rows, cols=cols)
+                               for name in bands], axis=1)
+    
+    def year(self, label, rows=slice(None), cols=slice(None)):
+        """(band, y, x) layer of one time label, e.g. cube.year(2022)"""
+        
+        return self.read(time=self.times.index(label), rows=rows, cols=cols)[0]
+    
+    def compact(self):
+        """
+        Rewrite chunks.bin without the space of replaced chunks
+        
+        Returns:
+        --------
+        int : Bytes reclaimed
+        """
+        
+        old_path = os.path.join(self.path, 'chunks.bin')
+        new_path = os.path.join(self.path, 'chunks.compact.bin')
+        before = os.path.getsize(old_path)
+        
+        index = np.array(self.index)
+        with open(old_path, 'rb') as src, open(new_path, 'wb') as dst:
+            for chunk_index in zip(*np.nonzero(index[..., 0] >= 0)):
+                offset, length = index[chunk_index]
+                src.seek(offset)
+                index[chunk_index] = (dst.tell(), length)
+                dst.write(src.read(length))
+        
+        self._data = None
+        os.replace(new_path, old_path)
+        self.index[:] = index
+        self.index.flush()
+        
+        return before - os.path.getsize(old_path)
+    
+    def stats(self):
+        """
+        Storage summary
+        
+        Returns:
+        --------
+        dict : chunks written, stored MB, raw MB and compression ratio
+        """
+        
+        written = self.index[..., 0] >= 0
+        stored = int(self.index[..., 1][written].sum())
+        raw = int(np.prod(self.shape)) * self.dtype.itemsize
+        
+        return {
+            'chunks': int(written.sum()),
+            'stored_mb': round(stored / 2 ** 20, 2),
+            'raw_mb': round(raw / 2 ** 20, 2),
+            'ratio': round(raw / stored, 2) if stored else None
+        }
+
+
+def cube_from_multi_year_stack(path, stack, band_names=None, chunks=DEFAULT_CHUNKS,
+                               block_rows=1024, **kwargs):
+    """
+    Write a multi-year stack into a feature cube, one year at a time
+    
+    Parameters:
+    -----------
+    path : str
+        Cube directory
+    stack : dict
+        {year: composite} from composite_local.create_multi_year_stack
+        (GeoTIFF paths or (bands, y, x) arrays)
+    band_names : list
+        Band names (default: GeoTIFF band descriptions or b1, b2, ...)
+    chunks : tuple
+        Chunk shape (time, band, y, x)
+    block_rows : int
+        Rows read from each GeoTIFF at a time (rounded to whole chunks)
+    **kwargs :
+        Passed to FeatureCube.create (dtype, nodata, compression, level)
+    
+    Returns:
+    --------
+    FeatureCube
+    """
+    
+    years = sorted(stack)
+    first = stack[years[0]]
+    profile = None
+    
+    if isinstance(first, str):
+        import rasterio
+        
+        with rasterio.open(first) as src:
+            n_bands, height, width = src.count, src.height, src.width
+            kwargs.setdefault('dtype', src.dtypes[0])
+            if src.nodata is not None:
+                kwargs.setdefault('nodata', src.nodata)
+            if band_names is None and all(src.descriptions):
+                band_names = list(src.descriptions)
+            profile = {'crs': src.crs.to_wkt() if src.crs else None,
+                       'transform': list(src.transform)[:6]}
+    else:
+        first = np.ma.asarray(first)
+        n_bands, height, width = first.shape if first.ndim == 3 else (1,) + first.shape
+        kwargs.setdefault('dtype', first.dtype.name)
+    
+    cube = FeatureCube.create(path, (len(years), n_bands, height, width), chunks=chunks,
+                              times=years, bands=band_names, profile=profile, **kwargs)
+    
+    step = max(1, block_rows // cube.chunks[2]) * cube.chunks[2]
+    for t, year in enumerate(years):
+        source = stack[year]
+        if not isinstance(source, str):
+            source = np.ma.asarray(source).filled(cube.nodata).reshape((-1, height, width))
+        
+        for row in range(0, height, step):
+            n_rows = min(step, height - row)
+            if isinstance(source, str):
+                import rasterio
+                from rasterio.windows import Window
+                
+                with rasterio.open(source) as src:
+                    values = src.read(window=Window(0, row, width, n_rows))
+            else:
+                values = source[:, row:row + n_rows]
+            cube.write(values[np.newaxis], time=t, row=row)
+        print(f'Cube: wrote {year}')
+    
+    # Chunks spanning several years were rewritten once per year
+    if cube.chunks[0] > 1:
+        cube.compact()
+    
+    print(f'Cube stats: {cube.stats()}')
+    return cube
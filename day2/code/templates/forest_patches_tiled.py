@@ -0,0 +1,290 @@
+"""
+Forest Loss Patch Statistics (tiled connected-component labeling)
+Count and measure clearing events on province-scale forest loss maps
+
+A forest loss map says which pixels were cleared; reporting needs the
+clearings themselves: how many patches, how large, and where the largest
+ones are. Labeling a whole-province 10 m raster in one scipy.ndimage.label
+call needs several full-size integer arrays. Here every tile is labeled in
+its own worker process and only small per-label tables and the tile's edge
+rows/columns are returned. Labels that touch across tile seams are merged
+with a union-find, so memory stays bounded to a few tiles plus one table
+row per patch.
+
+Usage:
+    patches = label_loss_patches('palawan_forest_loss.tif')
+    summary = summarize_loss_patches(patches)
+    print(summary['n_patches'], summary['largest'])
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from change_detection_local import pixel_area_for_rows
+from change_detection_tiled import iter_windows
+
+# Default patch size classes (hectares) for the size distribution
+PATCH_SIZE_CLASSES_HA = [0.5, 1, 5, 10, 50, 100]
+
+
+def _label_tile(task):
+    """
+    Worker: label one tile of a forest loss map
+    
+    Returns the number of labels, per-label pixel counts, areas and
+    bounding boxes (global pixel coordinates) and the label values along
+    the four tile edges.
+    """
+    
+    source, window, connectivity, scale = task
+    
+    if isinstance(source, str):
+        import rasterio
+        
+        with rasterio.open(source) as src:
+            block = src.read(1, window=window, masked=True)
+            pixel_area = pixel_area_for_rows(src.transform, src.crs, window.row_off, window.height)
+    else:
+        block = source
+        pixel_area = float(scale) ** 2
+    
+    loss = np.ma.asarray(block).filled(0) != 0
+    structure = np.ones((3, 3), dtype=bool) if connectivity == 8 else None
+    labels, n_labels = ndimage.label(loss, structure=structure)
+    
+    flat = labels.ravel()
+    counts = np.bincount(flat, minlength=n_labels + 1)[1:]
+    weights = np.broadcast_to(pixel_area, labels.shape).ravel()
+    areas = np.bincount(flat, weights=weights, minlength=n_labels + 1)[1:]
+    
+    offset = np.array([window.row_off, window.col_off, window.row_off, window.col_off])
+    bboxes = np.array([[s[0].start, s[1].start, s[0].stop - 1, s[1].stop - 1]
+                       for s in ndimage.find_objects(labels)], dtype=np.int64).reshape(-1, 4)
+    
+    edges = {
+        'top': labels[0].copy(),
+        'bottom': labels[-1].copy(),
+        'left': labels[:, 0].copy(),
+        'right': labels[:, -1].copy()
+    }
+    
+    return n_labels, counts, areas, bboxes + offset, edges
+
+
+class UnionFind:
+    """
+    Array-based union-find over integer labels 0..n
+    
+    Parameters:
+    -----------
+    n : int
+        Largest label
+    """
+    
+    def __init__(self, n):
+        self.parent = np.arange(n + 1)
+    
+    def find(self, label):
+        root = label
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[label] != root:
+            self.parent[label], label = root, self.parent[label]
+        return root
+    
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    def roots(self):
+        """Root of every label, resolved with vectorized pointer jumping"""
+        
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent
+            parent = grandparent
+
+
+def _seam_pairs(before, after, connectivity):
+    """Label pairs that touch across a seam (two parallel lines of labels)"""
+    
+    shifts = [-1, 0, 1] if connectivity == 8 else [0]
+    pairs = []
+    for shift in shifts:
+        a = before[max(0, -shift):len(before) - max(0, shift)]
+        b = after[max(0, shift):len(after) - max(0, -shift)]
+        touching = (a > 0) & (b > 0)
+        pairs.append(np.stack([a[touching], b[touching]], axis=1))
+    
+    return np.concatenate(pairs)
+
+
+def label_loss_patches(forest_loss, connectivity=8, block_size=2048, scale=10, workers=None,
+                       min_pixels=1):
+    """
+    Label forest loss patches tile by tile and measure each patch
+    
+    Parameters:
+    -----------
+    forest_loss : str or numpy.ndarray
+        Forest loss GeoTIFF path or array (non-zero = loss, e.g., from
+        detect_forest_loss in change_detection_local.py)
+    connectivity : int
+        4 or 8 (8 joins diagonal neighbors, like ee.Image.connectedComponents
+        with ee.Kernel.square(1))
+    block_size : int
+        Tile size in pixels
+    scale : int
+        Pixel size in meters (arrays only; GeoTIFFs use their own grid)
+    workers : int
+        Worker processes (default: os.cpu_count())
+    min_pixels : int
+        Drop patches smaller than this many pixels
+    
+    Returns:
+    --------
+    pandas.DataFrame : One row per patch, largest first, with pixels,
+    area_ha and the bounding box in pixels (min_row, min_col, max_row,
+    max_col) and, for GeoTIFFs, in map coordinates (west, south, east, north)
+    """
+    
+    if connectivity not in [4, 8]:
+        raise ValueError('connectivity must be 4 or 8')
+    
+    transform = None
+    if isinstance(forest_loss, str):
+        import rasterio
+        
+        with rasterio.open(forest_loss) as src:
+            height, width, transform = src.height, src.width, src.transform
+        windows = list(iter_windows(height, width, block_size))
+        tasks = [(forest_loss, window, connectivity, scale) for window in windows]
+    else:
+        forest_loss = np.ma.asarray(forest_loss)
+        height, width = forest_loss.shape
+        windows = list(iter_windows(height, width, block_size))
+        tasks = [(forest_loss[window.toslices()], window, connectivity, scale)
+                 for window in windows]
+    
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = list(executor.map(_label_tile, tasks))
+    
+    # Global label = local label + tile offset (0 stays background)
+    offsets = np.cumsum([0] + [n_labels for n_labels, *_ in results])
+    n_total = int(offsets[-1])
+    
+    counts = np.concatenate([[0]] + [r[1] for r in results])
+    areas = np.concatenate([[0.0]] + [r[2] for r in results])
+    bboxes = np.concatenate([np.zeros((1, 4), dtype=np.int64)] + [r[3] for r in results])
+    
+    # Full-length lines of global labels on both sides of every seam
+    bottom_rows, top_rows, right_cols, left_cols = {}, {}, {}, {}
+    for window, offset, (_, _, _, _, edges) in zip(windows, offsets, results):
+        rows = slice(window.row_off, window.row_off + window.height)
+        cols = slice(window.col_off, window.col_off + window.width)
+        last_row = window.row_off + window.height - 1
+        last_col = window.col_off + window.width - 1
+        
+        for lines, key, edge, span in [
+            (bottom_rows, last_row, edges['bottom'], cols),
+            (top_rows, window.row_off, edges['top'], cols),
+            (right_cols, last_col, edges['right'], rows),
+            (left_cols, window.col_off, edges['left'], rows)
+        ]:
+            line = lines.setdefault(key, np.zeros(width if span is cols else height, dtype=np.int64))
+            line[span] = np.where(edge > 0, edge + offset, 0)
+    
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for row in top_rows:
+        if row > 0:
+            pairs.append(_seam_pairs(bottom_rows[row - 1], top_rows[row], connectivity))
+    for col in left_cols:
+        if col > 0:
+            pairs.append(_seam_pairs(right_cols[col - 1], left_cols[col], connectivity))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    
+    union_find = UnionFind(n_total)
+    for a, b in pairs:
+        union_find.union(a, b)
+    roots = union_find.roots()[1:]
+    
+    # Aggregate tile-local labels into patches
+    patch_ids, inverse = np.unique(roots, return_inverse=True)
+    n_patches = len(patch_ids)
+    
+    patch_bbox = np.empty((n_patches, 4), dtype=np.int64)
+    patch_bbox[:, :2] = np.iinfo(np.int64).max
+    patch_bbox[:, 2:] = -1
+    np.minimum.at(patch_bbox[:, 0], inverse, bboxes[1:, 0])
+    np.minimum.at(patch_bbox[:, 1], inverse, bboxes[1:, 1])
+    np.maximum.at(patch_bbox[:, 2], inverse, bboxes[1:, 2])
+    np.maximum.at(patch_bbox[:, 3], inverse, bboxes[1:, 3])
+    
+    patches = pd.DataFrame({
+        'pixels': np.bincount(inverse, weights=counts[1:], minlength=n_patches).astype(np.int64),
+        'area_ha': np.bincount(inverse, weights=areas[1:], minlength=n_patches) / 10000,
+        'min_row': patch_bbox[:, 0],
+        'min_col': patch_bbox[:, 1],
+        'max_row': patch_bbox[:, 2],
+        'max_col': patch_bbox[:, 3]
+    })
+    
+    if transform is not None:
+        patches['west'], patches['north'] = transform * (patches['min_col'], patches['min_row'])
+        patches['east'], patches['south'] = transform * (patches['max_col'] + 1,
+                                                         patches['max_row'] + 1)
+    
+    patches = patches[patches['pixels'] >= min_pixels]
+    patches = patches.sort_values('area_ha', ascending=False, kind='stable').reset_index(drop=True)
+    patches.index = patches.index + 1
+    patches.index.name = 'patch_id'
+    
+    print(f'Labeled {len(patches):,} forest loss patches in {len(windows)} tiles')
+    
+    return patches
+
+
+def summarize_loss_patches(patches, size_classes_ha=PATCH_SIZE_CLASSES_HA, top_n=10):
+    """
+    Summarize clearing events from label_loss_patches
+    
+    Parameters:
+    -----------
+    patches : pandas.DataFrame
+        Patch table from label_loss_patches
+    size_classes_ha : list
+        Upper bounds (hectares) of the patch size classes
+    top_n : int
+        Number of largest patches to list
+    
+    Returns:
+    --------
+    dict : n_patches, total_area_ha, mean and median patch size, the size
+    distribution table and the largest patches
+    """
+    
+    bins = [0] + list(size_classes_ha) + [np.inf]
+    labels = [f'{low}-{high} ha' for low, high in zip(bins[:-2], bins[1:-1])]
+    labels.append(f'>{bins[-2]} ha')
+    
+    size_class = pd.cut(patches['area_ha'], bins=bins, labels=labels)
+    distribution = patches.groupby(size_class, observed=False)['area_ha'].agg(['count', 'sum'])
+    distribution.columns = ['patches', 'area_ha']
+    distribution.index.name = 'size_class'
+    
+    return {
+        'n_patches': len(patches),
+        'total_area_ha': round(float(patches['area_ha'].sum()), 2),
+        'mean_patch_ha': round(float(patches['area_ha'].mean()), 2) if len(patches) else 0.0,
+        'median_patch_ha': round(float(patches['area_ha'].median()), 2) if len(patches) else 0.0,
+        'size_distribution': distribution,
+        'largest': patches.head(top_n)
+    }
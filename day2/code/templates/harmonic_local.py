@@ -0,0 +1,223 @@
+"""
+Local Harmonic Regression (NumPy)
+Batched least-squares fit of fit_harmonic_trend for every pixel of a tile
+
+A per-pixel np.linalg.lstsq loop over a 1000 x 1000 tile makes a million
+small solves. All pixels share the same design matrix (constant, t and
+cos/sin terms of the acquisition dates), so only the cloud mask differs.
+Pixels are grouped by their pattern of valid observations and each
+pattern is solved once with all its pixels as right-hand sides; pixels
+whose pattern is rare are solved together through stacked normal
+equations with np.linalg.solve.
+
+The model and band names match fit_harmonic_trend in
+temporal_composite_template.py:
+    value = constant + t*trend + sum_k (cos_k*cos(2*pi*k*t) + sin_k*sin(2*pi*k*t))
+with t in years since the reference date.
+
+Usage:
+    fit = fit_harmonics(ndvi_stack, dates, harmonics=2)
+    amplitude = fit['amplitude1']
+"""
+
+import math
+from datetime import date, datetime
+
+import numpy as np
+
+
+def harmonic_band_names(harmonics=1):
+    """Independent variable names: constant, t, cos1, sin1, ..., cosK, sinK"""
+    
+    names = ['constant', 't']
+    for k in range(1, harmonics + 1):
+        names += [f'cos{k}', f'sin{k}']
+    return names
+
+
+def decimal_years(dates, reference_date=None):
+    """
+    Years since reference_date (default: 1 January of the first year)
+    
+    Parameters:
+    -----------
+    dates : list
+        datetime.date / datetime objects or 'YYYY-MM-DD' strings
+    reference_date : date or str
+        Date where t = 0
+    
+    Returns:
+    --------
+    numpy.ndarray : float64 times in years
+    """
+    
+    def to_date(value):
+        if isinstance(value, str):
+            return datetime.strptime(value[:10], '%Y-%m-%d').date()
+        return value.date() if isinstance(value, datetime) else value
+    
+    dates = [to_date(value) for value in dates]
+    reference = to_date(reference_date) if reference_date is not None \
+        else date(min(dates).year, 1, 1)
+    
+    return np.array([(value - reference).days / 365.25 for value in dates])
+
+
+def design_matrix(times, harmonics=1):
+    """
+    Harmonic design matrix, columns ordered as harmonic_band_names()
+    
+    Returns:
+    --------
+    numpy.ndarray : (n_times, 2 + 2*harmonics)
+    """
+    
+    times = np.asarray(times, dtype=np.float64)
+    columns = [np.ones_like(times), times]
+    for k in range(1, harmonics + 1):
+        angle = 2 * math.pi * k * times
+        columns += [np.cos(angle), np.sin(angle)]
+    
+    return np.stack(columns, axis=1)
+
+
+def _solve_patterns(X, Y, valid, min_group=16):
+    """
+    Least-squares coefficients for every pixel column of Y
+    
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        (n_times, p) design matrix
+    Y : numpy.ndarray
+        (n_times, n_pixels) observations (any value where not valid)
+    valid : numpy.ndarray
+        (n_times, n_pixels) boolean mask of valid observations
+    min_group : int
+        Patterns shared by fewer pixels go to the stacked normal equations
+    
+    Returns:
+    --------
+    numpy.ndarray : (p, n_pixels) coefficients, NaN where a pixel has too
+    few observations for a unique fit
+    """
+    
+    n_params = X.shape[1]
+    beta = np.full((n_params, Y.shape[1]), np.nan)
+    
+    # Group pixels by their valid-observation pattern: one sort over byte
+    # strings of the packed mask, no scan of all pixels per pattern
+    packed = np.ascontiguousarray(np.packbits(valid, axis=0).T)
+    keys = packed.view(np.dtype((np.void, packed.shape[1]))).ravel()
+    patterns, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    pattern_rows = np.unpackbits(patterns.view(np.uint8).reshape(len(patterns), -1),
+                                 axis=1)[:, :X.shape[0]].astype(bool)
+    enough = pattern_rows.sum(axis=1) >= n_params
+    
+    common = np.nonzero(enough & (counts >= min_group))[0]
+    if len(common):
+        # Pixels of the common patterns, sorted by pattern and split per group
+        selected = np.nonzero(np.isin(inverse, common))[0]
+        order = selected[np.argsort(inverse[selected], kind='stable')]
+        groups = np.split(order, np.cumsum(counts[common])[:-1])
+        
+        for index, pixels in zip(common, groups):
+            # One solve for every pixel sharing this pattern
+            rows = pattern_rows[index]
+            Xg = X[rows]
+            if np.linalg.matrix_rank(Xg) < n_params:
+                continue
+            beta[:, pixels] = np.linalg.lstsq(Xg, Y[np.ix_(rows, pixels)], rcond=None)[0]
+    
+    # Rare patterns (under real cloud masks, nearly all of them) in one solve
+    pixels = np.nonzero((enough & (counts < min_group))[inverse])[0]
+    if len(pixels):
+        # Stacked normal equations: (X^T W X) beta = X^T W y per pixel, with
+        # the products of design columns summed by one matrix multiply
+        weights = valid[:, pixels].astype(np.float64)
+        y = np.where(valid[:, pixels], Y[:, pixels], 0)
+        outer = (X[:, :, np.newaxis] * X[:, np.newaxis, :]).reshape(len(X), -1)
+        XtWX = (weights.T @ outer).reshape(-1, n_params, n_params)
+        XtWy = y.T @ X
+        
+        # Symmetric positive semi-definite: condition from the eigenvalues
+        eigenvalues = np.linalg.eigvalsh(XtWX)
+        solvable = eigenvalues[:, 0] > eigenvalues[:, -1] * 1e-12
+        if solvable.any():
+            beta[:, pixels[solvable]] = np.linalg.solve(
+                XtWX[solvable], XtWy[solvable][..., np.newaxis])[..., 0].T
+    
+    return beta
+
+
+def fit_harmonics(stack, dates, harmonics=1, reference_date=None, nodata=None,
+                  block_pixels=262144, min_group=16):
+    """
+    Per-pixel harmonic regression on a (time, rows, cols) stack
+    
+    Parameters:
+    -----------
+    stack : numpy.ndarray or numpy.ma.MaskedArray
+        Observations (e.g., NDVI) with one layer per date; NaN, masked and
+        nodata values are treated as missing
+    dates : list
+        Acquisition date of each layer
+    harmonics : int
+        Number of harmonics
+    reference_date : date or str
+        Date where t = 0 (default: 1 January of the first year, as
+        fit_harmonic_trend uses start_year)
+    nodata : float
+        Optional value marking missing observations
+    block_pixels : int
+        Pixels solved per block (bounds memory)
+    min_group : int
+        Smallest pixel group solved with a shared lstsq
+    
+    Returns:
+    --------
+    dict : {band: numpy.ma.MaskedArray (rows, cols)} with the coefficient
+    bands of harmonic_band_names(), 'rmse', 'amplitude{k}', 'phase{k}' and
+    'count', masked where a pixel has too few observations
+    """
+    
+    stack = np.ma.asarray(stack)
+    n_times, rows, cols = stack.shape
+    if len(dates) != n_times:
+        raise ValueError(f'{len(dates)} dates for {n_times} layers')
+    
+    names = harmonic_band_names(harmonics)
+    X = design_matrix(decimal_years(dates, reference_date), harmonics)
+    
+    values = stack.filled(np.nan).astype(np.float64).reshape(n_times, -1)
+    valid = np.isfinite(values)
+    if nodata is not None:
+        valid &= values != nodata
+    
+    beta = np.full((len(names), rows * cols), np.nan)
+    rmse = np.full(rows * cols, np.nan)
+    
+    for start in range(0, rows * cols, block_pixels):
+        block = slice(start, min(start + block_pixels, rows * cols))
+        Y, mask = values[:, block], valid[:, block]
+        beta[:, block] = _solve_patterns(X, Y, mask, min_group)
+        
+        # RMS of residuals over valid observations (as linearRegression)
+        residuals = np.where(mask, Y - X @ beta[:, block], 0)
+        rmse[block] = np.sqrt((residuals ** 2).sum(axis=0) / np.maximum(mask.sum(axis=0), 1))
+    
+    missing = np.isnan(beta[0]).reshape(rows, cols)
+    
+    def raster(array):
+        return np.ma.array(array.reshape(rows, cols), mask=missing)
+    
+    results = {name: raster(beta[i]) for i, name in enumerate(names)}
+    results['rmse'] = raster(rmse)
+    for k in range(1, harmonics + 1):
+        cos, sin = beta[names.index(f'cos{k}')], beta[names.index(f'sin{k}')]
+        results[f'amplitude{k}'] = raster(np.hypot(cos, sin))
+        results[f'phase{k}'] = raster(np.arctan2(sin, cos))
+    results['count'] = np.ma.array(valid.sum(axis=0).reshape(rows, cols), mask=missing)
+    
+    return results
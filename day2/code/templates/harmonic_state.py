@@ -0,0 +1,438 @@
+"""
+Recursive Harmonic Model State (NumPy)
+Harmonic regression that updates with each new acquisition
+
+fit_harmonic_trend refits every year from start_year whenever a scene
+arrives. Here each pixel keeps the sufficient statistics of its least
+squares fit on disk (upper triangle of X^T X, X^T y, y^T y and the
+observation count). A new observation adds its outer product and the
+coefficients are re-solved from the p x p system, the information form
+of recursive least squares, so an update costs O(p^2) per pixel no
+matter how many years are already in the model.
+
+Until a pixel's model has min_observations and spans min_years, every
+observation goes into the fit. After that warm-up each observation is
+first checked against the model: a residual larger than threshold times
+the model RMSE (widened by the prediction leverage) is an anomaly and is
+kept out of the fit, and consecutive anomalies in a row (3 by default)
+confirm a break (as in CCDC). The break date is recorded and the pixel's
+model restarts from the next observation.
+
+An update writes a new generation of the state files and commits it by
+replacing meta.json last, so a crash never leaves observations half added.
+
+Usage:
+    state = build_harmonic_state('ndvi_harmonics', [('S2_20240112', '2024-01-12', ndvi), ...],
+                                 harmonics=2, reference_date='2020-01-01')
+    fit = state.coefficients()
+    breaks = state.breaks()
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+
+from harmonic_local import decimal_years, design_matrix, harmonic_band_names
+
+
+class HarmonicState:
+    """
+    Persistent per-pixel harmonic regression state
+    
+    State arrays (memory-mapped, shape (..., rows, cols)):
+    -------------------------------------------------------
+    xtx : float64 (p*(p+1)/2) upper triangle of X^T X
+    xty : float64 (p) X^T y
+    yty : float64 y^T y
+    count : uint16 observations in the current model
+    first_t : float32 time of the first observation in the current model
+    beta : float32 (p) current coefficients (NaN until count >= p)
+    run : uint8 consecutive anomalies
+    run_start : float32 time of the first anomaly in the run
+    n_breaks : uint8 confirmed breaks
+    break_t : float32 time of the last confirmed break (NaN if none)
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        
+        for name in self._layers(self.meta['harmonics']):
+            setattr(self, name, np.load(self._state_file(name), mmap_mode='r+'))
+        
+        self.names = harmonic_band_names(self.meta['harmonics'])
+        self.scenes = self.meta['scenes']
+    
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+    
+    def _state_file(self, name, generation=None):
+        """State array file of a generation (default: committed)"""
+        
+        if generation is None:
+            generation = self.meta['generation']
+        return self._file(f'{name}.{generation}')
+    
+    @staticmethod
+    def _write_meta(path, meta):
+        """Replace meta.json atomically (the commit point of an update)"""
+        
+        temp = os.path.join(path, 'meta.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(temp, os.path.join(path, 'meta.json'))
+    
+    @staticmethod
+    def _layers(harmonics):
+        """{name: (leading shape, dtype, fill)} of the state arrays"""
+        
+        p = len(harmonic_band_names(harmonics))
+        return {
+            'xtx': ((p * (p + 1) // 2,), np.float64, 0),
+            'xty': ((p,), np.float64, 0),
+            'yty': ((), np.float64, 0),
+            'count': ((), np.uint16, 0),
+            'first_t': ((), np.float32, np.nan),
+            'beta': ((p,), np.float32, np.nan),
+            'run': ((), np.uint8, 0),
+            'run_start': ((), np.float32, np.nan),
+            'n_breaks': ((), np.uint8, 0),
+            'break_t': ((), np.float32, np.nan)
+        }
+    
+    @classmethod
+    def create(cls, path, shape, harmonics=1, reference_date='2020-01-01', threshold=3.0,
+               consecutive=3, min_observations=None, min_years=1.0):
+        """
+        Create an empty harmonic state on disk
+        
+        Parameters:
+        -----------
+        path : str
+            State directory (created if missing)
+        shape : tuple
+            (rows, cols) of the observations
+        harmonics : int
+            Number of harmonics
+        reference_date : str
+            Date where t = 0
+        threshold : float
+            Residual / RMSE ratio marking an anomaly
+        consecutive : int
+            Anomalies in a row that confirm a break
+        min_observations : int
+            Observations before the model is used for break checks
+            (default: 2 * number of coefficients)
+        min_years : float
+            Time span the model must cover before break checks, so a
+            partial season is not extrapolated
+        
+        Returns:
+        --------
+        HarmonicState
+        """
+        
+        os.makedirs(path, exist_ok=True)
+        
+        for name, (leading, dtype, fill) in cls._layers(harmonics).items():
+            array = np.lib.format.open_memmap(os.path.join(path, f'{name}.0.npy'), mode='w+',
+                                              dtype=dtype, shape=leading + tuple(shape))
+            array[:] = fill
+            array.flush()
+        
+        meta = {
+            'shape': list(shape),
+            'harmonics': harmonics,
+            'reference_date': reference_date,
+            'threshold': threshold,
+            'consecutive': consecutive,
+            'min_observations': min_observations or 2 * len(harmonic_band_names(harmonics)),
+            'min_years': min_years,
+            'last_t': None,
+            'scenes': [],
+            'generation': 0
+        }
+        cls._write_meta(path, meta)
+        
+        return cls(path)
+    
+    @classmethod
+    def open(cls, path):
+        """Open an existing harmonic state"""
+        
+        return cls(path)
+    
+    def _read_rows(self, source, row_off, n_rows):
+        """(rows, cols) float64 block of one observation, NaN where missing"""
+        
+        if isinstance(source, str):
+            import rasterio
+            from rasterio.windows import Window
+            
+            with rasterio.open(source) as src:
+                values = src.read(1, window=Window(0, row_off, src.width, n_rows),
+                                  masked=True)
+        else:
+            values = np.ma.asarray(source)[row_off:row_off + n_rows]
+        
+        return values.astype(np.float64).filled(np.nan)
+    
+    def _matrix(self, xtx):
+        """Stacked (n, p, p) X^T X from upper triangles (k, n)"""
+        
+        p = len(self.names)
+        upper = np.triu_indices(p)
+        matrix = np.zeros((xtx.shape[1], p, p))
+        matrix[:, upper[0], upper[1]] = xtx.T
+        matrix[:, upper[1], upper[0]] = xtx.T
+        
+        return matrix
+    
+    def _solve(self, xtx, xty):
+        """Coefficients (p, n) from upper triangles (k, n) and X^T y (p, n)"""
+        
+        p = len(self.names)
+        matrix = self._matrix(xtx)
+        
+        beta = np.full((p, xtx.shape[1]), np.nan)
+        solvable = np.linalg.cond(matrix) < 1e12
+        if solvable.any():
+            beta[:, solvable] = np.linalg.solve(
+                matrix[solvable], xty.T[solvable][..., np.newaxis])[..., 0].T
+        
+        return beta
+    
+    @staticmethod
+    def _rmse(xty, yty, count, beta, dof=0):
+        """Model RMSE from the sufficient statistics (SSE / (count - dof))"""
+        
+        sse = np.maximum(yty - np.einsum('p...,p...->...', beta, xty), 0)
+        return np.sqrt(sse / np.maximum(count.astype(np.int64) - dof, 1))
+    
+    def update(self, observations, block_rows=512):
+        """
+        Add observations in date order, skipping scenes already added
+        
+        The updated state goes to the next generation of files, and the
+        observations count as added only once meta.json referencing them
+        is replaced. After a crash the previous generation is still the
+        committed state, so rerunning the update does not add them twice.
+        
+        Parameters:
+        -----------
+        observations : list
+            (scene_id, date, source) triples; source is a single-band
+            GeoTIFF path or a (masked) array of e.g. NDVI, NaN or masked
+            where cloudy
+        block_rows : int
+            Rows processed per block
+        
+        Returns:
+        --------
+        list : IDs of the scenes that were added
+        """
+        
+        new = {}
+        for scene_id, date, source in observations:
+            if scene_id not in self.scenes and scene_id not in new:
+                new[scene_id] = (date, source)
+        if not new:
+            return []
+        
+        new = sorted(new.items(), key=lambda item: str(item[1][0]))
+        times = decimal_years([date for _, (date, _) in new], self.meta['reference_date'])
+        if self.meta['last_t'] is not None and times[0] < self.meta['last_t']:
+            raise ValueError(f'Observation {new[0][0]} is older than the last update')
+        
+        X = design_matrix(times, self.meta['harmonics'])
+        p = len(self.names)
+        upper = np.triu_indices(p)
+        threshold = self.meta['threshold']
+        consecutive = self.meta['consecutive']
+        min_observations = self.meta['min_observations']
+        min_years = self.meta['min_years']
+        rows = self.meta['shape'][0]
+        
+        # Next generation of the state, written block by block
+        generation = self.meta['generation'] + 1
+        names = list(self._layers(self.meta['harmonics']))
+        updated = {}
+        for name in names:
+            current = getattr(self, name)
+            updated[name] = np.lib.format.open_memmap(self._state_file(name, generation),
+                                                      mode='w+', dtype=current.dtype,
+                                                      shape=current.shape)
+        
+        for row_off in range(0, rows, block_rows):
+            block = slice(row_off, min(row_off + block_rows, rows))
+            state = {name: np.array(getattr(self, name)[..., block, :]) for name in names}
+            state['beta'] = state['beta'].astype(np.float64)
+            
+            for (_, (_, source)), x, t in zip(new, X, times):
+                y = self._read_rows(source, row_off, block.stop - row_off)
+                valid = np.isfinite(y)
+                fitted = (state['count'] >= min_observations) & np.isfinite(state['beta'][0]) \
+                    & (t - state['first_t'] >= min_years)
+                
+                # Anomaly check against the model before this observation; the
+                # prediction error includes the coefficient uncertainty
+                # x^T (X^T X)^-1 x, which is large right after a model starts
+                rmse = self._rmse(state['xty'], state['yty'], state['count'], state['beta'], p)
+                leverage = np.zeros_like(rmse)
+                if fitted.any():
+                    matrix = self._matrix(state['xtx'][:, fitted])
+                    leverage[fitted] = np.linalg.solve(
+                        matrix, np.broadcast_to(x, (len(matrix), p))[..., np.newaxis])[..., 0] @ x
+                residual = y - np.einsum('p,p...->...', x, state['beta'])
+                anomaly = valid & fitted & \
+                    (np.abs(residual) > threshold * rmse * np.sqrt(1 + leverage))
+                normal = valid & ~anomaly
+                
+                state['run'] = np.where(anomaly, state['run'] + 1,
+                                        np.where(normal, 0, state['run'])).astype(np.uint8)
+                state['run_start'] = np.where(anomaly & (state['run'] == 1), t,
+                                              state['run_start'])
+                
+                # Confirmed break: record it and restart the model
+                confirmed = state['run'] >= consecutive
+                if confirmed.any():
+                    state['n_breaks'][confirmed] += 1
+                    state['break_t'][confirmed] = state['run_start'][confirmed]
+                    for name in ['xtx', 'xty', 'yty', 'count', 'run']:
+                        state[name][..., confirmed] = 0
+                    state['beta'][:, confirmed] = np.nan
+                    state['first_t'][confirmed] = np.nan
+                    state['run_start'][confirmed] = np.nan
+                
+                # Rank-one update of the sufficient statistics
+                y = np.where(normal, y, 0)
+                state['xtx'] += (x[upper[0]] * x[upper[1]])[:, np.newaxis, np.newaxis] * normal
+                state['xty'] += x[:, np.newaxis, np.newaxis] * y
+                state['yty'] += y ** 2
+                state['count'] += normal.astype(np.uint16)
+                state['first_t'] = np.where(normal & np.isnan(state['first_t']), t,
+                                            state['first_t'])
+                
+                refit = normal & (state['count'] >= p)
+                if refit.any():
+                    state['beta'][:, refit] = self._solve(state['xtx'][:, refit],
+                                                          state['xty'][:, refit])
+            
+            for name, values in state.items():
+                updated[name][..., block, :] = values
+        
+        for array in updated.values():
+            array.flush()
+        
+        # Commit: meta.json now points at the new generation
+        added = [scene_id for scene_id, _ in new]
+        self._write_meta(self.path, dict(self.meta, scenes=self.scenes + added,
+                                         last_t=float(times[-1]), generation=generation))
+        self.scenes.extend(added)
+        self.meta.update(last_t=float(times[-1]), generation=generation)
+        for name in names:
+            setattr(self, name, updated[name])
+        
+        # Drop older generations (and leftovers of interrupted updates)
+        for name in names:
+            for stale in glob.glob(self._file(f'{name}.*')):
+                if stale != self._state_file(name):
+                    os.remove(stale)
+        
+        return added
+    
+    def coefficients(self, rows=slice(None)):
+        """
+        Current model, in the layout of harmonic_local.fit_harmonics
+        
+        Returns:
+        --------
+        dict : {band: numpy.ma.MaskedArray (rows, cols)} with the coefficient
+        bands, 'rmse', 'amplitude{k}', 'phase{k}' and 'count', masked where
+        the model has too few observations
+        """
+        
+        p = len(self.names)
+        beta = np.asarray(self.beta[:, rows], dtype=np.float64)
+        count = np.asarray(self.count[rows])
+        missing = np.isnan(beta[0]) | (count < p)
+        
+        results = {name: np.ma.array(beta[i], mask=missing) for i, name in enumerate(self.names)}
+        results['rmse'] = np.ma.array(
+            self._rmse(self.xty[:, rows], self.yty[rows], count, beta), mask=missing)
+        for k in range(1, self.meta['harmonics'] + 1):
+            cos, sin = beta[self.names.index(f'cos{k}')], beta[self.names.index(f'sin{k}')]
+            results[f'amplitude{k}'] = np.ma.array(np.hypot(cos, sin), mask=missing)
+            results[f'phase{k}'] = np.ma.array(np.arctan2(sin, cos), mask=missing)
+        results['count'] = np.ma.array(count, mask=missing)
+        
+        return results
+    
+    def breaks(self, rows=slice(None)):
+        """
+        Break flags from the residual checks
+        
+        Returns:
+        --------
+        dict : 'break' (bool, a confirmed break), 'break_t' (years since
+        reference_date of the last break, NaN if none), 'n_breaks' and
+        'pending' (anomalies in the current unconfirmed run)
+        """
+        
+        n_breaks = np.array(self.n_breaks[rows])
+        
+        return {
+            'break': n_breaks > 0,
+            'break_t': np.array(self.break_t[rows]),
+            'n_breaks': n_breaks,
+            'pending': np.array(self.run[rows])
+        }
+
+
+def build_harmonic_state(path, observations, shape=None, harmonics=1,
+                         reference_date='2020-01-01', threshold=3.0, consecutive=3,
+                         min_years=1.0, block_rows=512):
+    """
+    Create or update a harmonic state with every observation not yet added
+    
+    Parameters:
+    -----------
+    path : str
+        State directory
+    observations : list
+        (scene_id, date, source) triples; already added scenes are skipped,
+        so the full list can be passed after each acquisition
+    shape : tuple
+        Grid size (read from the first observation when not given)
+    harmonics, reference_date, threshold, consecutive, min_years :
+        Used only when the state is created
+    block_rows : int
+        Rows processed per block
+    
+    Returns:
+    --------
+    HarmonicState
+    """
+    
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        state = HarmonicState.open(path)
+    else:
+        if shape is None:
+            source = observations[0][2]
+            if isinstance(source, str):
+                import rasterio
+                
+                with rasterio.open(source) as src:
+                    shape = (src.height, src.width)
+            else:
+                shape = np.shape(source)
+        state = HarmonicState.create(path, shape, harmonics, reference_date, threshold,
+                                     consecutive, min_years=min_years)
+    
+    added = state.update(observations, block_rows)
+    print(f'Added {len(added)} new observations ({len(state.scenes)} in the model)')
+    
+    return state
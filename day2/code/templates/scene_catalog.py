@@ -0,0 +1,288 @@
+"""
+Local Sentinel-2 Scene Catalog (SQLite)
+filterBounds / filterDate / cloud filters over a local archive without scanning it
+
+filter_scenes in composite_local.py checks every scene record in Python,
+and building those records means opening every GeoTIFF. Here the records
+are stored once in a SQLite database with an R*Tree index on the
+footprints and B-tree indexes on date and cloud percentage, so the
+filter chain of the Earth Engine templates is answered by index lookups
+in milliseconds, even for hundreds of thousands of scenes.
+
+A catalog can be passed anywhere composite_local expects a list of
+scene records (create_seasonal_composite, calculate_temporal_metrics,
+create_multi_year_stack).
+
+Usage:
+    catalog = SceneCatalog('s2_archive.sqlite')
+    catalog.add_geotiffs(glob.glob('archive/**/*.tif', recursive=True))
+    scenes = catalog.collection().filterBounds(palawan_bounds) \\
+        .filterDate('2024-01-01', '2024-06-01').filterCloud(20).records()
+    composite = create_seasonal_composite(catalog, 2024, 'dry', bounds=palawan_bounds)
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Acquisition date in file names such as S2_20240112_T51PTR.tif
+DATE_PATTERN = re.compile(r'(20\d{2})(\d{2})(\d{2})')
+
+
+class SceneQuery:
+    """
+    Chainable scene filter, evaluated when records() is called
+    
+    Mirrors ee.ImageCollection filtering: filterBounds, filterDate (end
+    exclusive) and filterCloud (CLOUDY_PIXEL_PERCENTAGE below a threshold).
+    """
+    
+    def __init__(self, catalog, bounds=None, start_date=None, end_date=None,
+                 cloud_threshold=None):
+        self.catalog = catalog
+        self.bounds = bounds
+        self.start_date = start_date
+        self.end_date = end_date
+        self.cloud_threshold = cloud_threshold
+    
+    def _with(self, **changes):
+        fields = dict(bounds=self.bounds, start_date=self.start_date, end_date=self.end_date,
+                      cloud_threshold=self.cloud_threshold)
+        fields.update(changes)
+        return SceneQuery(self.catalog, **fields)
+    
+    def filterBounds(self, bounds):
+        """Scenes whose footprint intersects [min_lon, min_lat, max_lon, max_lat]"""
+        
+        return self._with(bounds=bounds)
+    
+    def filterDate(self, start_date, end_date):
+        """Scenes acquired in [start_date, end_date)"""
+        
+        return self._with(start_date=start_date, end_date=end_date)
+    
+    def filterCloud(self, cloud_threshold):
+        """Scenes with cloud percentage below cloud_threshold"""
+        
+        return self._with(cloud_threshold=cloud_threshold)
+    
+    def records(self):
+        """Matching scene records sorted by date"""
+        
+        return self.catalog.query(self.start_date, self.end_date, self.cloud_threshold,
+                                  self.bounds)
+    
+    def paths(self):
+        """Paths of the matching scenes"""
+        
+        return [record['path'] for record in self.records()]
+    
+    def size(self):
+        """Number of matching scenes"""
+        
+        return len(self.records())
+
+
+class SceneCatalog:
+    """
+    Persistent scene catalog with footprint, date and cloud indexes
+    
+    Parameters:
+    -----------
+    path : str
+        SQLite database file (created if missing)
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS scenes ('
+            'id INTEGER PRIMARY KEY, path TEXT UNIQUE, date TEXT, cloud REAL, '
+            'min_lon REAL, min_lat REAL, max_lon REAL, max_lat REAL, properties TEXT);'
+            'CREATE INDEX IF NOT EXISTS scenes_date ON scenes (date, cloud);'
+            'CREATE INDEX IF NOT EXISTS scenes_cloud ON scenes (cloud);'
+            'CREATE INDEX IF NOT EXISTS scenes_no_footprint ON scenes (date) '
+            'WHERE min_lon IS NULL;'
+            'CREATE VIRTUAL TABLE IF NOT EXISTS footprints '
+            'USING rtree(id, min_lon, max_lon, min_lat, max_lat);'
+        )
+        self._db.commit()
+    
+    def add(self, records):
+        """
+        Add or replace scene records (matched by path)
+        
+        Parameters:
+        -----------
+        records : list of dict
+            'path', 'date' ('YYYY-MM-DD'), 'cloud' and optionally 'bounds'
+            ([min_lon, min_lat, max_lon, max_lat]); other keys are kept as
+            properties
+        
+        Returns:
+        --------
+        int : Number of records added
+        """
+        
+        count = 0
+        with self._lock:
+            for record in records:
+                bounds = record.get('bounds') or [None] * 4
+                properties = {key: value for key, value in record.items()
+                              if key not in ['path', 'date', 'cloud', 'bounds']}
+                
+                old = self._db.execute('SELECT id FROM scenes WHERE path = ?',
+                                       (record['path'],)).fetchone()
+                if old is not None:
+                    self._db.execute('DELETE FROM footprints WHERE id = ?', old)
+                    self._db.execute('DELETE FROM scenes WHERE id = ?', old)
+                
+                cursor = self._db.execute(
+                    'INSERT INTO scenes (path, date, cloud, min_lon, min_lat, max_lon, max_lat, '
+                    'properties) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (record['path'], record['date'], record.get('cloud'), *bounds,
+                     json.dumps(properties, default=str))
+                )
+                if record.get('bounds'):
+                    self._db.execute(
+                        'INSERT INTO footprints VALUES (?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, bounds[0], bounds[2], bounds[1], bounds[3])
+                    )
+                count += 1
+            self._db.commit()
+        
+        return count
+    
+    def add_geotiffs(self, paths, cloud=None):
+        """
+        Catalog GeoTIFF scenes, reading footprints from the files
+        
+        The date comes from a 'date' tag or the file name (YYYYMMDD), the
+        cloud percentage from a CLOUDY_PIXEL_PERCENTAGE tag or cloud
+        ({path: percentage}). Files already in the catalog are skipped.
+        
+        Returns:
+        --------
+        int : Number of scenes added
+        """
+        
+        import rasterio
+        from rasterio.warp import transform_bounds
+        
+        known = {row[0] for row in self._db.execute('SELECT path FROM scenes')}
+        cloud = cloud or {}
+        
+        records = []
+        for path in paths:
+            if path in known:
+                continue
+            with rasterio.open(path) as src:
+                tags = src.tags()
+                bounds = list(transform_bounds(src.crs, 'EPSG:4326', *src.bounds))
+            
+            date = tags.get('date')
+            if date is None:
+                match = DATE_PATTERN.search(os.path.basename(path))
+                if match is None:
+                    print(f'Skipping {path}: no acquisition date')
+                    continue
+                date = '-'.join(match.groups())
+            
+            value = tags.get('CLOUDY_PIXEL_PERCENTAGE', cloud.get(path))
+            records.append({
+                'path': path,
+                'date': date[:10],
+                'cloud': float(value) if value is not None else None,
+                'bounds': bounds
+            })
+        
+        added = self.add(records)
+        print(f'Cataloged {added} new scenes ({len(self)} in the catalog)')
+        return added
+    
+    def query(self, start_date=None, end_date=None, cloud_threshold=None, bounds=None):
+        """
+        Scene records matching all given filters
+        
+        Same semantics as composite_local.filter_scenes: end date exclusive,
+        cloud strictly below the threshold, footprints intersecting bounds
+        (scenes without a footprint always match the bounds filter).
+        
+        Returns:
+        --------
+        list of dict : Records sorted by date
+        """
+        
+        conditions, values = [], []
+        if start_date is not None:
+            conditions.append('s.date >= ?')
+            values.append(start_date)
+        if end_date is not None:
+            conditions.append('s.date < ?')
+            values.append(end_date)
+        if cloud_threshold is not None:
+            conditions.append('s.cloud < ?')
+            values.append(cloud_threshold)
+        
+        columns = 's.path, s.date, s.cloud, s.min_lon, s.min_lat, s.max_lon, s.max_lat, ' \
+            's.properties'
+        if bounds is None:
+            where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+            sql = f'SELECT {columns} FROM scenes s{where}'
+        else:
+            # Footprints from the R*Tree (boxes rounded outward to float32),
+            # then the exact test; scenes without a footprint always match
+            box = [bounds[2], bounds[0], bounds[3], bounds[1]]
+            spatial = ['f.min_lon <= ?', 'f.max_lon >= ?', 'f.min_lat <= ?', 'f.max_lat >= ?',
+                       's.min_lon <= ?', 's.max_lon >= ?', 's.min_lat <= ?', 's.max_lat >= ?']
+            sql = (f'SELECT {columns} FROM footprints f JOIN scenes s ON s.id = f.id '
+                   f'WHERE {" AND ".join(spatial + conditions)} '
+                   f'UNION ALL SELECT {columns} FROM scenes s '
+                   f'WHERE {" AND ".join(["s.min_lon IS NULL"] + conditions)}')
+            values = box + box + values + values
+        
+        with self._lock:
+            rows = self._db.execute(f'{sql} ORDER BY 2, 1', values).fetchall()
+        
+        records = []
+        for path, date, cloud, min_lon, min_lat, max_lon, max_lat, properties in rows:
+            record = json.loads(properties) if properties != '{}' else {}
+            record.update(path=path, date=date, cloud=cloud)
+            if min_lon is not None:
+                record['bounds'] = [min_lon, min_lat, max_lon, max_lat]
+            records.append(record)
+        
+        return records
+    
+    def collection(self):
+        """Unfiltered SceneQuery, e.g. catalog.collection().filterDate(...)"""
+        
+        return SceneQuery(self)
+    
+    def remove_missing(self):
+        """
+        Drop records whose files no longer exist
+        
+        Returns:
+        --------
+        int : Number of removed records
+        """
+        
+        with self._lock:
+            missing = [(scene_id,) for scene_id, path in
+                       self._db.execute('SELECT id, path FROM scenes')
+                       if not os.path.exists(path)]
+            self._db.executemany('DELETE FROM footprints WHERE id = ?', missing)
+            self._db.executemany('DELETE FROM scenes WHERE id = ?', missing)
+            self._db.commit()
+        
+        return len(missing)
+    
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM scenes').fetchone()[0]
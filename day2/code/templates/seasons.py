@@ -0,0 +1,23 @@
+"""
+Season Definitions
+Dry and wet season date ranges without Earth Engine
+
+Used by temporal_composite_template.py (Earth Engine) and composite_local.py,
+which must import without the earthengine-api package.
+"""
+
+# Seasonal date ranges (month-day, end exclusive as in filterDate)
+SEASONS = {
+    'dry': ('01-01', '05-31'),  # Jan-May
+    'wet': ('06-01', '11-30')   # Jun-Nov
+}
+
+
+def season_date_range(year, season):
+    """Start and end dates of a season ('dry' or 'wet') in a given year"""
+    
+    if season not in SEASONS:
+        raise ValueError("Season must be 'dry' or 'wet'")
+    
+    start, end = SEASONS[season]
+    return f'{year}-{start}', f'{year}-{end}'
@@ -5,9 +5,112 @@ Multi-temporal Sentinel-2 compositing for land cover classification
 Usage: Copy and adapt these functions for your Session 2 notebook
 """
 
+import math
+
 import ee
 
-def create_seasonal_composite(aoi, year, season='dry', cloud_threshold=20):
+from cloud_mask import REFLECTANCE_OFFSET, mask_image, set_scale_metadata, to_reflectance
+from harmonic_local import harmonic_band_names
+from seasons import season_date_range
+
+
+def mask_clouds(image, method='QA60', reflectance=True):
+    """
+    Mask clouds (QA60 bits 10 and 11, or SCL classes) and scale to reflectance
+    
+    See cloud_mask.py for the shared masking kernel (one bitwiseAnd / remap).
+    With reflectance=False the scene keeps its uint16 digital numbers.
+    """
+    
+    return mask_image(image, method, reflectance)
+
+
+def load_collection(aoi, start_date, end_date, cloud_threshold=20):
+    """
+    Sentinel-2 scenes filtered by bounds, date and cloud percentage (unmasked)
+    
+    Returns:
+    --------
+    ee.ImageCollection
+    """
+    
+    return ee.ImageCollection('COPERNICUS/S2_SR') \
+        .filterBounds(aoi) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_threshold))
+
+
+def load_masked_collection(aoi, start_date, end_date, cloud_threshold=20, mask_method='QA60',
+                           reflectance=True):
+    """
+    Filtered, cloud-masked Sentinel-2 collection for a date range
+    
+    mask_method is 'QA60' (cloud and cirrus bits) or 'SCL' (scene
+    classification). reflectance=False keeps uint16 DN (reflectance * 10000),
+    a quarter of the float64 size; scale later with to_reflectance.
+    
+    Returns:
+    --------
+    ee.ImageCollection : Masked scenes (reflectance 0-1, or DN)
+    """
+    
+    collection = load_collection(aoi, start_date, end_date, cloud_threshold)
+    
+    return collection.map(lambda image: mask_clouds(image, mask_method, reflectance))
+
+
+def create_seasonal_composites(aoi, windows, cloud_threshold=20, reflectance=True):
+    """
+    Create several seasonal composites from one shared collection
+    
+    The collection is filtered and cloud-masked once over the union of all
+    date ranges and then partitioned by date, so every composite hangs off
+    the same expression graph instead of repeating the filter and the mask.
+    Masking is per image, so this matches masking each window separately;
+    system:time_start is copied onto the masked scenes for the date split.
+    
+    Parameters:
+    -----------
+    aoi : ee.Geometry
+        Area of interest
+    windows : list
+        (year, season) pairs, e.g. [(2024, 'dry'), (2024, 'wet')]
+    cloud_threshold : int
+        Maximum cloud percentage (default: 20)
+    reflectance : bool
+        True: reflectance (0-1). False: uint16 DN composites carrying
+        scale_factor / add_offset properties, scaled only when needed
+    
+    Returns:
+    --------
+    dict : {(year, season): ee.Image} seasonal median composites
+    """
+    
+    date_ranges = [season_date_range(year, season) for year, season in windows]
+    
+    # Filter and mask once over the union date range
+    collection = load_collection(
+        aoi,
+        min(start for start, _ in date_ranges),
+        max(end for _, end in date_ranges),
+        cloud_threshold
+    )
+    masked = collection.map(lambda image: ee.Image(
+        mask_clouds(image, 'QA60', reflectance).copyProperties(image, ['system:time_start'])
+    ))
+    
+    composites = {}
+    for window, (start_date, end_date) in zip(windows, date_ranges):
+        composite = masked.filterDate(start_date, end_date).median().clip(aoi)
+        if not reflectance:
+            # Medians of an even count can end in .5 DN (5e-5 reflectance)
+            composite = set_scale_metadata(composite.round().toUint16())
+        composites[tuple(window)] = composite
+    
+    return composites
+
+
+def create_seasonal_composite(aoi, year, season='dry', cloud_threshold=20, reflectance=True):
     """
     Create seasonal Sentinel-2 composite
     
@@ -21,57 +124,96 @@ def create_seasonal_composite(aoi, year, season='dry', cloud_threshold=20):
         'dry' (Jan-May) or 'wet' (Jun-Nov)
     cloud_threshold : int
         Maximum cloud percentage (default: 20)
+    reflectance : bool
+        False keeps uint16 DN (see create_seasonal_composites)
     
     Returns:
     --------
     ee.Image : Seasonal median composite
     """
     
-    # Define seasonal date ranges
-    if season == 'dry':
-        start_date = f'{year}-01-01'
-        end_date = f'{year}-05-31'
-    elif season == 'wet':
-        start_date = f'{year}-06-01'
-        end_date = f'{year}-11-30'
-    else:
-        raise ValueError("Season must be 'dry' or 'wet'")
-    
-    # Load and filter Sentinel-2
-    collection = ee.ImageCollection('COPERNICUS/S2_SR') \
-        .filterBounds(aoi) \
-        .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_threshold))
+    return create_seasonal_composites(aoi, [(year, season)], cloud_threshold,
+                                      reflectance)[(year, season)]
+
+
+def export_seasonal_composite(aoi, year, season, cache, cloud_threshold=20,
+                              bands=['B2', 'B3', 'B4', 'B8', 'B11', 'B12'],
+                              folder='EO_Training', download_dir=None, wait_timeout=600,
+                              scale=10, reflectance=True):
+    """
+    Local GeoTIFF of a seasonal composite, exported once and then cached
     
-    # Apply cloud masking
-    def mask_clouds(image):
-        qa = image.select('QA60')
-        cloud_mask = qa.bitwiseAnd(1 << 10).eq(0).And(
-                     qa.bitwiseAnd(1 << 11).eq(0))
-        return image.updateMask(cloud_mask).divide(10000)
+    On a cache hit the stored raster is returned immediately. On a miss the
+    composite is exported to Google Drive as tiles (export_manager.py),
+    read from the local copy of the Drive folder once every tile is there,
+    stitched into a COG and stored in the cache (composite_cache.py). If a
+    tile fails or never arrives, an error is raised and nothing is cached.
     
-    # Create composite
-    composite = collection.map(mask_clouds).median()
+    Parameters:
+    -----------
+    aoi : ee.Geometry
+        Area of interest (its serialization is part of the cache key)
+    year, season, cloud_threshold
+        As in create_seasonal_composite
+    cache : CompositeCache
+        On-disk composite cache
+    bands : list
+        Bands to export
+    folder : str
+        Google Drive folder the tiles are exported to
+    download_dir : str
+        Local folder where that Drive folder is synced or mounted
+        (default: drive_folder_path(folder), the Colab drive.mount location)
+    wait_timeout : float
+        Seconds to wait for finished tiles to appear in download_dir
+    scale : int
+        Export pixel size in meters
+    reflectance : bool
+        False exports uint16 DN (half the size of float32) with the
+        reflectance scale and offset written to the GeoTIFF band metadata
     
-    return composite.clip(aoi)
+    Returns:
+    --------
+    str : Path of the cached GeoTIFF
+    """
+    
+    from cloud_mask import REFLECTANCE_SCALE
+    from export_manager import drive_folder_path, export_tiled, stitch_tiles_to_cog
+    
+    def export(output_path):
+        composite = create_seasonal_composite(aoi, year, season, cloud_threshold,
+                                              reflectance=reflectance).select(bands)
+        manager = export_tiled(composite, aoi, f'composite_{season}_{year}', folder,
+                               download_dir or drive_folder_path(folder), scale=scale)
+        # Raises on failed or missing tiles, so no mosaic with holes is cached
+        paths = manager.tile_paths(wait_timeout)
+        if reflectance:
+            return stitch_tiles_to_cog(paths, output_path)
+        return stitch_tiles_to_cog(paths, output_path,
+                                   scales=[REFLECTANCE_SCALE] * len(bands),
+                                   offsets=[REFLECTANCE_OFFSET] * len(bands))
+    
+    return cache.get_or_create(export, aoi, year, season, cloud_threshold, 'QA60',
+                               bands=bands, scale=scale, reflectance=reflectance)
 
 
 def create_phenology_composites(aoi, year):
     """
     Create dry and wet season composites for phenological analysis
     
+    Both seasons share one filtered and cloud-masked collection.
+    
     Returns:
     --------
     dict : {'dry': ee.Image, 'wet': ee.Image}
     """
     
-    dry = create_seasonal_composite(aoi, year, season='dry')
-    wet = create_seasonal_composite(aoi, year, season='wet')
+    composites = create_seasonal_composites(aoi, [(year, 'dry'), (year, 'wet')])
     
-    return {'dry': dry, 'wet': wet}
+    return {'dry': composites[(year, 'dry')], 'wet': composites[(year, 'wet')]}
 
 
-def add_seasonal_features(dry_composite, wet_composite):
+def add_seasonal_features(dry_composite, wet_composite, reflectance=True):
     """
     Derive features from seasonal composites
     
@@ -81,12 +223,24 @@ def add_seasonal_features(dry_composite, wet_composite):
         Dry season composite
     wet_composite : ee.Image
         Wet season composite
+    reflectance : bool
+        False for uint16 DN composites (create_seasonal_composite(...,
+        reflectance=False)); the spectral bands stay DN and the indices are the
+        same as from reflectance
     
     Returns:
     --------
     ee.Image with seasonal features
     """
     
+    spectral_bands = dry_composite.select(['B2', 'B3', 'B4', 'B8', 'B11', 'B12'])
+    
+    # Normalized differences do not depend on the scale factor; a nonzero
+    # offset has to be applied first
+    if not reflectance and REFLECTANCE_OFFSET:
+        dry_composite = to_reflectance(dry_composite)
+        wet_composite = to_reflectance(wet_composite)
+    
     # NDVI for both seasons
     def calculate_ndvi(image):
         return image.normalizedDifference(['B8', 'B4']).rename('NDVI')
@@ -109,7 +263,7 @@ def add_seasonal_features(dry_composite, wet_composite):
     
     # Stack all seasonal features
     seasonal_features = ee.Image.cat([
-        dry_composite.select(['B2', 'B3', 'B4', 'B8', 'B11', 'B12']),
+        spectral_bands,
         ndvi_dry,
         ndwi_dry,
         ndvi_wet,
@@ -140,10 +294,13 @@ def create_multi_year_stack(aoi, years, season='dry'):
     ee.Image with bands from multiple years
     """
     
+    # One shared collection for all years
+    seasonal = create_seasonal_composites(aoi, [(year, season) for year in years])
+    
     composites = []
     
     for year in years:
-        composite = create_seasonal_composite(aoi, year, season=season)
+        composite = seasonal[(year, season)]
         
         # Rename bands to include year
         renamed = composite.select(
@@ -160,7 +317,8 @@ def create_multi_year_stack(aoi, years, season='dry'):
     return multi_year_stack
 
 
-def calculate_temporal_metrics(aoi, year, months=12):
+def calculate_temporal_metrics(aoi, year, months=12, bands=['B4', 'B8', 'B11'],
+                               percentiles=[25, 75], reflectance=True):
     """
     Calculate temporal metrics from monthly composites
     
@@ -170,42 +328,43 @@ def calculate_temporal_metrics(aoi, year, months=12):
     - Min/Max: Range
     - Percentiles: 25th, 75th
     
+    All metrics come from one combined reducer, so the masked collection
+    is read once instead of once per statistic.
+    
+    With reflectance=False the reduction runs on uint16 DN and the metrics are
+    in DN (multiply by scale_factor; the std needs no offset).
+    
     Returns:
     --------
     ee.Image with temporal metrics
     """
     
-    # Create monthly composites
     start_date = f'{year}-01-01'
     end_date = f'{year}-12-31'
     
-    collection = ee.ImageCollection('COPERNICUS/S2_SR') \
-        .filterBounds(aoi) \
-        .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 30)) \
-        .select(['B4', 'B8', 'B11'])
-    
-    # Apply cloud masking
-    def mask_clouds(image):
-        qa = image.select('QA60')
-        mask = qa.bitwiseAnd(1 << 10).eq(0).And(qa.bitwiseAnd(1 << 11).eq(0))
-        return image.updateMask(mask).divide(10000)
-    
-    masked = collection.map(mask_clouds)
-    
-    # Calculate metrics
-    temporal_mean = masked.mean().rename(['B4_mean', 'B8_mean', 'B11_mean'])
-    temporal_std = masked.reduce(ee.Reducer.stdDev()).rename(['B4_std', 'B8_std', 'B11_std'])
-    temporal_min = masked.min().rename(['B4_min', 'B8_min', 'B11_min'])
-    temporal_max = masked.max().rename(['B4_max', 'B8_max', 'B11_max'])
-    
-    # Stack metrics
-    temporal_metrics = ee.Image.cat([
-        temporal_mean,
-        temporal_std,
-        temporal_min,
-        temporal_max
-    ])
+    # Mask before selecting bands (mask_clouds needs QA60)
+    masked = load_masked_collection(aoi, start_date, end_date, cloud_threshold=30,
+                                    reflectance=reflectance).select(bands)
+    
+    # One pass: mean, stdDev, min/max and percentiles share their inputs
+    reducer = ee.Reducer.mean() \
+        .combine(ee.Reducer.stdDev(), sharedInputs=True) \
+        .combine(ee.Reducer.minMax(), sharedInputs=True) \
+        .combine(ee.Reducer.percentile(percentiles), sharedInputs=True)
+    
+    metrics = masked.reduce(reducer)
+    
+    # Same band order and names as before: all means, all stds, ...
+    outputs = [('mean', 'mean'), ('stdDev', 'std'), ('min', 'min'), ('max', 'max')]
+    outputs += [(f'p{p}', f'p{p}') for p in percentiles]
+    
+    temporal_metrics = metrics.select(
+        [f'{band}_{output}' for output, _ in outputs for band in bands],
+        [f'{band}_{name}' for _, name in outputs for band in bands]
+    )
+    
+    if not reflectance:
+        temporal_metrics = set_scale_metadata(temporal_metrics)
     
     return temporal_metrics.clip(aoi)
 
@@ -257,13 +416,13 @@ TEMPORAL COMPOSITE BEST PRACTICES:
    - Wet season NDVI: Agricultural phenology
    - NDVI difference: Seasonal crops vs perennial
    - NDWI wet season: Maximum water extent
-   
+
 4. WHEN TO USE MULTI-TEMPORAL:
    ✓ Separating crops from natural vegetation
    ✓ Identifying seasonal wetlands
    ✓ Detecting irrigated agriculture
    ✓ Monitoring phenological cycles
-   
+
 5. COMPUTATIONAL OPTIMIZATION:
    - Create composites first, then derive indices
    - Use .aside(ee.List()) to track progress
@@ -291,45 +450,94 @@ TEMPORAL COMPOSITE BEST PRACTICES:
 """
 
 # Advanced: Harmonic regression for time series
-def fit_harmonic_trend(aoi, start_year, end_year, band='NDVI'):
+def add_harmonic_bands(image, reference_date, harmonics=1):
+    """
+    Add constant, time (years since reference_date) and harmonic bands
+    
+    Parameters:
+    -----------
+    image : ee.Image
+        Image with a system:time_start property
+    reference_date : str
+        Date where t = 0
+    harmonics : int
+        Number of harmonics (1 = annual cycle, 2 adds the semi-annual cycle)
+    
+    Returns:
+    --------
+    ee.Image with the bands from harmonic_band_names added
+    """
+    
+    date = ee.Date(image.get('system:time_start'))
+    years = date.difference(ee.Date(reference_date), 'year')
+    
+    # Time in years
+    t = ee.Image(years).rename('t').float()
+    
+    bands = [ee.Image.constant(1).rename('constant'), t]
+    
+    # Harmonic terms
+    for k in range(1, harmonics + 1):
+        angle = t.multiply(2 * math.pi * k)
+        bands += [angle.cos().rename(f'cos{k}'), angle.sin().rename(f'sin{k}')]
+    
+    return image.addBands(bands)
+
+
+def fit_harmonic_trend(aoi, start_year, end_year, band='NDVI', harmonics=1):
     """
     Fit harmonic regression to capture seasonal and trend components
     Useful for detecting gradual changes
     
+    Model: band = c + b*t + sum_k (a_k*cos(2*pi*k*t) + b_k*sin(2*pi*k*t))
+    
+    Parameters:
+    -----------
+    aoi : ee.Geometry
+        Area of interest
+    start_year, end_year : int
+        Period to fit (t = 0 at the start of start_year)
+    band : str
+        Dependent band ('NDVI' or a Sentinel-2 band)
+    harmonics : int
+        Number of harmonics
+    
+    Returns:
+    --------
+    ee.Image : Coefficient bands (constant, t, cos1, sin1, ...), rmse and
+    amplitude1/phase1 ... per harmonic (see harmonic_local.py for the
+    local equivalent)
+    
     WARNING: Computationally intensive for large areas
     """
     
-    # Create image collection
     start_date = f'{start_year}-01-01'
     end_date = f'{end_year}-12-31'
     
-    # Load and process Sentinel-2
-    def add_time_bands(image):
-        date = ee.Date(image.get('system:time_start'))
-        years = date.difference(ee.Date(start_date), 'year')
-        
-        # Time in years
-        t = ee.Image(years).rename('t').float()
-        
-        # Harmonic terms
-        omega = 2.0 * 3.14159
-        cos = t.multiply(omega).cos().rename('cos')
-        sin = t.multiply(omega).sin().rename('sin')
-        
-        return image.addBands([t, cos, sin])
+    # The time bands need system:time_start, so it is copied from the raw
+    # scene onto the masked one (image arithmetic drops properties); NDVI
+    # is added as a band so the property stays
+    def prepare(image):
+        masked = ee.Image(mask_clouds(image).copyProperties(image, ['system:time_start']))
+        masked = masked.addBands(masked.normalizedDifference(['B8', 'B4']).rename('NDVI'))
+        return add_harmonic_bands(masked, start_date, harmonics)
     
-    collection = ee.ImageCollection('COPERNICUS/S2_SR') \
-        .filterBounds(aoi) \
-        .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 30)) \
-        .map(lambda img: img.normalizedDifference(['B8', 'B4']).rename('NDVI')) \
-        .map(add_time_bands)
+    collection = load_collection(aoi, start_date, end_date, cloud_threshold=30).map(prepare)
     
     # Fit linear regression with harmonic terms
-    independents = ee.List(['constant', 't', 'cos', 'sin'])
-    dependent = ee.String('NDVI')
+    independents = harmonic_band_names(harmonics)
+    
+    regression = collection.select(independents + [band]) \
+        .reduce(ee.Reducer.linearRegression(len(independents), 1))
+    
+    coefficients = regression.select('coefficients').arrayProject([0]) \
+        .arrayFlatten([independents])
+    rmse = regression.select('residuals').arrayFlatten([['rmse']])
     
-    trend = collection.select(independents.add(dependent)) \
-        .reduce(ee.Reducer.linearRegression(independents.length(), 1))
+    # Amplitude and phase of each harmonic
+    bands = [coefficients, rmse]
+    for k in range(1, harmonics + 1):
+        cos, sin = coefficients.select(f'cos{k}'), coefficients.select(f'sin{k}')
+        bands += [cos.hypot(sin).rename(f'amplitude{k}'), sin.atan2(cos).rename(f'phase{k}')]
     
-    return trend.clip(aoi)
+    return ee.Image.cat(bands).clip(aoi)
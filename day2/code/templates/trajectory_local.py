@@ -0,0 +1,353 @@
+"""
+Multi-Epoch Trajectory Change Detection (NumPy / rasterio)
+Yearly land cover trajectories that extend incrementally as new years arrive
+
+Comparing every pair of years scales quadratically with the number of
+years. Here each year is folded into a small per-pixel state in a single
+streaming pass: first and latest class, number of class changes, first
+forest-loss year and the per-step transition areas. When the next year's
+classification arrives, only that year is read and the stored state is
+extended; earlier years are never reprocessed.
+
+State lives in a directory of memory-mapped .npy files, and every update
+runs in row blocks, so memory stays bounded for province-scale rasters.
+An update writes a new generation of the state files and commits it by
+replacing meta.json last, so a crash never leaves a year half applied.
+
+Usage:
+    state = TrajectoryState.create('palawan_trajectories', shape=(rows, cols))
+    for year in range(2017, 2025):
+        state.update(year, f'classification_{year}.tif')
+    state.first_loss_year        # year of first forest loss (0 = none)
+    state.transition_table(class_names)
+"""
+
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from change_codes import PALAWAN_CLASS_IDS
+
+# Class index for "no valid observation yet"
+NO_CLASS = 255
+
+
+class TrajectoryState:
+    """
+    Persistent per-pixel trajectory state for a sequence of yearly maps
+    
+    Attributes (memory-mapped arrays):
+    ----------------------------------
+    first_class : uint8 class index of the first valid observation
+    last_class : uint8 class index of the latest valid observation
+    n_changes : uint16 number of class changes between valid observations
+    first_loss_year : int16 year of the first forest -> non-forest change
+    """
+    
+    STATE_ARRAYS = {
+        'first_class': np.uint8,
+        'last_class': np.uint8,
+        'n_changes': np.uint16,
+        'first_loss_year': np.int16
+    }
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        
+        self._open_arrays()
+        
+        self.class_ids = self.meta['class_ids']
+        self.years = self.meta['years']
+        
+        n_classes = len(self.class_ids)
+        self._index = np.full(max(self.class_ids) + 1, NO_CLASS, dtype=np.uint8)
+        self._index[self.class_ids] = np.arange(n_classes)
+        self._forest = np.zeros(NO_CLASS + 1, dtype=bool)
+        self._forest[[self.class_ids.index(c) for c in self.meta['forest_classes']]] = True
+    
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+    
+    def _state_file(self, name, generation=None):
+        """State array or transitions file of a generation (default: committed)"""
+        
+        if generation is None:
+            generation = self.meta['generation']
+        return self._file(f'{name}.{generation}')
+    
+    def _open_arrays(self):
+        for name in self.STATE_ARRAYS:
+            setattr(self, name, np.load(self._state_file(name), mmap_mode='r+'))
+    
+    @staticmethod
+    def _write_meta(path, meta):
+        """Replace meta.json atomically (the commit point of an update)"""
+        
+        temp = os.path.join(path, 'meta.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(temp, os.path.join(path, 'meta.json'))
+    
+    @classmethod
+    def create(cls, path, shape, class_ids=PALAWAN_CLASS_IDS, forest_classes=[1, 2]):
+        """
+        Create an empty trajectory state on disk
+        
+        Parameters:
+        -----------
+        path : str
+            State directory (created if missing)
+        shape : tuple
+            (rows, cols) of the classification rasters
+        class_ids : list
+            Class IDs in the classification scheme
+        forest_classes : list
+            Class IDs counted as forest for first-loss detection
+        
+        Returns:
+        --------
+        TrajectoryState
+        """
+        
+        os.makedirs(path, exist_ok=True)
+        
+        for name, dtype in cls.STATE_ARRAYS.items():
+            fill = NO_CLASS if name in ['first_class', 'last_class'] else 0
+            array = np.lib.format.open_memmap(os.path.join(path, f'{name}.0.npy'), mode='w+',
+                                              dtype=dtype, shape=tuple(shape))
+            array[:] = fill
+            array.flush()
+        
+        n_classes = len(class_ids)
+        np.save(os.path.join(path, 'transitions.0.npy'), np.zeros((0, n_classes, n_classes)))
+        
+        meta = {
+            'shape': list(shape),
+            'class_ids': list(class_ids),
+            'forest_classes': list(forest_classes),
+            'years': [],
+            'generation': 0
+        }
+        cls._write_meta(path, meta)
+        
+        return cls(path)
+    
+    @classmethod
+    def open(cls, path):
+        """Open an existing trajectory state"""
+        
+        return cls(path)
+    
+    def _read_block(self, source, row_off, n_rows):
+        """Rows of a classification as class indices (NO_CLASS where invalid)"""
+        
+        if isinstance(source, str):
+            import rasterio
+            from rasterio.windows import Window
+            
+            with rasterio.open(source) as src:
+                block = src.read(1, masked=True,
+                                 window=Window(0, row_off, src.width, n_rows))
+        else:
+            block = np.ma.asarray(source)[row_off:row_off + n_rows]
+        
+        values = block.filled(0).astype(np.int64)
+        in_range = (values >= 0) & (values < len(self._index))
+        index = np.full(values.shape, NO_CLASS, dtype=np.uint8)
+        index[in_range] = self._index[values[in_range]]
+        index[np.ma.getmaskarray(block)] = NO_CLASS
+        
+        return index
+    
+    def update(self, year, classification, block_rows=1024):
+        """
+        Extend the state with one new year (O(pixels of that year only))
+        
+        The updated arrays go to the next generation of state files, and
+        the year counts only once meta.json referencing them is replaced.
+        After a crash the previous generation is still the committed
+        state, so rerunning the same year does not count it twice.
+        
+        Parameters:
+        -----------
+        year : int
+            Year of the classification (must be later than stored years)
+        classification : str or numpy.ndarray
+            Classified GeoTIFF path or array for that year
+        block_rows : int
+            Rows processed per block
+        
+        Returns:
+        --------
+        numpy.ndarray : (n, n) transition pixel counts from the previous
+        valid observation to this year
+        """
+        
+        if self.years and year <= self.years[-1]:
+            raise ValueError(f'Year {year} is not after the latest stored year {self.years[-1]}')
+        
+        n_classes = len(self.class_ids)
+        rows = self.meta['shape'][0]
+        step = np.zeros(n_classes * n_classes, dtype=np.int64)
+        
+        # Work on copies of the committed state (the next generation)
+        generation = self.meta['generation'] + 1
+        for name in self.STATE_ARRAYS:
+            shutil.copyfile(self._state_file(name), self._state_file(name, generation))
+            setattr(self, name, np.load(self._state_file(name, generation), mmap_mode='r+'))
+        
+        # Per-year class index raster (the pixel trajectories themselves)
+        year_classes = np.lib.format.open_memmap(self._file(f'classes_{year}'), mode='w+',
+                                                 dtype=np.uint8, shape=tuple(self.meta['shape']))
+        
+        for row_off in range(0, rows, block_rows):
+            rows_slice = slice(row_off, min(row_off + block_rows, rows))
+            current = self._read_block(classification, row_off, rows_slice.stop - row_off)
+            year_classes[rows_slice] = current
+            
+            previous = self.last_class[rows_slice]
+            valid = current != NO_CLASS
+            seen = previous != NO_CLASS
+            both = valid & seen
+            
+            step += np.bincount(previous[both].astype(np.int64) * n_classes + current[both],
+                                minlength=n_classes * n_classes)
+            
+            changed = both & (previous != current)
+            self.n_changes[rows_slice] += changed
+            
+            loss = both & self._forest[previous] & ~self._forest[current]
+            first_loss = self.first_loss_year[rows_slice]
+            first_loss[loss & (first_loss == 0)] = year
+            
+            new = valid & ~seen
+            self.first_class[rows_slice][new] = current[new]
+            self.last_class[rows_slice][valid] = current[valid]
+        
+        year_classes.flush()
+        for name in self.STATE_ARRAYS:
+            getattr(self, name).flush()
+        
+        step = step.reshape(n_classes, n_classes)
+        transitions = np.load(self._state_file('transitions'))
+        np.save(self._state_file('transitions', generation),
+                np.concatenate([transitions, step[np.newaxis]]))
+        
+        # Commit: meta.json now points at the new generation
+        self._write_meta(self.path, dict(self.meta, years=self.years + [year], generation=generation))
+        self.years.append(year)
+        self.meta['generation'] = generation
+        
+        # Drop older generations (and leftovers of interrupted updates)
+        current = {self._state_file(name) for name in list(self.STATE_ARRAYS) + ['transitions']}
+        for name in list(self.STATE_ARRAYS) + ['transitions']:
+            for stale in glob.glob(self._file(f'{name}.*')):
+                if stale not in current:
+                    os.remove(stale)
+        
+        return step
+    
+    def trajectories(self, rows=slice(None), cols=slice(None)):
+        """
+        Class ID sequence per pixel for a block, without loading other rows
+        
+        Returns:
+        --------
+        numpy.ma.MaskedArray : (years, rows, cols) class IDs, masked where
+        a year has no valid observation
+        """
+        
+        class_ids = np.array(self.class_ids + [0])
+        stack = []
+        for year in self.years:
+            index = np.load(self._file(f'classes_{year}'), mmap_mode='r')[rows, cols]
+            lookup = np.where(index == NO_CLASS, len(self.class_ids), index)
+            stack.append(np.ma.array(class_ids[lookup], mask=index == NO_CLASS))
+        
+        return np.ma.stack(stack)
+    
+    def transition_table(self, class_names, pixel_area=100, cumulative=True):
+        """
+        Transition areas between consecutive valid observations
+        
+        Parameters:
+        -----------
+        class_names : dict
+            Mapping of class IDs to names
+        pixel_area : float
+            Pixel area in square meters (100 for 10 m pixels)
+        cumulative : bool
+            Sum over all years (True) or only the latest step (False)
+        
+        Returns:
+        --------
+        pandas.DataFrame : From-to areas in hectares
+        """
+        
+        transitions = np.load(self._state_file('transitions'))
+        counts = transitions.sum(axis=0) if cumulative else transitions[-1]
+        areas = counts * pixel_area / 10000
+        
+        table = {}
+        for from_id, from_name in class_names.items():
+            i = self.class_ids.index(from_id)
+            table[from_name] = {
+                to_name: round(float(areas[i, self.class_ids.index(to_id)]), 2)
+                for to_id, to_name in class_names.items()
+            }
+        
+        df = pd.DataFrame(table).T
+        df.index.name = 'From \\ To'
+        
+        return df
+
+
+def build_trajectories(path, classifications, class_ids=PALAWAN_CLASS_IDS, forest_classes=[1, 2],
+                       block_rows=1024):
+    """
+    Create or extend a trajectory state from yearly classifications
+    
+    Years already stored in the state are skipped, so calling this again
+    with one more year only processes that year.
+    
+    Parameters:
+    -----------
+    path : str
+        State directory
+    classifications : dict
+        {year: GeoTIFF path or array}
+    class_ids, forest_classes : list
+        Classification scheme (used only when the state is created)
+    block_rows : int
+        Rows processed per block
+    
+    Returns:
+    --------
+    TrajectoryState
+    """
+    
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        state = TrajectoryState.open(path)
+    else:
+        first = classifications[min(classifications)]
+        if isinstance(first, str):
+            import rasterio
+            
+            with rasterio.open(first) as src:
+                shape = (src.height, src.width)
+        else:
+            shape = np.shape(first)
+        state = TrajectoryState.create(path, shape, class_ids, forest_classes)
+    
+    for year in sorted(classifications):
+        if state.years and year <= state.years[-1]:
+            continue
+        state.update(year, classifications[year], block_rows)
+    
+    return state